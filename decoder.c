@@ -42,31 +42,113 @@
 /* The list of loaded protocol decoders. */
 static GSList *pd_list = NULL;
 
+/* The loaded protocol decoders by ID, NULL until one is loaded. */
+static GHashTable *pd_index = NULL;
+
+/* The decoder metadata cache file, NULL if caching is disabled. */
+static char *cache_path = NULL;
+
+/*
+ * Whether srd_decoder_load_all() defers loading decoders until they are
+ * used, and the decoders it found but didn't load yet.
+ */
+static gboolean lazy_load = FALSE;
+static GSList *pd_pending = NULL;
+
+struct pending_decoder {
+	/* The search path the decoder was found in. */
+	char *path;
+	char *module_name;
+};
+
+/*
+ * The cache file's format. Entries written by a different library version
+ * or in a different format are discarded as a whole.
+ */
+#define CACHE_GROUP "libsigrokdecode"
+#define CACHE_VERSION SRD_PACKAGE_VERSION_STRING "/1"
+
+/* id, name, longname, desc, license, channels, optional channels,
+ * annotations, annotation rows, binary classes and options. */
+#define CACHE_METADATA_TYPE \
+	"(sssssa(sss)a(sss)aasa(ssat)aasa(smsmvav))"
+#define CACHE_METADATA_FORMAT \
+	"(sssss@a(sss)@a(sss)@aas@a(ssat)@aas@a(smsmvav))"
+
 /* srd.c */
 extern SRD_PRIV GSList *searchpaths;
 
 /* session.c */
 extern SRD_PRIV GSList *sessions;
-extern SRD_PRIV int max_session_id;
 
 /* module_sigrokdecode.c */
 extern SRD_PRIV PyObject *mod_sigrokdecode;
 
 /** @endcond */
 
-static gboolean srd_check_init(void)
+static void pending_load(const char *module_name);
+
+/* Find a loaded decoder by its ID, with the GIL held. */
+static struct srd_decoder *decoder_find_by_id(const char *id)
 {
-	if (max_session_id < 0) {
-		srd_err("Library is not initialized.");
-		return FALSE;
-	} else
-		return TRUE;
+	return pd_index ? g_hash_table_lookup(pd_index, id) : NULL;
+}
+
+/* Add a decoder to the list of loaded decoders, with the GIL held. */
+static void decoder_add(struct srd_decoder *dec)
+{
+	pd_list = g_slist_append(pd_list, dec);
+
+	if (!pd_index)
+		pd_index = g_hash_table_new(g_str_hash, g_str_equal);
+
+	/* If several decoders share an ID, the first one loaded is found. */
+	if (!g_hash_table_lookup(pd_index, dec->id))
+		g_hash_table_insert(pd_index, dec->id, dec);
+}
+
+/* Remove a decoder from the list of loaded decoders, with the GIL held. */
+static void decoder_remove(struct srd_decoder *dec)
+{
+	struct srd_decoder *other;
+	GSList *l;
+
+	pd_list = g_slist_remove(pd_list, dec);
+
+	if (g_hash_table_lookup(pd_index, dec->id) != dec)
+		return;
+
+	g_hash_table_remove(pd_index, dec->id);
+	for (l = pd_list; l; l = l->next) {
+		other = l->data;
+		if (!strcmp(other->id, dec->id)) {
+			g_hash_table_insert(pd_index, other->id, other);
+			break;
+		}
+	}
+}
+
+/* Find a loaded decoder by its module name, with the GIL held. */
+static struct srd_decoder *decoder_find_by_module(const char *module_name)
+{
+	GSList *l;
+	struct srd_decoder *dec;
+
+	for (l = pd_list; l; l = l->next) {
+		dec = l->data;
+		if (!strcmp(dec->module_name, module_name))
+			return dec;
+	}
+
+	return NULL;
 }
 
 /**
  * Returns the list of loaded protocol decoders.
  *
- * This is a GSList of pointers to struct srd_decoder items.
+ * This is a GSList of pointers to struct srd_decoder items. Decoders
+ * whose loading was deferred by srd_decoder_lazy_load_set() are loaded
+ * first.
  *
  * @return List of decoders, NULL if none are supported or loaded.
  *
@@ -74,12 +156,26 @@ static gboolean srd_check_init(void)
  */
 SRD_API const GSList *srd_decoder_list(void)
 {
+	PyGILState_STATE gstate;
+
+	if (pd_pending) {
+		/* All decoders are needed now. */
+		gstate = PyGILState_Ensure();
+		pending_load(NULL);
+		PyGILState_Release(gstate);
+	}
+
 	return pd_list;
 }
 
 /**
  * Get the decoder with the specified ID.
  *
+ * If the decoder's loading was deferred by srd_decoder_lazy_load_set(),
+ * it is loaded now. Only the module named after the ID is loaded for
+ * this, so a decoder whose module is named differently isn't found
+ * until it is loaded otherwise, e.g. by srd_decoder_list().
+ *
  * @param id The ID string of the decoder to return.
  *
  * @return The decoder with the specified ID, or NULL if not found.
@@ -88,16 +184,25 @@ SRD_API const GSList *srd_decoder_list(void)
  */
 SRD_API struct srd_decoder *srd_decoder_get_by_id(const char *id)
 {
-	GSList *l;
-	struct srd_decoder *dec;
+	struct srd_decoder *found;
+	PyGILState_STATE gstate;
 
-	for (l = pd_list; l; l = l->next) {
-		dec = l->data;
-		if (!strcmp(dec->id, id))
-			return dec;
+	if (!srd_check_init())
+		return NULL;
+
+	if (!id)
+		return NULL;
+
+	/* The list of decoders is protected by the GIL. */
+	gstate = PyGILState_Ensure();
+	/* A decoder lives in the module named after its ID. */
+	if (!(found = decoder_find_by_id(id)) && pd_pending) {
+		pending_load(id);
+		found = decoder_find_by_id(id);
 	}
+	PyGILState_Release(gstate);
 
-	return NULL;
+	return found;
 }
 
 static void channel_free(void *data)
@@ -158,6 +263,11 @@ static void decoder_free(struct srd_decoder *dec)
 	Py_XDECREF(dec->py_dec);
 	Py_XDECREF(dec->py_mod);
 
+	if (dec->binary_table)
+		g_ptr_array_free(dec->binary_table, TRUE);
+	if (dec->annotation_table)
+		g_ptr_array_free(dec->annotation_table, TRUE);
+
 	g_slist_free_full(dec->options, &decoder_option_free);
 	g_slist_free_full(dec->binary, (GDestroyNotify)&g_strfreev);
 	g_slist_free_full(dec->annotation_rows, &annotation_row_free);
@@ -170,6 +280,7 @@ static void decoder_free(struct srd_decoder *dec)
 	g_free(dec->longname);
 	g_free(dec->name);
 	g_free(dec->id);
+	g_free(dec->module_name);
 
 	g_free(dec);
 }
@@ -503,6 +614,21 @@ err_out:
 	return SRD_ERR_PYTHON;
 }
 
+/* Build an array of a decoder's annotation or binary classes, so they
+ * can be looked up by class number without walking the list.
+ */
+static GPtrArray *class_table_new(GSList *classes)
+{
+	GPtrArray *table;
+	GSList *l;
+
+	table = g_ptr_array_sized_new(g_slist_length(classes));
+	for (l = classes; l; l = l->next)
+		g_ptr_array_add(table, l->data);
+
+	return table;
+}
+
 /* Convert binary classes to GSList of char **.
  */
 static int get_binary_classes(struct srd_decoder *dec)
@@ -586,27 +712,40 @@ static int check_method(PyObject *py_dec, const char *mod_name,
 	return SRD_OK;
 }
 
-/**
- * Load a protocol decoder module into the embedded Python interpreter.
- *
- * @param module_name The module name to be loaded.
- *
- * @return SRD_OK upon success, a (negative) error code otherwise.
- *
- * @since 0.1.0
+/*
+ * Import a decoder's module, and measure how long that takes. This
+ * includes any module-level work, like building tables or importing
+ * further modules.
  */
-SRD_API int srd_decoder_load(const char *module_name)
+static PyObject *decoder_import_timed(const char *module_name,
+		uint64_t *import_time)
+{
+	PyObject *py_mod;
+	gint64 start;
+
+	start = g_get_monotonic_time();
+	py_mod = py_import_by_name(module_name);
+	*import_time = g_get_monotonic_time() - start;
+
+	if (py_mod)
+		srd_dbg("Imported protocol decoder '%s' in %" PRIu64 " us.",
+			module_name, *import_time);
+
+	return py_mod;
+}
+
+/* Load a decoder, with the GIL held. */
+static int decoder_load(const char *module_name)
 {
 	PyObject *py_basedec, *py_apiver;
 	struct srd_decoder *d;
 	long apiver;
 	int is_subclass;
 
-	if (!srd_check_init())
-		return SRD_ERR;
-
-	if (!module_name)
-		return SRD_ERR_ARG;
+	if (decoder_find_by_module(module_name)) {
+		/* Decoder was already loaded, possibly from the cache. */
+		return SRD_OK;
+	}
 
 	if (PyDict_GetItemString(PyImport_GetModuleDict(), module_name)) {
 		/* Module was already imported. */
@@ -616,8 +755,9 @@ SRD_API int srd_decoder_load(const char *module_name)
 	srd_dbg("Loading protocol decoder '%s'.", module_name);
 
 	d = g_malloc0(sizeof(struct srd_decoder));
+	d->module_name = g_strdup(module_name);
 
-	d->py_mod = py_import_by_name(module_name);
+	d->py_mod = decoder_import_timed(module_name, &d->import_time);
 	if (!d->py_mod)
 		goto except_out;
 
@@ -704,8 +844,12 @@ SRD_API int srd_decoder_load(const char *module_name)
 	if (get_binary_classes(d) != SRD_OK)
 		goto err_out;
 
+	/* Index the classes, put() looks them up by number. */
+	d->annotation_table = class_table_new(d->annotations);
+	d->binary_table = class_table_new(d->binary);
+
 	/* Append it to the list of loaded decoders. */
-	pd_list = g_slist_append(pd_list, d);
+	decoder_add(d);
 
 	return SRD_OK;
 
@@ -717,6 +861,74 @@ err_out:
 	return SRD_ERR_PYTHON;
 }
 
+/**
+ * Import the Python module of a decoder whose metadata came from the cache.
+ *
+ * Must be called with the GIL held. Does nothing if the module has
+ * already been imported.
+ *
+ * @param dec The decoder to import.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_decoder_import(struct srd_decoder *dec)
+{
+	PyObject *py_mod, *py_dec;
+	uint64_t import_time;
+
+	if (dec->py_dec)
+		return SRD_OK;
+
+	srd_dbg("Importing protocol decoder '%s'.", dec->module_name);
+
+	if (!(py_mod = decoder_import_timed(dec->module_name, &import_time)))
+		goto except_out;
+
+	if (!(py_dec = PyObject_GetAttrString(py_mod, "Decoder")))
+		goto except_out;
+
+	dec->py_mod = py_mod;
+	dec->py_dec = py_dec;
+	dec->import_time = import_time;
+
+	return SRD_OK;
+
+except_out:
+	srd_exception_catch("Failed to import decoder %s", dec->module_name);
+	Py_XDECREF(py_mod);
+
+	return SRD_ERR_PYTHON;
+}
+
+/**
+ * Load a protocol decoder module into the embedded Python interpreter.
+ *
+ * @param module_name The module name to be loaded.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.1.0
+ */
+SRD_API int srd_decoder_load(const char *module_name)
+{
+	PyGILState_STATE gstate;
+	int ret;
+
+	if (!srd_check_init())
+		return SRD_ERR;
+
+	if (!module_name)
+		return SRD_ERR_ARG;
+
+	gstate = PyGILState_Ensure();
+	ret = decoder_load(module_name);
+	PyGILState_Release(gstate);
+
+	return ret;
+}
+
 /**
  * Return a protocol decoder's docstring.
  *
@@ -730,6 +942,7 @@ err_out:
 SRD_API char *srd_decoder_doc_get(const struct srd_decoder *dec)
 {
 	PyObject *py_str;
+	PyGILState_STATE gstate;
 	char *doc;
 
 	if (!srd_check_init())
@@ -738,19 +951,27 @@ SRD_API char *srd_decoder_doc_get(const struct srd_decoder *dec)
 	if (!dec)
 		return NULL;
 
+	gstate = PyGILState_Ensure();
+
+	doc = NULL;
+	if (srd_decoder_import((struct srd_decoder *)dec) != SRD_OK)
+		goto out;
+
 	if (!PyObject_HasAttrString(dec->py_mod, "__doc__"))
-		return NULL;
+		goto out;
 
 	if (!(py_str = PyObject_GetAttrString(dec->py_mod, "__doc__"))) {
 		srd_exception_catch("Failed to get docstring");
-		return NULL;
+		goto out;
 	}
 
-	doc = NULL;
 	if (py_str != Py_None)
 		py_str_as_str(py_str, &doc);
 	Py_DECREF(py_str);
 
+out:
+	PyGILState_Release(gstate);
+
 	return doc;
 }
 
@@ -767,6 +988,7 @@ SRD_API int srd_decoder_unload(struct srd_decoder *dec)
 {
 	struct srd_session *sess;
 	GSList *l;
+	PyGILState_STATE gstate;
 
 	if (!srd_check_init())
 		return SRD_ERR;
@@ -776,6 +998,8 @@ SRD_API int srd_decoder_unload(struct srd_decoder *dec)
 
 	srd_dbg("Unloading protocol decoder '%s'.", dec->name);
 
+	gstate = PyGILState_Ensure();
+
 	/*
 	 * Since any instances of this decoder need to be released as well,
 	 * but they could be anywhere in the stack, just free the entire
@@ -788,13 +1012,500 @@ SRD_API int srd_decoder_unload(struct srd_decoder *dec)
 	}
 
 	/* Remove the PD from the list of loaded decoders. */
-	pd_list = g_slist_remove(pd_list, dec);
+	decoder_remove(dec);
 
 	decoder_free(dec);
 
+	PyGILState_Release(gstate);
+
 	return SRD_OK;
 }
 
+static GVariant *channels_to_variant(GSList *channels)
+{
+	GVariantBuilder builder;
+	struct srd_channel *pdch;
+	GSList *l;
+
+	g_variant_builder_init(&builder, G_VARIANT_TYPE("a(sss)"));
+	for (l = channels; l; l = l->next) {
+		pdch = l->data;
+		g_variant_builder_add(&builder, "(sss)",
+				pdch->id, pdch->name, pdch->desc);
+	}
+
+	return g_variant_builder_end(&builder);
+}
+
+static GSList *channels_from_variant(GVariant *var, int offset)
+{
+	GVariantIter iter;
+	struct srd_channel *pdch;
+	GSList *pdchl;
+	char *id, *name, *desc;
+
+	pdchl = NULL;
+	g_variant_iter_init(&iter, var);
+	while (g_variant_iter_next(&iter, "(sss)", &id, &name, &desc)) {
+		pdch = g_malloc0(sizeof(struct srd_channel));
+		pdch->id = id;
+		pdch->name = name;
+		pdch->desc = desc;
+		pdch->order = offset++;
+		pdchl = g_slist_prepend(pdchl, pdch);
+	}
+
+	return g_slist_reverse(pdchl);
+}
+
+/* Annotation and binary classes are lists of NULL-terminated char[]. */
+static GVariant *strv_list_to_variant(GSList *list)
+{
+	GVariantBuilder builder;
+	GSList *l;
+
+	g_variant_builder_init(&builder, G_VARIANT_TYPE("aas"));
+	for (l = list; l; l = l->next)
+		g_variant_builder_add_value(&builder,
+				g_variant_new_strv(l->data, -1));
+
+	return g_variant_builder_end(&builder);
+}
+
+static GSList *strv_list_from_variant(GVariant *var)
+{
+	GVariantIter iter;
+	GVariant *child;
+	GSList *list;
+
+	list = NULL;
+	g_variant_iter_init(&iter, var);
+	while ((child = g_variant_iter_next_value(&iter))) {
+		list = g_slist_prepend(list, g_variant_dup_strv(child, NULL));
+		g_variant_unref(child);
+	}
+
+	return g_slist_reverse(list);
+}
+
+static GVariant *annotation_rows_to_variant(GSList *annotation_rows)
+{
+	GVariantBuilder builder, classes;
+	struct srd_decoder_annotation_row *ann_row;
+	GSList *l, *ll;
+
+	g_variant_builder_init(&builder, G_VARIANT_TYPE("a(ssat)"));
+	for (l = annotation_rows; l; l = l->next) {
+		ann_row = l->data;
+		g_variant_builder_init(&classes, G_VARIANT_TYPE("at"));
+		for (ll = ann_row->ann_classes; ll; ll = ll->next)
+			g_variant_builder_add(&classes, "t",
+					(guint64)GPOINTER_TO_SIZE(ll->data));
+		g_variant_builder_add(&builder, "(ss@at)", ann_row->id,
+				ann_row->desc, g_variant_builder_end(&classes));
+	}
+
+	return g_variant_builder_end(&builder);
+}
+
+static GSList *annotation_rows_from_variant(GVariant *var)
+{
+	GVariantIter iter, class_iter;
+	GVariant *classes;
+	struct srd_decoder_annotation_row *ann_row;
+	GSList *annotation_rows;
+	char *id, *desc;
+	guint64 class_idx;
+
+	annotation_rows = NULL;
+	g_variant_iter_init(&iter, var);
+	while (g_variant_iter_next(&iter, "(ss@at)", &id, &desc, &classes)) {
+		ann_row = g_malloc0(sizeof(struct srd_decoder_annotation_row));
+		ann_row->id = id;
+		ann_row->desc = desc;
+		g_variant_iter_init(&class_iter, classes);
+		while (g_variant_iter_next(&class_iter, "t", &class_idx))
+			ann_row->ann_classes = g_slist_prepend(ann_row->ann_classes,
+					GSIZE_TO_POINTER((gsize)class_idx));
+		ann_row->ann_classes = g_slist_reverse(ann_row->ann_classes);
+		g_variant_unref(classes);
+		annotation_rows = g_slist_prepend(annotation_rows, ann_row);
+	}
+
+	return g_slist_reverse(annotation_rows);
+}
+
+static GVariant *options_to_variant(GSList *options)
+{
+	GVariantBuilder builder, values;
+	struct srd_decoder_option *o;
+	GSList *l, *ll;
+
+	g_variant_builder_init(&builder, G_VARIANT_TYPE("a(smsmvav)"));
+	for (l = options; l; l = l->next) {
+		o = l->data;
+		g_variant_builder_init(&values, G_VARIANT_TYPE("av"));
+		for (ll = o->values; ll; ll = ll->next)
+			g_variant_builder_add(&values, "v", ll->data);
+		g_variant_builder_add(&builder, "(smsmv@av)", o->id, o->desc,
+				o->def, g_variant_builder_end(&values));
+	}
+
+	return g_variant_builder_end(&builder);
+}
+
+static GSList *options_from_variant(GVariant *var)
+{
+	GVariantIter iter, value_iter;
+	GVariant *values, *value;
+	struct srd_decoder_option *o;
+	GSList *options;
+	char *id, *desc;
+	GVariant *def;
+
+	options = NULL;
+	g_variant_iter_init(&iter, var);
+	while (g_variant_iter_next(&iter, "(smsmv@av)",
+			&id, &desc, &def, &values)) {
+		o = g_malloc0(sizeof(struct srd_decoder_option));
+		o->id = id;
+		o->desc = desc;
+		o->def = def;
+		g_variant_iter_init(&value_iter, values);
+		while (g_variant_iter_next(&value_iter, "v", &value))
+			o->values = g_slist_prepend(o->values, value);
+		o->values = g_slist_reverse(o->values);
+		g_variant_unref(values);
+		options = g_slist_prepend(options, o);
+	}
+
+	return g_slist_reverse(options);
+}
+
+/* Serialize a decoder's metadata into the text stored in the cache. */
+static char *decoder_metadata_to_string(const struct srd_decoder *dec)
+{
+	GVariant *var;
+	char *str;
+
+	var = g_variant_new(CACHE_METADATA_FORMAT, dec->id, dec->name,
+			dec->longname, dec->desc, dec->license,
+			channels_to_variant(dec->channels),
+			channels_to_variant(dec->opt_channels),
+			strv_list_to_variant(dec->annotations),
+			annotation_rows_to_variant(dec->annotation_rows),
+			strv_list_to_variant(dec->binary),
+			options_to_variant(dec->options));
+	g_variant_ref_sink(var);
+	str = g_variant_print(var, TRUE);
+	g_variant_unref(var);
+
+	return str;
+}
+
+/* Create a decoder, without importing it, from its cached metadata. */
+static struct srd_decoder *decoder_metadata_parse(const char *module_name,
+		const char *str)
+{
+	GVariant *var, *channels, *opt_channels, *annotations;
+	GVariant *annotation_rows, *binary, *options;
+	GError *error;
+	struct srd_decoder *d;
+
+	error = NULL;
+	var = g_variant_parse(G_VARIANT_TYPE(CACHE_METADATA_TYPE), str,
+			NULL, NULL, &error);
+	if (!var) {
+		srd_dbg("Invalid cached metadata for protocol decoder "
+			"'%s': %s.", module_name, error->message);
+		g_error_free(error);
+		return NULL;
+	}
+
+	d = g_malloc0(sizeof(struct srd_decoder));
+	d->module_name = g_strdup(module_name);
+
+	g_variant_get(var, CACHE_METADATA_FORMAT, &d->id, &d->name,
+			&d->longname, &d->desc, &d->license,
+			&channels, &opt_channels, &annotations,
+			&annotation_rows, &binary, &options);
+
+	d->channels = channels_from_variant(channels, 0);
+	d->opt_channels = channels_from_variant(opt_channels,
+			g_slist_length(d->channels));
+	d->annotations = strv_list_from_variant(annotations);
+	d->annotation_rows = annotation_rows_from_variant(annotation_rows);
+	d->binary = strv_list_from_variant(binary);
+	d->options = options_from_variant(options);
+
+	g_variant_unref(options);
+	g_variant_unref(binary);
+	g_variant_unref(annotation_rows);
+	g_variant_unref(annotations);
+	g_variant_unref(opt_channels);
+	g_variant_unref(channels);
+	g_variant_unref(var);
+
+	d->annotation_table = class_table_new(d->annotations);
+	d->binary_table = class_table_new(d->binary);
+
+	return d;
+}
+
+static gint stamp_item_compare(gconstpointer a, gconstpointer b)
+{
+	return strcmp(*(const char **)a, *(const char **)b);
+}
+
+/*
+ * Describe a Python source file by its size and a hash of its contents.
+ * The modification time is left out, it changes on checkouts and copies
+ * that keep the contents.
+ */
+static char *file_stamp(const char *filename, const char *name)
+{
+	gchar *contents, *checksum, *stamp;
+	gsize len;
+
+	if (!g_file_get_contents(filename, &contents, &len, NULL))
+		return NULL;
+	checksum = g_compute_checksum_for_data(G_CHECKSUM_SHA256,
+			(const guchar *)contents, len);
+	stamp = g_strdup_printf("%s:%" G_GSIZE_FORMAT ":%s", name, len,
+			checksum);
+	g_free(checksum);
+	g_free(contents);
+
+	return stamp;
+}
+
+/*
+ * Describe the sources of the decoder in the given directory by the
+ * name, size and contents of its Python files, so that any change to
+ * them invalidates its cache entry.
+ */
+static char *decoder_stamp(const char *path)
+{
+	GPtrArray *items;
+	GDir *dir;
+	const gchar *name;
+	char *filename, *item, *stamp;
+
+	items = g_ptr_array_new_with_free_func(g_free);
+
+	if ((dir = g_dir_open(path, 0, NULL))) {
+		while ((name = g_dir_read_name(dir))) {
+			if (!g_str_has_suffix(name, ".py"))
+				continue;
+			filename = g_build_filename(path, name, NULL);
+			if ((item = file_stamp(filename, name)))
+				g_ptr_array_add(items, item);
+			g_free(filename);
+		}
+		g_dir_close(dir);
+	} else if ((item = file_stamp(path, ""))) {
+		/* Not a directory, but it may still become importable. */
+		g_ptr_array_add(items, item);
+	}
+
+	g_ptr_array_sort(items, stamp_item_compare);
+	g_ptr_array_add(items, NULL);
+	stamp = g_strjoinv(";", (char **)items->pdata);
+	g_ptr_array_free(items, TRUE);
+
+	return stamp;
+}
+
+static GKeyFile *cache_open(void)
+{
+	GKeyFile *cache;
+	GError *error;
+	char *version;
+
+	cache = g_key_file_new();
+
+	error = NULL;
+	if (!g_key_file_load_from_file(cache, cache_path,
+			G_KEY_FILE_NONE, &error)) {
+		srd_dbg("Decoder cache file '%s' not loaded: %s.",
+			cache_path, error->message);
+		g_error_free(error);
+		return cache;
+	}
+
+	version = g_key_file_get_string(cache, CACHE_GROUP, "version", NULL);
+	if (g_strcmp0(version, CACHE_VERSION)) {
+		srd_dbg("Discarding outdated decoder cache file '%s'.",
+			cache_path);
+		g_key_file_free(cache);
+		cache = g_key_file_new();
+	}
+	g_free(version);
+
+	return cache;
+}
+
+static void cache_save(GKeyFile *cache)
+{
+	GError *error;
+	char *data;
+	gsize len;
+
+	g_key_file_set_string(cache, CACHE_GROUP, "version", CACHE_VERSION);
+	data = g_key_file_to_data(cache, &len, NULL);
+
+	error = NULL;
+	if (!g_file_set_contents(cache_path, data, len, &error)) {
+		srd_warn("Failed to write decoder cache file '%s': %s.",
+			cache_path, error->message);
+		g_error_free(error);
+	}
+	g_free(data);
+}
+
+/*
+ * Load a decoder from the cache if its sources didn't change. Otherwise,
+ * if import is set, load it normally and record the outcome (even a
+ * failure, so that directories which don't hold a decoder aren't imported
+ * every time). Returns FALSE if the decoder is left for a later import.
+ * Must be called with the GIL held.
+ */
+static gboolean decoder_load_cached(GKeyFile *cache, const char *path,
+		const char *module_name, gboolean import,
+		gboolean *cache_changed)
+{
+	struct srd_decoder *d;
+	char *group, *stamp, *cached_stamp, *metadata;
+	gboolean loaded;
+
+	if (decoder_find_by_module(module_name))
+		return TRUE;
+
+	if (PyDict_GetItemString(PyImport_GetModuleDict(), module_name))
+		return TRUE;
+
+	group = g_build_filename(path, module_name, NULL);
+	stamp = decoder_stamp(group);
+	cached_stamp = g_key_file_get_string(cache, group, "stamp", NULL);
+	metadata = NULL;
+	loaded = TRUE;
+
+	if (!g_strcmp0(stamp, cached_stamp)) {
+		metadata = g_key_file_get_string(cache, group,
+				"metadata", NULL);
+		if (!metadata)
+			/* Known not to be a loadable decoder. */
+			goto out;
+		if ((d = decoder_metadata_parse(module_name, metadata))) {
+			srd_dbg("Loading protocol decoder '%s' from cache.",
+				module_name);
+			decoder_add(d);
+			goto out;
+		}
+		g_free(metadata);
+		metadata = NULL;
+	}
+
+	if (!import) {
+		loaded = FALSE;
+		goto out;
+	}
+
+	g_key_file_remove_group(cache, group, NULL);
+	g_key_file_set_string(cache, group, "stamp", stamp);
+	if (decoder_load(module_name) == SRD_OK
+			&& (d = decoder_find_by_module(module_name))) {
+		metadata = decoder_metadata_to_string(d);
+		g_key_file_set_string(cache, group, "metadata", metadata);
+	}
+	*cache_changed = TRUE;
+
+out:
+	g_free(metadata);
+	g_free(cached_stamp);
+	g_free(stamp);
+	g_free(group);
+
+	return loaded;
+}
+
+static void pending_free(struct pending_decoder *pd)
+{
+	g_free(pd->module_name);
+	g_free(pd->path);
+	g_free(pd);
+}
+
+static struct pending_decoder *pending_find(const char *module_name)
+{
+	struct pending_decoder *pd;
+	GSList *l;
+
+	for (l = pd_pending; l; l = l->next) {
+		pd = l->data;
+		if (!strcmp(pd->module_name, module_name))
+			return pd;
+	}
+
+	return NULL;
+}
+
+/* Remember a decoder for loading on first use, with the GIL held. */
+static void pending_add(const char *path, const char *module_name)
+{
+	struct pending_decoder *pd;
+
+	if (decoder_find_by_module(module_name))
+		return;
+
+	/* Like Python, the first search path holding the module wins. */
+	if (pending_find(module_name))
+		return;
+
+	pd = g_malloc(sizeof(struct pending_decoder));
+	pd->path = g_strdup(path);
+	pd->module_name = g_strdup(module_name);
+	pd_pending = g_slist_append(pd_pending, pd);
+}
+
+/*
+ * Load the pending decoder in the given module, with the GIL held. All
+ * pending decoders are loaded if the module name is NULL.
+ */
+static void pending_load(const char *module_name)
+{
+	struct pending_decoder *pd;
+	GKeyFile *cache;
+	gboolean cache_changed;
+
+	if (!pd_pending || (module_name && !pending_find(module_name)))
+		return;
+
+	cache = cache_path ? cache_open() : NULL;
+	cache_changed = FALSE;
+
+	while (pd_pending) {
+		if (!module_name)
+			pd = pd_pending->data;
+		else if (!(pd = pending_find(module_name)))
+			break;
+		pd_pending = g_slist_remove(pd_pending, pd);
+
+		if (cache)
+			decoder_load_cached(cache, pd->path, pd->module_name,
+					TRUE, &cache_changed);
+		else
+			decoder_load(pd->module_name);
+		pending_free(pd);
+	}
+
+	if (cache) {
+		if (cache_changed)
+			cache_save(cache);
+		g_key_file_free(cache);
+	}
+}
+
 static void srd_decoder_load_all_zip_path(char *path)
 {
 	PyObject *zipimport_mod, *zipimporter_class, *zipimporter;
@@ -859,7 +1570,7 @@ static void srd_decoder_load_all_zip_path(char *path)
 		char *modname_str;
 		if (py_str_as_str(modname, &modname_str) == SRD_OK) {
 			/* The directory name is the module name (e.g. "i2c"). */
-			srd_decoder_load(modname_str);
+			decoder_load(modname_str);
 			g_free(modname_str);
 		}
 		Py_DECREF(modname);
@@ -875,7 +1586,8 @@ err_out:
 	PyErr_Clear();
 }
 
-static void srd_decoder_load_all_path(char *path)
+static void srd_decoder_load_all_path(char *path, GKeyFile *cache,
+		gboolean *cache_changed)
 {
 	GDir *dir;
 	const gchar *direntry;
@@ -892,7 +1604,16 @@ static void srd_decoder_load_all_path(char *path)
 	 * want to continue anyway. */
 	while ((direntry = g_dir_read_name(dir)) != NULL) {
 		/* The directory name is the module name (e.g. "i2c"). */
-		srd_decoder_load(direntry);
+		if (lazy_load) {
+			if (!cache || !decoder_load_cached(cache, path,
+					direntry, FALSE, cache_changed))
+				pending_add(path, direntry);
+		} else if (cache) {
+			decoder_load_cached(cache, path, direntry, TRUE,
+					cache_changed);
+		} else {
+			decoder_load(direntry);
+		}
 	}
 	g_dir_close(dir);
 
@@ -901,6 +1622,10 @@ static void srd_decoder_load_all_path(char *path)
 /**
  * Load all installed protocol decoders.
  *
+ * If a cache file was set with srd_decoder_cache_set(), decoders whose
+ * sources didn't change since they were cached are set up from the cache
+ * without importing their Python modules.
+ *
  * @return SRD_OK upon success, a (negative) error code otherwise.
  *
  * @since 0.1.0
@@ -908,12 +1633,105 @@ static void srd_decoder_load_all_path(char *path)
 SRD_API int srd_decoder_load_all(void)
 {
 	GSList *l;
+	GKeyFile *cache;
+	gboolean cache_changed;
+	PyGILState_STATE gstate;
 
 	if (!srd_check_init())
 		return SRD_ERR;
 
+	gstate = PyGILState_Ensure();
+
+	cache = cache_path ? cache_open() : NULL;
+	cache_changed = FALSE;
+
 	for (l = searchpaths; l; l = l->next)
-		srd_decoder_load_all_path(l->data);
+		srd_decoder_load_all_path(l->data, cache, &cache_changed);
+
+	if (cache) {
+		if (cache_changed)
+			cache_save(cache);
+		g_key_file_free(cache);
+	}
+
+	PyGILState_Release(gstate);
+
+	return SRD_OK;
+}
+
+/**
+ * Set the file used to cache the metadata of protocol decoders.
+ *
+ * With a cache file set, srd_decoder_load_all() takes the metadata of
+ * decoders whose sources are unchanged from the cache, so srd_decoder_list()
+ * and srd_decoder_get_by_id() work without importing any Python module.
+ * A decoder's module is imported when its first instance is created.
+ * The file is created, or updated, as needed. Caching is off by default.
+ *
+ * @param path The path of the cache file, or NULL to disable caching.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_decoder_cache_set(const char *path)
+{
+	g_free(cache_path);
+	cache_path = g_strdup(path);
+
+	return SRD_OK;
+}
+
+/**
+ * Set whether srd_decoder_load_all() defers loading decoders.
+ *
+ * In lazy mode, srd_decoder_load_all() only records which decoders exist
+ * and where. A decoder's Python module is imported, and its metadata read,
+ * when srd_decoder_get_by_id() (and thus srd_inst_new()) first asks for
+ * it, by the module's name. srd_decoder_list() loads all remaining
+ * decoders. Decoders found in the cache set by srd_decoder_cache_set() are
+ * set up from it right away, as that doesn't import them. Lazy mode is off
+ * by default.
+ *
+ * @param lazy TRUE to defer loading decoders, FALSE to load them at once.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_decoder_lazy_load_set(gboolean lazy)
+{
+	lazy_load = lazy;
+
+	return SRD_OK;
+}
+
+/**
+ * Get how long importing a protocol decoder's Python module took.
+ *
+ * This includes all module-level work of the decoder, such as building
+ * tables or importing further modules, and helps to find decoders that
+ * slow down loading.
+ *
+ * @param dec The protocol decoder.
+ * @param usecs Pointer to where the import time, in microseconds, will
+ *              be stored.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *         SRD_ERR if the decoder's module wasn't imported yet.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_decoder_import_time_get(const struct srd_decoder *dec,
+		uint64_t *usecs)
+{
+	if (!dec || !usecs)
+		return SRD_ERR_ARG;
+
+	if (!dec->py_mod)
+		return SRD_ERR;
+
+	*usecs = dec->import_time;
 
 	return SRD_OK;
 }
@@ -927,15 +1745,20 @@ SRD_API int srd_decoder_load_all(void)
  */
 SRD_API int srd_decoder_unload_all(void)
 {
-	GSList *l;
-	struct srd_decoder *dec;
+	PyGILState_STATE gstate;
 
-	for (l = pd_list; l; l = l->next) {
-		dec = l->data;
-		srd_decoder_unload(dec);
-	}
-	g_slist_free(pd_list);
-	pd_list = NULL;
+	g_slist_free_full(pd_pending, (GDestroyNotify)&pending_free);
+	pd_pending = NULL;
+
+	/* Nothing to unload, maybe not even initialized. */
+	if (!pd_list)
+		return SRD_OK;
+
+	/* srd_decoder_unload() removes each decoder from the list. */
+	gstate = PyGILState_Ensure();
+	while (pd_list)
+		srd_decoder_unload(pd_list->data);
+	PyGILState_Release(gstate);
 
 	return SRD_OK;
 }
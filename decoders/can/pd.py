@@ -19,6 +19,7 @@
 ##
 
 import sigrokdecode as srd
+from math import ceil
 
 class SamplerateError(Exception):
     pass
@@ -77,6 +78,14 @@ class Decoder(srd.Decoder):
             self.bit_width = float(self.samplerate) / float(self.options['bitrate'])
             self.bitpos = (self.bit_width / 100.0) * self.options['sample_point']
 
+    def resync(self):
+        # Bit stuffing allows at most 5 recessive bits in a row up to the
+        # CRC delimiter, the rest of a frame has at most 10 of them (with
+        # a NACK). After 16 recessive bits, any valid frame has ended.
+        if not self.samplerate:
+            return None
+        return (ceil(16 * self.bit_width), (1,))
+
     # Generic helper for CAN bit annotations.
     def putg(self, ss, es, data):
         left, right = int(self.bitpos), int(self.bit_width - self.bitpos)
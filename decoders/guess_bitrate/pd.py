@@ -32,6 +32,7 @@ class Decoder(srd.Decoder):
     license = 'gplv2+'
     inputs = ['logic']
     outputs = ['guess_bitrate']
+    transitions_only = True
     channels = (
         {'id': 'data', 'name': 'Data', 'desc': 'Data line'},
     )
@@ -24,6 +24,7 @@
 # TODO: Implement support for detecting various bus errors.
 
 import sigrokdecode as srd
+from math import ceil
 
 '''
 OUTPUT_PYTHON format:
@@ -75,6 +76,7 @@ class Decoder(srd.Decoder):
     license = 'gplv2+'
     inputs = ['logic']
     outputs = ['i2c']
+    transitions_only = True
     channels = (
         {'id': 'scl', 'name': 'SCL', 'desc': 'Serial clock line'},
         {'id': 'sda', 'name': 'SDA', 'desc': 'Serial data line'},
@@ -82,6 +84,8 @@ class Decoder(srd.Decoder):
     options = (
         {'id': 'address_format', 'desc': 'Displayed slave address format',
             'default': 'shifted', 'values': ('shifted', 'unshifted')},
+        {'id': 'resync_idle', 'desc': 'Bus idle time to split captures at '
+            '(us, 0 = never)', 'default': 0},
     )
     annotations = (
         ('start', 'Start condition'),
@@ -127,6 +131,17 @@ class Decoder(srd.Decoder):
         if key == srd.SRD_CONF_SAMPLERATE:
             self.samplerate = value
 
+    def resync(self):
+        # Only a STOP condition ends a transfer, but the levels of SCL and
+        # SDA can't tell a STOP from a master pausing with both lines high,
+        # which plain I2C allows for any amount of time. So captures are
+        # only split where the user says the bus is idle, e.g. after 50us
+        # for SMBus, which limits the clock high time to that.
+        idle = self.options['resync_idle']
+        if not self.samplerate or idle <= 0:
+            return None
+        return (ceil(self.samplerate * idle * 1e-6), (1, 1))
+
     def start(self):
         self.out_python = self.register(srd.OUTPUT_PYTHON)
         self.out_ann = self.register(srd.OUTPUT_ANN)
@@ -86,6 +86,7 @@ class Decoder(srd.Decoder):
     license = 'gplv2+'
     inputs = ['logic']
     outputs = ['spi']
+    transitions_only = True
     channels = (
         {'id': 'clk', 'name': 'CLK', 'desc': 'Clock'},
     )
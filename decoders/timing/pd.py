@@ -55,6 +55,7 @@ class Decoder(srd.Decoder):
     license = 'gplv2+'
     inputs = ['logic']
     outputs = ['timing']
+    transitions_only = True
     channels = (
         {'id': 'data', 'name': 'Data', 'desc': 'Data line'},
     )
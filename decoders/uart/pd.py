@@ -186,6 +186,19 @@ class Decoder(srd.Decoder):
             # The width of one UART bit in number of samples.
             self.bit_width = float(self.samplerate) / float(self.options['baudrate'])
 
+    def resync(self):
+        # Once both lines idled for a whole frame (plus a bit), any frame
+        # in progress was completed, and we wait for a start bit again.
+        if not self.samplerate:
+            return None
+        frame_bits = 1 + self.options['num_data_bits'] + 1
+        if self.options['parity_type'] != 'none':
+            frame_bits += 1
+        frame_bits += max(self.options['num_stop_bits'], 1.0)
+        levels = (0 if self.options['invert_rx'] == 'yes' else 1,
+                  0 if self.options['invert_tx'] == 'yes' else 1)
+        return (ceil(frame_bits * self.bit_width), levels)
+
     # Return true if we reached the middle of the desired bit, false otherwise.
     def reached_bit(self, rxtx, bitnum):
         # bitpos is the samplenumber which is in the middle of the
@@ -256,7 +269,8 @@ class Decoder(srd.Decoder):
             self.databyte[rxtx] <<= 1
             self.databyte[rxtx] |= (signal << 0)
 
-        self.putg([rxtx + 12, ['%d' % signal]])
+        if self.ann_class_enabled(rxtx + 12):
+            self.putg([rxtx + 12, ['%d' % signal]])
 
         # Store individual data bits and their start/end samplenumbers.
         s, halfbit = self.samplenum, int(self.bit_width / 2)
@@ -273,7 +287,10 @@ class Decoder(srd.Decoder):
             (self.databyte[rxtx], self.databits[rxtx])])
 
         b, f = self.databyte[rxtx], self.options['format']
-        if f == 'ascii':
+        # Only format the data if the frontend shows it.
+        if not self.ann_class_enabled(rxtx):
+            pass
+        elif f == 'ascii':
             c = chr(b) if b in range(30, 126 + 1) else '[%02X]' % b
             self.putx(rxtx, [rxtx, [c]])
         elif f == 'dec':
@@ -25,9 +25,20 @@
 #include <inttypes.h>
 #include <stdlib.h>
 #include <stdint.h>
+#include <string.h>
+#include <time.h>
 
 /** @cond PRIVATE */
 
+/*
+ * Up to this many channels, all possible per-sample channel value objects
+ * of an instance are cached (2^n entries).
+ */
+#define PINS_CACHE_MAX_CHANNELS 12
+
+/* Packets queued for decode_batch() are passed on at this many. */
+#define DECODE_BATCH_MAX 4096
+
 extern SRD_PRIV GSList *sessions;
 
 /* module_sigrokdecode.c */
@@ -49,19 +60,58 @@ extern SRD_PRIV PyObject *srd_logic_type;
  * @{
  */
 
-/**
- * Set one or more options in a decoder instance.
- *
- * Handled options are removed from the hash.
- *
- * @param di Decoder instance.
- * @param options A GHashTable of options to set.
- *
- * @return SRD_OK upon success, a (negative) error code otherwise.
- *
- * @since 0.1.0
+static void channel_lookup_free(struct srd_decoder_inst *di)
+{
+	int i;
+
+	if (di->pins_cache) {
+		for (i = 0; i < (1 << di->dec_num_channels); i++)
+			Py_XDECREF((PyObject *)di->pins_cache[i]);
+		g_free(di->pins_cache);
+		di->pins_cache = NULL;
+	}
+	g_free(di->channel_byte_offsets);
+	di->channel_byte_offsets = NULL;
+	g_free(di->channel_bit_masks);
+	di->channel_bit_masks = NULL;
+}
+
+/*
+ * Derive the per-channel byte offsets and bit masks from the instance's
+ * channel map, so the sample iterator doesn't need to do that for every
+ * sample, and set up an empty cache of per-sample channel value objects.
  */
-SRD_API int srd_inst_option_set(struct srd_decoder_inst *di,
+static void channel_lookup_update(struct srd_decoder_inst *di)
+{
+	int i;
+
+	channel_lookup_free(di);
+	if (!di->dec_num_channels)
+		return;
+
+	di->channel_byte_offsets = g_malloc(sizeof(int) * di->dec_num_channels);
+	di->channel_bit_masks = g_malloc(di->dec_num_channels);
+	for (i = 0; i < di->dec_num_channels; i++) {
+		/* A channelmap value of -1 means "unused optional channel". */
+		if (di->dec_channelmap[i] == -1) {
+			di->channel_byte_offsets[i] = -1;
+			di->channel_bit_masks[i] = 0;
+			/* Value of unused channel is 0xff, instead of 0 or 1. */
+			di->channel_samples[i] = 0xff;
+		} else {
+			di->channel_byte_offsets[i] = di->dec_channelmap[i] / 8;
+			di->channel_bit_masks[i] = 1 << (di->dec_channelmap[i] % 8);
+		}
+	}
+
+	/* The entries are filled in as the patterns show up. */
+	if (di->dec_num_channels <= PINS_CACHE_MAX_CHANNELS)
+		di->pins_cache = g_malloc0(sizeof(void *)
+				* (1 << di->dec_num_channels));
+}
+
+/* Set instance options, with the GIL held. */
+static int inst_option_set(struct srd_decoder_inst *di,
 		GHashTable *options)
 {
 	struct srd_decoder_option *sdo;
@@ -170,6 +220,34 @@ err_out:
 	return ret;
 }
 
+/**
+ * Set one or more options in a decoder instance.
+ *
+ * Handled options are removed from the hash.
+ *
+ * @param di Decoder instance.
+ * @param options A GHashTable of options to set.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.1.0
+ */
+SRD_API int srd_inst_option_set(struct srd_decoder_inst *di,
+		GHashTable *options)
+{
+	PyGILState_STATE gstate;
+	int ret;
+
+	if (!srd_check_init())
+		return SRD_ERR;
+
+	gstate = PyGILState_Ensure();
+	ret = inst_option_set(di, options);
+	PyGILState_Release(gstate);
+
+	return ret;
+}
+
 /* Helper GComparefunc for g_slist_find_custom() in srd_inst_channel_set_all() */
 static gint compare_channel_id(const struct srd_channel *pdch,
 			const char *channel_id)
@@ -200,6 +278,7 @@ SRD_API int srd_inst_channel_set_all(struct srd_decoder_inst *di,
 	GSList *sl;
 	struct srd_channel *pdch;
 	int *new_channelmap, new_channelnum, num_required_channels, i;
+	PyGILState_STATE gstate;
 	char *channel_id;
 
 	srd_dbg("Setting channels for instance %s with list of %d channels.",
@@ -273,16 +352,117 @@ SRD_API int srd_inst_channel_set_all(struct srd_decoder_inst *di,
 	g_free(di->dec_channelmap);
 	di->dec_channelmap = new_channelmap;
 
+	/* This drops the Python objects cached for the previous map. */
+	gstate = PyGILState_Ensure();
+	channel_lookup_update(di);
+	PyGILState_Release(gstate);
+
+	/* The channel mask is rebuilt for the new map on the next chunk. */
+	g_free(di->channel_mask);
+	di->channel_mask = NULL;
+
+	return SRD_OK;
+}
+
+/**
+ * Enable or disable an annotation class of a decoder instance.
+ *
+ * Annotations of disabled classes are dropped before they are converted
+ * and passed to the frontend. Decoders can check whether a class is
+ * enabled with their ann_class_enabled() method, and skip formatting
+ * annotations nobody will see. All classes are enabled by default.
+ *
+ * @param di Decoder instance.
+ * @param ann_class The annotation class, i.e. its index in the decoder's
+ *                  list of annotations.
+ * @param enable TRUE to enable the class, FALSE to disable it.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_inst_ann_class_enable_set(struct srd_decoder_inst *di,
+		int ann_class, gboolean enable)
+{
+	guint num_classes, i;
+
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return SRD_ERR_ARG;
+	}
+
+	num_classes = di->decoder->annotation_table->len;
+	if (ann_class < 0 || (guint)ann_class >= num_classes) {
+		srd_err("Protocol decoder %s has no annotation class %d.",
+			di->decoder->name, ann_class);
+		return SRD_ERR_ARG;
+	}
+
+	if (!di->ann_class_enabled) {
+		if (enable)
+			return SRD_OK;
+		di->ann_class_enabled = g_malloc(sizeof(gboolean) * num_classes);
+		for (i = 0; i < num_classes; i++)
+			di->ann_class_enabled[i] = TRUE;
+	}
+	di->ann_class_enabled[ann_class] = enable;
+
 	return SRD_OK;
 }
 
+/**
+ * Enable or disable all annotation classes in an annotation row of a
+ * decoder instance.
+ *
+ * See srd_inst_ann_class_enable_set() for details.
+ *
+ * @param di Decoder instance.
+ * @param row_id The ID of the annotation row.
+ * @param enable TRUE to enable the row's classes, FALSE to disable them.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_inst_ann_row_enable_set(struct srd_decoder_inst *di,
+		const char *row_id, gboolean enable)
+{
+	GSList *l, *c;
+	struct srd_decoder_annotation_row *row;
+	int ret;
+
+	if (!di || !row_id) {
+		srd_err("Invalid decoder instance or annotation row.");
+		return SRD_ERR_ARG;
+	}
+
+	for (l = di->decoder->annotation_rows; l; l = l->next) {
+		row = l->data;
+		if (strcmp(row->id, row_id))
+			continue;
+		for (c = row->ann_classes; c; c = c->next) {
+			ret = srd_inst_ann_class_enable_set(di,
+					GPOINTER_TO_INT(c->data), enable);
+			if (ret != SRD_OK)
+				return ret;
+		}
+		return SRD_OK;
+	}
+
+	srd_err("Protocol decoder %s has no annotation row '%s'.",
+		di->decoder->name, row_id);
+
+	return SRD_ERR_ARG;
+}
+
 /**
  * Create a new protocol decoder instance.
  *
  * @param sess The session holding the protocol decoder instance.
  * @param decoder_id Decoder 'id' field.
  * @param options GHashtable of options which override the defaults set in
- *                the decoder class. May be NULL.
+ *                the decoder class. May be NULL, the instance then gets
+ *                the defaults.
  *
  * @return Pointer to a newly allocated struct srd_decoder_inst, or
  *         NULL in case of failure.
@@ -292,9 +472,11 @@ SRD_API int srd_inst_channel_set_all(struct srd_decoder_inst *di,
 SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 		const char *decoder_id, GHashTable *options)
 {
-	int i;
+	int i, ret;
 	struct srd_decoder *dec;
 	struct srd_decoder_inst *di;
+	PyGILState_STATE gstate;
+	GHashTable *no_options;
 	char *inst_id;
 
 	srd_dbg("Creating new %s instance.", decoder_id);
@@ -336,28 +518,61 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 		 * of the instance's decode() method.
 		 */
 		di->channel_samples = g_malloc(di->dec_num_channels);
+		channel_lookup_update(di);
 	}
 
+	gstate = PyGILState_Ensure();
+
+	/* Decoders set up from the cache are imported on first use. */
+	if (srd_decoder_import(dec) != SRD_OK)
+		goto err_out;
+
 	/* Create a new instance of this decoder class. */
 	if (!(di->py_inst = PyObject_CallObject(dec->py_dec, NULL))) {
 		if (PyErr_Occurred())
 			srd_exception_catch("Failed to create %s instance",
 					decoder_id);
-		g_free(di->dec_channelmap);
-		g_free(di);
-		return NULL;
+		goto err_out;
 	}
 
-	if (options && srd_inst_option_set(di, options) != SRD_OK) {
-		g_free(di->dec_channelmap);
-		g_free(di);
-		return NULL;
+	/* Lets put() and register() find this instance from the object. */
+	((srd_Decoder *)di->py_inst)->di = di;
+
+	/* Without any options given, the defaults still have to be set. */
+	if (options) {
+		ret = inst_option_set(di, options);
+	} else {
+		no_options = g_hash_table_new(g_str_hash, g_str_equal);
+		ret = inst_option_set(di, no_options);
+		g_hash_table_destroy(no_options);
 	}
+	if (ret != SRD_OK)
+		goto err_out;
+
+	PyGILState_Release(gstate);
 
 	/* Instance takes input from a frontend by default. */
 	sess->di_list = g_slist_append(sess->di_list, di);
 
+	/* If several instances share an ID, the first one is found. */
+	if (!g_hash_table_lookup(sess->di_index, di->inst_id))
+		g_hash_table_insert(sess->di_index, di->inst_id, di);
+
 	return di;
+
+err_out:
+	if (di->py_inst) {
+		((srd_Decoder *)di->py_inst)->di = NULL;
+		Py_DecRef(di->py_inst);
+	}
+	channel_lookup_free(di);
+	PyGILState_Release(gstate);
+	g_free(di->channel_samples);
+	g_free(di->dec_channelmap);
+	g_free(di->inst_id);
+	g_free(di);
+
+	return NULL;
 }
 
 /**
@@ -402,8 +617,9 @@ SRD_API int srd_inst_stack(struct srd_session *sess,
 /**
  * Find a decoder instance by its instance ID.
  *
- * Only the bottom level of instances are searched -- instances already stacked
- * on top of another one will not be found.
+ * All instances of the session are searched, including those stacked on
+ * top of another one. If several instances share the ID, the one created
+ * first is returned.
  *
  * @param sess The session holding the protocol decoder instance.
  * @param inst_id The instance ID to be found.
@@ -415,82 +631,348 @@ SRD_API int srd_inst_stack(struct srd_session *sess,
 SRD_API struct srd_decoder_inst *srd_inst_find_by_id(struct srd_session *sess,
 		const char *inst_id)
 {
-	GSList *l;
-	struct srd_decoder_inst *tmp, *di;
-
 	if (session_is_valid(sess) != SRD_OK) {
 		srd_err("Invalid session.");
 		return NULL;
 	}
 
-	di = NULL;
-	for (l = sess->di_list; l; l = l->next) {
-		tmp = l->data;
-		if (!strcmp(tmp->inst_id, inst_id)) {
-			di = tmp;
-			break;
-		}
-	}
+	if (!inst_id)
+		return NULL;
 
-	return di;
+	return g_hash_table_lookup(sess->di_index, inst_id);
 }
 
-static struct srd_decoder_inst *srd_sess_inst_find_by_obj(
-		struct srd_session *sess, const GSList *stack,
-		const PyObject *obj)
+/**
+ * Get the performance counters of a decoder instance.
+ *
+ * The counters are kept for all instances, from their creation or the
+ * last srd_inst_stats_reset() on. Stacks decoded in worker processes
+ * (see srd_session_workers_set() and srd_session_send_segmented()) only
+ * count the time spent in the frontend callbacks.
+ *
+ * @param di The decoder instance.
+ * @param stats Pointer to a struct the counters are copied to.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_inst_stats_get(struct srd_decoder_inst *di,
+		struct srd_inst_stats *stats)
 {
-	const GSList *l;
-	struct srd_decoder_inst *tmp, *di;
+	PyGILState_STATE gstate;
 
-	if (session_is_valid(sess) != SRD_OK) {
-		srd_err("Invalid session.");
-		return NULL;
+	if (!di || !stats) {
+		srd_err("Invalid decoder instance or stats pointer.");
+		return SRD_ERR_ARG;
 	}
 
-	di = NULL;
-	for (l = stack ? stack : sess->di_list; di == NULL && l != NULL; l = l->next) {
-		tmp = l->data;
-		if (tmp->py_inst == obj)
-			di = tmp;
-		else if (tmp->next_di)
-			di = srd_sess_inst_find_by_obj(sess, tmp->next_di, obj);
-	}
+	/* The counters are updated with the GIL held. */
+	gstate = PyGILState_Ensure();
+	*stats = di->stats;
+	PyGILState_Release(gstate);
 
-	return di;
+	return SRD_OK;
 }
 
 /**
- * Find a decoder instance by its Python object.
+ * Reset the performance counters of a decoder instance to zero.
  *
- * I.e. find that instance's instantiation of the sigrokdecode.Decoder class.
- * This will recurse to find the instance anywhere in the stack tree of all
- * sessions.
+ * @param di The decoder instance.
  *
- * @param stack Pointer to a GSList of struct srd_decoder_inst, indicating the
- *              stack to search. To start searching at the bottom level of
- *              decoder instances, pass NULL.
- * @param obj The Python class instantiation.
+ * @return SRD_OK upon success, a (negative) error code otherwise.
  *
- * @return Pointer to struct srd_decoder_inst, or NULL if not found.
+ * @since 0.5.0
+ */
+SRD_API int srd_inst_stats_reset(struct srd_decoder_inst *di)
+{
+	PyGILState_STATE gstate;
+
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return SRD_ERR_ARG;
+	}
+
+	gstate = PyGILState_Ensure();
+	memset(&di->stats, 0, sizeof(struct srd_inst_stats));
+	PyGILState_Release(gstate);
+
+	return SRD_OK;
+}
+
+/**
+ * Add the performance counters of a decoder instance and the instances
+ * stacked on top of it to the given ones.
+ *
+ * Must be called with the GIL held.
  *
  * @private
+ */
+SRD_PRIV void srd_inst_stats_sum(struct srd_decoder_inst *di,
+		struct srd_inst_stats *stats)
+{
+	GSList *l;
+	int i;
+
+	stats->decode_calls += di->stats.decode_calls;
+	stats->decode_time += di->stats.decode_time;
+	stats->decode_cpu_time += di->stats.decode_cpu_time;
+	stats->samples += di->stats.samples;
+	stats->chunks += di->stats.chunks;
+	for (i = 0; i < SRD_OUTPUT_TYPE_COUNT; i++)
+		stats->put_calls[i] += di->stats.put_calls[i];
+	stats->annotations += di->stats.annotations;
+	stats->binary_bytes += di->stats.binary_bytes;
+	stats->callback_time += di->stats.callback_time;
+
+	for (l = di->next_di; l; l = l->next)
+		srd_inst_stats_sum(l->data, stats);
+}
+
+/**
+ * Reset the performance counters of a decoder instance and the instances
+ * stacked on top of it.
  *
- * @since 0.1.0
+ * Must be called with the GIL held.
+ *
+ * @private
  */
-SRD_PRIV struct srd_decoder_inst *srd_inst_find_by_obj(const GSList *stack,
-		const PyObject *obj)
+SRD_PRIV void srd_inst_stats_clear(struct srd_decoder_inst *di)
 {
-	struct srd_decoder_inst *di;
-	struct srd_session *sess;
 	GSList *l;
 
-	di = NULL;
-	for (l = sessions; di == NULL && l != NULL; l = l->next) {
-		sess = l->data;
-		di = srd_sess_inst_find_by_obj(sess, stack, obj);
+	memset(&di->stats, 0, sizeof(struct srd_inst_stats));
+	for (l = di->next_di; l; l = l->next)
+		srd_inst_stats_clear(l->data);
+}
+
+static int64_t wall_time_ns(void)
+{
+#ifdef CLOCK_MONOTONIC
+	struct timespec ts;
+
+	if (clock_gettime(CLOCK_MONOTONIC, &ts) == 0)
+		return (int64_t)ts.tv_sec * 1000000000 + ts.tv_nsec;
+#endif
+
+	return g_get_monotonic_time() * 1000;
+}
+
+/* The CPU time used by the calling thread, -1 if it can't be measured. */
+static int64_t cpu_time_ns(void)
+{
+#ifdef CLOCK_THREAD_CPUTIME_ID
+	struct timespec ts;
+
+	if (clock_gettime(CLOCK_THREAD_CPUTIME_ID, &ts) == 0)
+		return (int64_t)ts.tv_sec * 1000000000 + ts.tv_nsec;
+#endif
+
+	return -1;
+}
+
+/**
+ * Start measuring a span of time for the performance counters.
+ *
+ * Spans can be nested, the time of the nested spans isn't counted for
+ * the enclosing one. This way, a decoder's decode() time doesn't include
+ * the time spent in the decoders stacked on top, and in the frontend
+ * callbacks which its put() calls run.
+ *
+ * Reading the thread's CPU time is a system call on most platforms, so
+ * it is only done if 'cpu' is set. The CPU time of other spans is taken
+ * to be their wall clock time, which is close enough for frontend
+ * callbacks.
+ *
+ * Must be called with the GIL held, by the thread decoding the session.
+ *
+ * @private
+ */
+SRD_PRIV void srd_stats_span_begin(struct srd_session *sess,
+		struct srd_stats_span *span, gboolean cpu)
+{
+	span->outer_wall = sess->stats_nested_wall;
+	span->outer_cpu = sess->stats_nested_cpu;
+	sess->stats_nested_wall = 0;
+	sess->stats_nested_cpu = 0;
+	span->cpu_start = cpu ? cpu_time_ns() : -1;
+	span->wall_start = wall_time_ns();
+}
+
+/**
+ * Stop measuring a span of time, and add the time spent in it (minus the
+ * time of the nested spans) to the given counters.
+ *
+ * @param sess The session.
+ * @param span The span, as set up by srd_stats_span_begin().
+ * @param wall Counter of wall clock time, in nanoseconds.
+ * @param cpu Counter of CPU time, in nanoseconds. Can be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_stats_span_end(struct srd_session *sess,
+		struct srd_stats_span *span, uint64_t *wall, uint64_t *cpu)
+{
+	int64_t wall_time, cpu_time, cpu_end;
+
+	wall_time = wall_time_ns() - span->wall_start;
+	cpu_time = wall_time;
+	if (span->cpu_start >= 0 && (cpu_end = cpu_time_ns()) >= 0)
+		cpu_time = cpu_end - span->cpu_start;
+
+	*wall += MAX(wall_time - sess->stats_nested_wall, 0);
+	if (cpu)
+		*cpu += MAX(cpu_time - sess->stats_nested_cpu, 0);
+
+	sess->stats_nested_wall = span->outer_wall + wall_time;
+	sess->stats_nested_cpu = span->outer_cpu + cpu_time;
+}
+
+/**
+ * Start profiling a decoder instance.
+ *
+ * A cProfile profiler is enabled while the instance's start(), decode()
+ * and decode_batch() methods run, which includes its put() calls. The
+ * decoders stacked on top are called from put(), and are profiled as
+ * part of it. They only get profiles of their own where they are called
+ * while no profiler is enabled.
+ *
+ * Stacks decoded in worker processes aren't profiled. This can be used
+ * while a session is running, but not from output callbacks.
+ *
+ * @param di The decoder instance.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_inst_profile_start(struct srd_decoder_inst *di)
+{
+	PyGILState_STATE gstate;
+	PyObject *py_mod;
+	int ret;
+
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return SRD_ERR_ARG;
 	}
 
-	return di;
+	gstate = PyGILState_Ensure();
+	ret = SRD_OK;
+	if (di->py_profile) {
+		srd_err("Instance %s is being profiled already.", di->inst_id);
+		ret = SRD_ERR;
+	} else if (!(py_mod = py_import_by_name("cProfile"))) {
+		srd_exception_catch("Failed to import cProfile");
+		ret = SRD_ERR_PYTHON;
+	} else {
+		di->py_profile = PyObject_CallMethod(py_mod, "Profile", NULL);
+		Py_DECREF(py_mod);
+		if (!di->py_profile) {
+			srd_exception_catch("Failed to create profiler");
+			ret = SRD_ERR_PYTHON;
+		}
+	}
+	PyGILState_Release(gstate);
+
+	if (ret == SRD_OK)
+		srd_dbg("Profiling instance %s.", di->inst_id);
+
+	return ret;
+}
+
+/**
+ * Stop profiling a decoder instance, and save the results.
+ *
+ * The results are written in the format of the Python pstats module, see
+ * pstats.Stats, as done by cProfile.Profile.dump_stats().
+ *
+ * @param di The decoder instance.
+ * @param filename The file to write the results to. If NULL, they are
+ *                 dropped.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise. The
+ *         profiling stops even if writing the results failed.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_inst_profile_stop(struct srd_decoder_inst *di,
+		const char *filename)
+{
+	PyGILState_STATE gstate;
+	PyObject *py_res;
+	int ret;
+
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return SRD_ERR_ARG;
+	}
+
+	gstate = PyGILState_Ensure();
+	ret = SRD_OK;
+	if (!di->py_profile) {
+		srd_err("Instance %s is not being profiled.", di->inst_id);
+		ret = SRD_ERR;
+	} else if (di->py_profile == di->sess->py_profile_active) {
+		srd_err("Instance %s is decoding, can't stop profiling.",
+			di->inst_id);
+		ret = SRD_ERR;
+	} else {
+		if (filename) {
+			py_res = PyObject_CallMethod(di->py_profile,
+					"dump_stats", "s", filename);
+			if (!py_res) {
+				srd_exception_catch("Failed to save profile "
+						"of %s", di->inst_id);
+				ret = SRD_ERR_PYTHON;
+			}
+			Py_XDECREF(py_res);
+		}
+		Py_CLEAR(di->py_profile);
+	}
+	PyGILState_Release(gstate);
+
+	return ret;
+}
+
+/*
+ * Enable the instance's profiler, unless it has none or another one is
+ * enabled already. Returns whether it was enabled.
+ */
+static gboolean profile_enter(struct srd_decoder_inst *di)
+{
+	PyObject *py_res;
+
+	if (!di->py_profile || di->sess->py_profile_active)
+		return FALSE;
+
+	if (!(py_res = PyObject_CallMethod(di->py_profile, "enable", NULL))) {
+		srd_exception_catch("Failed to enable profiler of %s",
+				di->inst_id);
+		return FALSE;
+	}
+	Py_DECREF(py_res);
+	di->sess->py_profile_active = di->py_profile;
+
+	return TRUE;
+}
+
+/* Disable the profiler enabled by profile_enter(), if it did. */
+static void profile_leave(struct srd_decoder_inst *di, gboolean entered)
+{
+	PyObject *py_res, *py_type, *py_value, *py_traceback;
+
+	if (!entered)
+		return;
+
+	/* Keep the exception the profiled call may have raised. */
+	PyErr_Fetch(&py_type, &py_value, &py_traceback);
+	di->sess->py_profile_active = NULL;
+	if (!(py_res = PyObject_CallMethod(di->py_profile, "disable", NULL)))
+		srd_exception_catch("Failed to disable profiler of %s",
+				di->inst_id);
+	Py_XDECREF(py_res);
+	PyErr_Restore(py_type, py_value, py_traceback);
 }
 
 /** @private */
@@ -499,18 +981,44 @@ SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di)
 	PyObject *py_res;
 	GSList *l;
 	struct srd_decoder_inst *next_di;
+	gboolean profiled;
 	int ret;
 
 	srd_dbg("Calling start() method on protocol decoder instance %s.",
 			di->inst_id);
 
-	if (!(py_res = PyObject_CallMethod(di->py_inst, "start", NULL))) {
+	/* A new run doesn't continue the previous sample stream. */
+	di->last_sample_valid = FALSE;
+	di->seek_samplenum = 0;
+	di->seek_edge = 0;
+
+	profiled = profile_enter(di);
+	py_res = PyObject_CallMethod(di->py_inst, "start", NULL);
+	profile_leave(di, profiled);
+	if (!py_res) {
 		srd_exception_catch("Protocol decoder instance %s",
 				di->inst_id);
 		return SRD_ERR_PYTHON;
 	}
 	Py_DecRef(py_res);
 
+	/* Look up decode() once, instead of for every chunk and packet. */
+	Py_XDECREF(di->py_decode);
+	if (!(di->py_decode = PyObject_GetAttrString(di->py_inst, "decode"))) {
+		srd_exception_catch("Protocol decoder instance %s",
+				di->inst_id);
+		return SRD_ERR_PYTHON;
+	}
+
+	/* Stacked PDs can take their input in batches, see decode_batch(). */
+	Py_XDECREF(di->py_decode_batch);
+	di->py_decode_batch = NULL;
+	if (PyObject_HasAttrString(di->py_inst, "decode_batch"))
+		di->py_decode_batch = PyObject_GetAttrString(di->py_inst,
+				"decode_batch");
+	Py_XDECREF(di->py_batch);
+	di->py_batch = NULL;
+
 	/* Start all the PDs stacked on top of this one. */
 	for (l = di->next_di; l; l = l->next) {
 		next_di = l->data;
@@ -521,6 +1029,179 @@ SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di)
 	return SRD_OK;
 }
 
+/**
+ * Call the decode() method of a decoder instance.
+ *
+ * Must be called with the GIL held.
+ *
+ * @param di The decoder instance.
+ * @param py_ss The start sample number, a Python int.
+ * @param py_es The end sample number, a Python int.
+ * @param py_data The data to decode.
+ *
+ * @return The result of decode(), NULL with a Python exception set if it
+ *         failed.
+ *
+ * @private
+ */
+SRD_PRIV PyObject *srd_inst_decode_call(struct srd_decoder_inst *di,
+		PyObject *py_ss, PyObject *py_es, PyObject *py_data)
+{
+	struct srd_stats_span span;
+	PyObject *py_res;
+	gboolean profiled;
+
+	di->stats.decode_calls++;
+	srd_stats_span_begin(di->sess, &span, TRUE);
+	profiled = profile_enter(di);
+
+	/* Instances which weren't started yet don't have decode() cached. */
+	if (!di->py_decode)
+		py_res = PyObject_CallMethod(di->py_inst, "decode", "OOO",
+				py_ss, py_es, py_data);
+	else
+		py_res = PyObject_CallFunctionObjArgs(di->py_decode, py_ss,
+				py_es, py_data, NULL);
+
+	profile_leave(di, profiled);
+
+	srd_stats_span_end(di->sess, &span, &di->stats.decode_time,
+			&di->stats.decode_cpu_time);
+
+	return py_res;
+}
+
+/**
+ * Queue an OUTPUT_PYTHON packet for the decode_batch() method of a
+ * stacked decoder instance.
+ *
+ * Must be called with the GIL held.
+ *
+ * @param di The decoder instance, which must have a decode_batch() method.
+ * @param py_ss The start sample number, a Python int.
+ * @param py_es The end sample number, a Python int.
+ * @param py_data The packet.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_decode_batch_add(struct srd_decoder_inst *di,
+		PyObject *py_ss, PyObject *py_es, PyObject *py_data)
+{
+	PyObject *py_item;
+
+	if (!di->py_batch && !(di->py_batch = PyList_New(0))) {
+		srd_exception_catch("Protocol decoder instance %s",
+				di->inst_id);
+		return;
+	}
+	if (!(py_item = PyTuple_Pack(3, py_ss, py_es, py_data))
+			|| PyList_Append(di->py_batch, py_item) < 0)
+		srd_exception_catch("Protocol decoder instance %s",
+				di->inst_id);
+	Py_XDECREF(py_item);
+
+	/* Don't let a huge chunk pile up packets without bounds. */
+	if (PyList_Size(di->py_batch) >= DECODE_BATCH_MAX)
+		srd_inst_decode_batch_flush(di);
+}
+
+/**
+ * Pass the queued OUTPUT_PYTHON packets to the decode_batch() methods of
+ * a decoder instance and the instances stacked on top of it.
+ *
+ * Must be called with the GIL held.
+ *
+ * @param di The decoder instance.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_decode_batch_flush(struct srd_decoder_inst *di)
+{
+	struct srd_stats_span span;
+	PyObject *py_batch, *py_res;
+	GSList *l;
+	gboolean profiled;
+
+	/* decode_batch() may queue packets for the instances above. */
+	if ((py_batch = di->py_batch)) {
+		di->py_batch = NULL;
+		di->stats.decode_calls++;
+		srd_stats_span_begin(di->sess, &span, TRUE);
+		profiled = profile_enter(di);
+		py_res = PyObject_CallFunctionObjArgs(di->py_decode_batch,
+				py_batch, NULL);
+		profile_leave(di, profiled);
+		srd_stats_span_end(di->sess, &span, &di->stats.decode_time,
+				&di->stats.decode_cpu_time);
+		if (!py_res)
+			srd_exception_catch("Calling %s decode_batch() failed",
+					di->inst_id);
+		Py_XDECREF(py_res);
+		Py_DECREF(py_batch);
+	}
+
+	for (l = di->next_di; l; l = l->next)
+		srd_inst_decode_batch_flush(l->data);
+}
+
+/*
+ * Set up the packed mask of all channels mapped into this instance, and
+ * the buffer holding the last sample of a chunk, for the given unitsize.
+ */
+static void channel_mask_update(struct srd_decoder_inst *di,
+		uint64_t unitsize)
+{
+	int i, byte_offset;
+
+	g_free(di->channel_mask);
+	di->channel_mask = g_malloc0(unitsize);
+	for (i = 0; i < di->dec_num_channels; i++) {
+		byte_offset = di->channel_byte_offsets[i];
+		if (byte_offset == -1 || (uint64_t)byte_offset >= unitsize)
+			continue;
+		di->channel_mask[byte_offset] |= di->channel_bit_masks[i];
+	}
+
+	if (unitsize != (uint64_t)di->data_unitsize || !di->last_sample) {
+		g_free(di->last_sample);
+		di->last_sample = g_malloc0(unitsize);
+		di->last_sample_valid = FALSE;
+	}
+	di->data_unitsize = unitsize;
+}
+
+/*
+ * Get the srd_logic object which hands the next chunk to the PD. The
+ * instance keeps one around for all chunks, unless the PD held on to it,
+ * in which case it gets a new one.
+ */
+static srd_logic *logic_get(struct srd_decoder_inst *di)
+{
+	srd_logic *logic;
+
+	if ((logic = di->py_logic) && Py_REFCNT(logic) == 1)
+		return logic;
+
+	Py_XDECREF(logic);
+	di->py_logic = NULL;
+
+	logic = PyObject_New(srd_logic, (PyTypeObject *)srd_logic_type);
+	if (!logic)
+		return NULL;
+	logic->di = di;
+	logic->inbuf = NULL;
+	logic->inbuflen = 0;
+	logic->py_raw = NULL;
+	logic->py_channels = NULL;
+	if (!(logic->sample = PyList_New(2))) {
+		Py_DECREF(logic);
+		return NULL;
+	}
+	di->py_logic = logic;
+
+	return logic;
+}
+
 /**
  * Run the specified decoder function.
  *
@@ -539,12 +1220,14 @@ SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di)
  *
  * @since 0.4.0
  */
-SRD_PRIV int srd_inst_decode(const struct srd_decoder_inst *di,
+SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		uint64_t start_samplenum, uint64_t end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
 {
-	PyObject *py_res;
+	PyObject *py_res, *py_attr, *py_ss, *py_es;
 	srd_logic *logic;
+	uint64_t num_samples;
+	int ret;
 
 	/* Return an error upon unusable input. */
 	if (!di) {
@@ -560,7 +1243,8 @@ SRD_PRIV int srd_inst_decode(const struct srd_decoder_inst *di,
 		return SRD_ERR_ARG;
 	}
 
-	((struct srd_decoder_inst *)di)->data_unitsize = unitsize;
+	if (!di->channel_mask || unitsize != (uint64_t)di->data_unitsize)
+		channel_mask_update(di, unitsize);
 
 	srd_dbg("Calling decode(), start sample %" PRIu64 ", end sample %"
 		PRIu64 " (%" PRIu64 " samples, %" PRIu64 " bytes, unitsize = "
@@ -569,29 +1253,92 @@ SRD_PRIV int srd_inst_decode(const struct srd_decoder_inst *di,
 		di->inst_id);
 
 	/*
-	 * Create new srd_logic object. Each iteration around the PD's loop
-	 * will fill one sample into this object.
+	 * Each iteration around the PD's loop will fill one sample into
+	 * this object.
 	 */
-	logic = PyObject_New(srd_logic, (PyTypeObject *)srd_logic_type);
-	Py_INCREF(logic);
-	logic->di = (struct srd_decoder_inst *)di;
+	if (!(logic = logic_get(di))) {
+		srd_exception_catch("Protocol decoder instance %s",
+				di->inst_id);
+		return SRD_ERR_PYTHON;
+	}
 	logic->start_samplenum = start_samplenum;
 	logic->itercnt = 0;
 	logic->inbuf = (uint8_t *)inbuf;
 	logic->inbuflen = inbuflen;
-	logic->sample = PyList_New(2);
-	Py_INCREF(logic->sample);
 
-	Py_IncRef(di->py_inst);
-	if (!(py_res = PyObject_CallMethod(di->py_inst, "decode",
-			"KKO", start_samplenum, end_samplenum, logic))) {
+	/*
+	 * PDs which only care about changes on their channels can set the
+	 * 'transitions_only' attribute (on the class or on the instance),
+	 * which makes the iterator skip unchanged samples in C.
+	 */
+	logic->transitions_only = FALSE;
+	if ((py_attr = PyObject_GetAttrString(di->py_inst, "transitions_only"))) {
+		logic->transitions_only = PyObject_IsTrue(py_attr) == 1;
+		Py_DECREF(py_attr);
+	} else {
+		PyErr_Clear();
+	}
+
+	/* Continue a skip_to()/next_edge() which ran past the last chunk. */
+	logic->seek_done = FALSE;
+	srd_logic_seek_resume(logic);
+
+	ret = SRD_OK;
+	py_ss = PyLong_FromUnsignedLongLong(start_samplenum);
+	py_es = PyLong_FromUnsignedLongLong(end_samplenum);
+	py_res = NULL;
+	if (py_ss && py_es)
+		py_res = srd_inst_decode_call(di, py_ss, py_es,
+				(PyObject *)logic);
+	if (!py_res) {
 		srd_exception_catch("Protocol decoder instance %s",
 				di->inst_id);
-		return SRD_ERR_PYTHON;
+		ret = SRD_ERR_PYTHON;
+	}
+	Py_XDECREF(py_res);
+	Py_XDECREF(py_ss);
+	Py_XDECREF(py_es);
+
+	/* The buffer, and thus any view of it, is only valid until now. */
+	logic->inbuf = NULL;
+	logic->inbuflen = 0;
+	Py_CLEAR(logic->py_raw);
+	Py_CLEAR(logic->py_channels);
+
+	/* Keep the last sample around, to find transitions across chunks. */
+	num_samples = inbuflen / unitsize;
+	di->stats.samples += num_samples;
+	di->stats.chunks++;
+	if (num_samples > 0) {
+		memcpy(di->last_sample, inbuf + (num_samples - 1) * unitsize,
+				unitsize);
+		di->last_sample_valid = TRUE;
 	}
-	Py_DecRef(py_res);
 
-	return SRD_OK;
+	return ret;
+}
+
+/*
+ * Find an instance with the given ID in some stacks, other than 'skip'
+ * and the instances stacked on top of it.
+ */
+static struct srd_decoder_inst *inst_find_other(GSList *stack,
+		const char *inst_id, struct srd_decoder_inst *skip)
+{
+	struct srd_decoder_inst *di, *found;
+	GSList *l;
+
+	for (l = stack; l; l = l->next) {
+		di = l->data;
+		if (di == skip)
+			continue;
+		if (!strcmp(di->inst_id, inst_id))
+			return di;
+		if ((found = inst_find_other(di->next_di, inst_id, skip)))
+			return found;
+	}
+
+	return NULL;
 }
 
 /** @private */
@@ -599,12 +1346,34 @@ SRD_PRIV void srd_inst_free(struct srd_decoder_inst *di)
 {
 	GSList *l;
 	struct srd_pd_output *pdo;
+	struct srd_decoder_inst *other;
 
 	srd_dbg("Freeing instance %s", di->inst_id);
 
+	/* Another instance sharing the ID is found from now on. */
+	if (g_hash_table_lookup(di->sess->di_index, di->inst_id) == di) {
+		g_hash_table_remove(di->sess->di_index, di->inst_id);
+		other = inst_find_other(di->sess->di_list, di->inst_id, di);
+		if (other)
+			g_hash_table_insert(di->sess->di_index,
+					other->inst_id, other);
+	}
+
+	/* The Python object may outlive the instance. */
+	((srd_Decoder *)di->py_inst)->di = NULL;
+	Py_XDECREF(di->py_decode);
+	Py_XDECREF(di->py_decode_batch);
+	Py_XDECREF(di->py_batch);
+	Py_XDECREF(di->py_logic);
+	Py_XDECREF(di->py_profile);
 	Py_DecRef(di->py_inst);
 	g_free(di->inst_id);
+	channel_lookup_free(di);
 	g_free(di->dec_channelmap);
+	g_free(di->channel_samples);
+	g_free(di->channel_mask);
+	g_free(di->last_sample);
+	g_free(di->ann_class_enabled);
 	g_slist_free(di->next_di);
 	for (l = di->pd_output; l; l = l->next) {
 		pdo = l->data;
@@ -612,6 +1381,8 @@ SRD_PRIV void srd_inst_free(struct srd_decoder_inst *di)
 		g_free(pdo);
 	}
 	g_slist_free(di->pd_output);
+	if (di->pd_output_table)
+		g_ptr_array_free(di->pd_output_table, TRUE);
 	g_free(di);
 }
 
@@ -626,6 +1397,10 @@ SRD_PRIV void srd_inst_free_all(struct srd_session *sess, GSList *stack)
 		return;
 	}
 
+	/* None of the instances is found anymore, nor handed the index. */
+	if (!stack)
+		g_hash_table_remove_all(sess->di_index);
+
 	di = NULL;
 	for (l = stack ? stack : sess->di_list; di == NULL && l != NULL; l = l->next) {
 		di = l->data;
@@ -30,44 +30,163 @@
 
 /* Custom Python types: */
 
+typedef struct {
+	PyObject_HEAD
+	/* The instance this object belongs to, NULL once it's freed. */
+	struct srd_decoder_inst *di;
+} srd_Decoder;
+
 typedef struct {
 	PyObject_HEAD
 	struct srd_decoder_inst *di;
 	uint64_t start_samplenum;
-	unsigned int itercnt;
+	uint64_t itercnt;
 	uint8_t *inbuf;
 	uint64_t inbuflen;
 	PyObject *sample;
+	/* Only yield samples where one of the mapped channels changed. */
+	gboolean transitions_only;
+	/* The next sample was sought explicitly, always yield it. */
+	gboolean seek_done;
+	/* Lazily created views of the whole chunk, see raw()/channels(). */
+	PyObject *py_raw;
+	PyObject *py_channels;
 } srd_logic;
 
+/* Number of output types, see enum srd_output_type. */
+#define SRD_OUTPUT_TYPE_COUNT (SRD_OUTPUT_META + 1)
+
+/*
+ * A span of time measured for the performance counters, see
+ * srd_stats_span_begin().
+ */
+struct srd_stats_span {
+	int64_t wall_start;
+	/* -1 if the span's CPU time isn't measured. */
+	int64_t cpu_start;
+	/* Time of the spans nested in the enclosing one so far. */
+	int64_t outer_wall;
+	int64_t outer_cpu;
+};
+
 struct srd_session {
 	int session_id;
 
 	/* List of decoder instances. */
 	GSList *di_list;
 
+	/* All instances in the stack tree by instance ID. */
+	GHashTable *di_index;
+
 	/* List of frontend callbacks to receive decoder output. */
 	GSList *callbacks;
+
+	/* The same callbacks by output type, in order of registration. */
+	GSList *output_callbacks[SRD_OUTPUT_TYPE_COUNT];
+
+	/* Batched annotation delivery, NULL callback if disabled. */
+	srd_pd_output_batch_callback batch_cb;
+	void *batch_cb_data;
+	unsigned int batch_size;
+	unsigned int batch_count;
+	/* The batch's items and annotations, batch_size entries each. */
+	struct srd_proto_data *batch_pdata;
+	struct srd_proto_data_annotation *batch_anns;
+	/* Index of each annotation's first text in batch_texts. */
+	guint *batch_text_idx;
+	/* NULL-terminated text vectors, pointing into batch_strings. */
+	GPtrArray *batch_texts;
+	GStringChunk *batch_strings;
+
+	/* Decode each stack in a worker process, see worker.c. */
+	gboolean use_workers;
+	/* The running workers, one per entry in di_list. NULL if none. */
+	GSList *workers;
+	/* Decoded with srd_session_send_segmented(), no more data allowed. */
+	gboolean segmented;
+
+	/* Chunks queued by srd_session_send_async(), see session.c. */
+	GThread *async_thread;
+	/* Protects the async_* fields below. */
+	GMutex async_mutex;
+	/* Signalled whenever a chunk is queued or was decoded. */
+	GCond async_cond;
+	GQueue *async_queue;
+	/* Bytes of sample data queued, and how many are allowed. */
+	uint64_t async_bytes;
+	uint64_t async_max_bytes;
+	/* Wait for room in the queue, instead of refusing the chunk. */
+	gboolean async_block;
+	/* The decode thread is decoding a chunk. */
+	gboolean async_busy;
+	/* The decode thread exits once the queue is empty. */
+	gboolean async_stop;
+	/* The first error since the last srd_session_wait(). */
+	int async_ret;
+
+	/*
+	 * Time of the spans nested in the one currently measured, which
+	 * isn't counted for the enclosing span. See srd_stats_span_end().
+	 */
+	int64_t stats_nested_wall;
+	int64_t stats_nested_cpu;
+
+	/* The profiler which is enabled now, see srd_inst_profile_start(). */
+	PyObject *py_profile_active;
 };
 
 /* srd.c */
 SRD_PRIV int srd_decoder_searchpath_add(const char *path);
+SRD_PRIV gboolean srd_check_init(void);
+
+/* decoder.c */
+SRD_PRIV int srd_decoder_import(struct srd_decoder *dec);
 
 /* session.c */
 SRD_PRIV int session_is_valid(struct srd_session *sess);
-SRD_PRIV struct srd_pd_callback *srd_pd_output_callback_find(struct srd_session *sess,
+SRD_PRIV void srd_session_async_stop(struct srd_session *sess);
+SRD_PRIV GSList *srd_pd_output_callbacks_get(struct srd_session *sess,
 		int output_type);
+SRD_PRIV void srd_pd_output_callbacks_send(const GSList *callbacks,
+		struct srd_proto_data *pdata);
+SRD_PRIV void srd_pd_output_batch_add(struct srd_session *sess,
+		const struct srd_proto_data *pdata, int ann_class,
+		guint text_idx);
+SRD_PRIV void srd_pd_output_batch_flush(struct srd_session *sess);
 
 /* instance.c */
-SRD_PRIV struct srd_decoder_inst *srd_inst_find_by_obj( const GSList *stack,
-		const PyObject *obj);
 SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di);
-SRD_PRIV int srd_inst_decode(const struct srd_decoder_inst *di,
+SRD_PRIV PyObject *srd_inst_decode_call(struct srd_decoder_inst *di,
+		PyObject *py_ss, PyObject *py_es, PyObject *py_data);
+SRD_PRIV void srd_inst_decode_batch_add(struct srd_decoder_inst *di,
+		PyObject *py_ss, PyObject *py_es, PyObject *py_data);
+SRD_PRIV void srd_inst_decode_batch_flush(struct srd_decoder_inst *di);
+SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		uint64_t start_samplenum, uint64_t end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_PRIV void srd_inst_stats_sum(struct srd_decoder_inst *di,
+		struct srd_inst_stats *stats);
+SRD_PRIV void srd_inst_stats_clear(struct srd_decoder_inst *di);
+SRD_PRIV void srd_stats_span_begin(struct srd_session *sess,
+		struct srd_stats_span *span, gboolean cpu);
+SRD_PRIV void srd_stats_span_end(struct srd_session *sess,
+		struct srd_stats_span *span, uint64_t *wall, uint64_t *cpu);
 SRD_PRIV void srd_inst_free(struct srd_decoder_inst *di);
 SRD_PRIV void srd_inst_free_all(struct srd_session *sess, GSList *stack);
 
+/* worker.c */
+SRD_PRIV int srd_workers_start(struct srd_session *sess);
+SRD_PRIV void srd_workers_stop(struct srd_session *sess);
+SRD_PRIV int srd_workers_send(struct srd_session *sess,
+		uint64_t start_samplenum, uint64_t end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_PRIV int srd_workers_metadata_set(struct srd_session *sess, int key,
+		uint64_t value);
+SRD_PRIV int srd_segments_send(struct srd_session *sess,
+		uint64_t start_samplenum, const uint8_t *inbuf,
+		uint64_t inbuflen, uint64_t unitsize,
+		unsigned int max_segments, gboolean *segmented);
+
 /* log.c */
 #if defined(G_OS_WIN32) && (__GNUC__ > 4 || (__GNUC__ == 4 && __GNUC_MINOR__ >= 4))
 /*
@@ -80,17 +199,33 @@ SRD_PRIV int srd_log(int loglevel, const char *format, ...)
 SRD_PRIV int srd_log(int loglevel, const char *format, ...) G_GNUC_PRINTF(2, 3);
 #endif
 
-#define srd_spew(...)	srd_log(SRD_LOG_SPEW, __VA_ARGS__)
-#define srd_dbg(...)	srd_log(SRD_LOG_DBG,  __VA_ARGS__)
-#define srd_info(...)	srd_log(SRD_LOG_INFO, __VA_ARGS__)
-#define srd_warn(...)	srd_log(SRD_LOG_WARN, __VA_ARGS__)
-#define srd_err(...)	srd_log(SRD_LOG_ERR,  __VA_ARGS__)
+extern SRD_PRIV int srd_cur_loglevel;
+
+/*
+ * Check the loglevel before the arguments are evaluated, so that messages
+ * which aren't shown cost next to nothing.
+ */
+#define srd_log_level(l, ...) \
+	((l) <= srd_cur_loglevel ? srd_log(l, __VA_ARGS__) : SRD_OK)
+
+/* With SRD_DISABLE_SPEW, spew messages are compiled out completely. */
+#ifdef SRD_DISABLE_SPEW
+#define srd_spew(...)	((void)(0 && srd_log(SRD_LOG_SPEW, __VA_ARGS__)))
+#else
+#define srd_spew(...)	srd_log_level(SRD_LOG_SPEW, __VA_ARGS__)
+#endif
+#define srd_dbg(...)	srd_log_level(SRD_LOG_DBG,  __VA_ARGS__)
+#define srd_info(...)	srd_log_level(SRD_LOG_INFO, __VA_ARGS__)
+#define srd_warn(...)	srd_log_level(SRD_LOG_WARN, __VA_ARGS__)
+#define srd_err(...)	srd_log_level(SRD_LOG_ERR,  __VA_ARGS__)
 
 /* type_decoder.c */
+SRD_PRIV void srd_pd_output_python_send(struct srd_proto_data *pdata);
 SRD_PRIV PyObject *srd_Decoder_type_new(void);
 
 /* type_logic.c */
 SRD_PRIV PyObject *srd_logic_type_new(void);
+SRD_PRIV void srd_logic_seek_resume(srd_logic *logic);
 
 /* module_sigrokdecode.c */
 PyMODINIT_FUNC PyInit_sigrokdecode(void);
@@ -124,6 +124,7 @@ enum srd_loglevel {
  *   - expose it to PDs in controller.c:PyInit_sigrokdecode()
  *   - add a check in module_sigrokdecode.c:Decoder_put()
  *   - add a debug string in type_decoder.c:OUTPUT_TYPES
+ *   - update SRD_OUTPUT_TYPE_COUNT in libsigrokdecode-internal.h
  */
 enum srd_output_type {
 	SRD_OUTPUT_ANN,
@@ -179,14 +180,27 @@ struct srd_decoder {
 	 */
 	GSList *binary;
 
+	/**
+	 * The items of the annotations and binary lists, indexed by
+	 * annotation class and binary class respectively.
+	 */
+	GPtrArray *annotation_table;
+	GPtrArray *binary_table;
+
 	/** List of decoder options. */
 	GSList *options;
 
-	/** Python module. */
+	/** Name of the Python module the decoder lives in. */
+	char *module_name;
+
+	/** Python module. NULL until imported if loaded from the cache. */
 	void *py_mod;
 
-	/** sigrokdecode.Decoder class. */
+	/** sigrokdecode.Decoder class. NULL until imported, like py_mod. */
 	void *py_dec;
+
+	/** How long importing the Python module took, in microseconds. */
+	uint64_t import_time;
 };
 
 /**
@@ -217,17 +231,93 @@ struct srd_decoder_annotation_row {
 	GSList *ann_classes;
 };
 
+/** Performance counters of a decoder instance, see srd_inst_stats_get(). */
+struct srd_inst_stats {
+	/** Number of decode() and decode_batch() calls. */
+	uint64_t decode_calls;
+	/**
+	 * Wall clock and CPU time spent in decode() and decode_batch(), in
+	 * nanoseconds. This doesn't include the time spent in the instances
+	 * stacked on top, and in the frontend callbacks.
+	 */
+	uint64_t decode_time;
+	uint64_t decode_cpu_time;
+	/** Number of samples and chunks of sample data passed to decode(). */
+	uint64_t samples;
+	uint64_t chunks;
+	/** Number of put() calls, indexed by output type. */
+	uint64_t put_calls[SRD_OUTPUT_META + 1];
+	/**
+	 * Number of annotations passed to the frontend's output callbacks
+	 * or batch callback.
+	 */
+	uint64_t annotations;
+	/** Number of bytes of binary output passed to the output callbacks. */
+	uint64_t binary_bytes;
+	/** Wall clock time spent in frontend callbacks, in nanoseconds. */
+	uint64_t callback_time;
+};
+
 struct srd_decoder_inst {
 	struct srd_decoder *decoder;
 	struct srd_session *sess;
 	void *py_inst;
+	/** The instance's bound decode() method, set by srd_inst_start(). */
+	void *py_decode;
+	/** The bound decode_batch() method, NULL if the PD has none. */
+	void *py_decode_batch;
+	/** OUTPUT_PYTHON packets (ss, es, data) waiting for decode_batch(). */
+	void *py_batch;
+	/** The sample iterator passed to decode(), reused for every chunk. */
+	void *py_logic;
 	char *inst_id;
 	GSList *pd_output;
+	/** The items of pd_output, indexed by output ID. */
+	GPtrArray *pd_output_table;
 	int dec_num_channels;
 	int *dec_channelmap;
 	int data_unitsize;
 	uint8_t *channel_samples;
 	GSList *next_di;
+
+	/**
+	 * Byte offset (-1 for unused optional channels) and bit mask of
+	 * every decoder channel within a sample, derived from the map.
+	 */
+	int *channel_byte_offsets;
+	uint8_t *channel_bit_masks;
+
+	/**
+	 * Cache of the immutable per-sample channel value objects handed
+	 * to the PD, indexed by the channel bits of a sample. NULL if the
+	 * decoder has too many channels to cache all patterns.
+	 */
+	void **pins_cache;
+
+	/** Bit mask of the mapped channels, data_unitsize bytes. */
+	uint8_t *channel_mask;
+
+	/** Last sample of the previous chunk, data_unitsize bytes. */
+	uint8_t *last_sample;
+	gboolean last_sample_valid;
+
+	/** Pending skip_to() target, carried over to the next chunk. */
+	uint64_t seek_samplenum;
+	/** Pending next_edge() search ('r', 'f', 'e', or 0 for none). */
+	char seek_edge;
+	int seek_channel;
+
+	/**
+	 * Whether each annotation class is wanted by the frontend, indexed
+	 * by class. NULL if all of them are.
+	 */
+	gboolean *ann_class_enabled;
+
+	/** Performance counters, see srd_inst_stats_get(). */
+	struct srd_inst_stats stats;
+
+	/** cProfile.Profile object, see srd_inst_profile_start(). */
+	void *py_profile;
 };
 
 struct srd_pd_output {
@@ -254,12 +344,19 @@ struct srd_proto_data_annotation {
 struct srd_proto_data_binary {
 	int bin_class;
 	uint64_t size;
+	/**
+	 * The PD's data. This is not a copy, it is only valid while the
+	 * output callback runs.
+	 */
 	const unsigned char *data;
 };
 
 typedef void (*srd_pd_output_callback)(struct srd_proto_data *pdata,
 					void *cb_data);
 
+typedef void (*srd_pd_output_batch_callback)(struct srd_proto_data *pdata,
+		unsigned int num_items, void *cb_data);
+
 struct srd_pd_callback {
 	int output_type;
 	srd_pd_output_callback cb;
@@ -273,14 +370,35 @@ SRD_API int srd_exit(void);
 /* session.c */
 SRD_API int srd_session_new(struct srd_session **sess);
 SRD_API int srd_session_start(struct srd_session *sess);
+SRD_API int srd_session_workers_set(struct srd_session *sess,
+		gboolean enable);
 SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 		GVariant *data);
 SRD_API int srd_session_send(struct srd_session *sess,
 		uint64_t start_samplenum, uint64_t end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_API int srd_session_send_segmented(struct srd_session *sess,
+		uint64_t start_samplenum, const uint8_t *inbuf,
+		uint64_t inbuflen, uint64_t unitsize,
+		unsigned int max_segments);
+SRD_API int srd_session_send_file(struct srd_session *sess,
+		const char *filename, uint64_t start_samplenum,
+		uint64_t unitsize, uint64_t chunk_size);
+SRD_API int srd_session_async_set(struct srd_session *sess,
+		uint64_t max_bytes, gboolean block);
+SRD_API int srd_session_send_async(struct srd_session *sess,
+		uint64_t start_samplenum, uint64_t end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_API int srd_session_wait(struct srd_session *sess);
 SRD_API int srd_session_destroy(struct srd_session *sess);
 SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 		int output_type, srd_pd_output_callback cb, void *cb_data);
+SRD_API int srd_pd_output_batch_callback_set(struct srd_session *sess,
+		unsigned int batch_size, srd_pd_output_batch_callback cb,
+		void *cb_data);
+SRD_API int srd_session_stats_get(struct srd_session *sess,
+		struct srd_inst_stats *stats);
+SRD_API int srd_session_stats_reset(struct srd_session *sess);
 
 /* decoder.c */
 SRD_API const GSList *srd_decoder_list(void);
@@ -290,18 +408,32 @@ SRD_API char *srd_decoder_doc_get(const struct srd_decoder *dec);
 SRD_API int srd_decoder_unload(struct srd_decoder *dec);
 SRD_API int srd_decoder_load_all(void);
 SRD_API int srd_decoder_unload_all(void);
+SRD_API int srd_decoder_cache_set(const char *path);
+SRD_API int srd_decoder_lazy_load_set(gboolean lazy);
+SRD_API int srd_decoder_import_time_get(const struct srd_decoder *dec,
+		uint64_t *usecs);
 
 /* instance.c */
 SRD_API int srd_inst_option_set(struct srd_decoder_inst *di,
 		GHashTable *options);
 SRD_API int srd_inst_channel_set_all(struct srd_decoder_inst *di,
 		GHashTable *channels);
+SRD_API int srd_inst_ann_class_enable_set(struct srd_decoder_inst *di,
+		int ann_class, gboolean enable);
+SRD_API int srd_inst_ann_row_enable_set(struct srd_decoder_inst *di,
+		const char *row_id, gboolean enable);
 SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 		const char *id, GHashTable *options);
 SRD_API int srd_inst_stack(struct srd_session *sess,
 		struct srd_decoder_inst *di_from, struct srd_decoder_inst *di_to);
 SRD_API struct srd_decoder_inst *srd_inst_find_by_id(struct srd_session *sess,
 		const char *inst_id);
+SRD_API int srd_inst_stats_get(struct srd_decoder_inst *di,
+		struct srd_inst_stats *stats);
+SRD_API int srd_inst_stats_reset(struct srd_decoder_inst *di);
+SRD_API int srd_inst_profile_start(struct srd_decoder_inst *di);
+SRD_API int srd_inst_profile_stop(struct srd_decoder_inst *di,
+		const char *filename);
 
 /* log.c */
 typedef int (*srd_log_callback)(void *cb_data, int loglevel,
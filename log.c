@@ -39,8 +39,15 @@
  * @{
  */
 
-/* Currently selected libsigrokdecode loglevel. Default: SRD_LOG_WARN. */
-static int cur_loglevel = SRD_LOG_WARN; /* Show errors+warnings per default. */
+/** @cond PRIVATE */
+
+/*
+ * Currently selected libsigrokdecode loglevel. Default: SRD_LOG_WARN.
+ * The log macros check it before evaluating any of their arguments.
+ */
+SRD_PRIV int srd_cur_loglevel = SRD_LOG_WARN; /* Show errors+warnings per default. */
+
+/** @endcond */
 
 /* Function prototype. */
 static int srd_logv(void *cb_data, int loglevel, const char *format,
@@ -62,6 +69,9 @@ static void *srd_log_cb_data = NULL;
  * and so on) libsigrokdecode will output. Using SRD_LOG_NONE disables all
  * messages.
  *
+ * Messages above the loglevel are not passed to the log callback either,
+ * and cost next to nothing.
+ *
  * Note that this function itself will also output log messages. After the
  * loglevel has changed, it will output a debug message with SRD_LOG_DBG for
  * example. Whether this message is shown depends on the (new) loglevel.
@@ -80,7 +90,7 @@ SRD_API int srd_log_loglevel_set(int loglevel)
 		return SRD_ERR_ARG;
 	}
 
-	cur_loglevel = loglevel;
+	srd_cur_loglevel = loglevel;
 
 	srd_dbg("libsigrokdecode loglevel set to %d.", loglevel);
 
@@ -96,12 +106,16 @@ SRD_API int srd_log_loglevel_set(int loglevel)
  */
 SRD_API int srd_log_loglevel_get(void)
 {
-	return cur_loglevel;
+	return srd_cur_loglevel;
 }
 
 /**
  * Set the libsigrokdecode log callback to the specified function.
  *
+ * The callback is only called for messages of at most the current
+ * loglevel, see srd_log_loglevel_set(). Before version 0.5.0 it was called
+ * for all messages, and had to do the filtering itself.
+ *
  * @param cb Function pointer to the log callback function to use.
  *           Must not be NULL.
  * @param cb_data Pointer to private data to be passed on. This can be used
@@ -158,7 +172,7 @@ static int srd_logv(void *cb_data, int loglevel, const char *format,
 	(void)cb_data;
 
 	/* Only output messages of at least the selected loglevel(s). */
-	if (loglevel > cur_loglevel)
+	if (loglevel > srd_cur_loglevel)
 		return SRD_OK;
 
 	if (fputs("srd: ", stderr) < 0
@@ -175,6 +189,10 @@ SRD_PRIV int srd_log(int loglevel, const char *format, ...)
 	int ret;
 	va_list args;
 
+	/* Only output messages of at least the selected loglevel(s). */
+	if (loglevel > srd_cur_loglevel)
+		return SRD_OK;
+
 	va_start(args, format);
 	ret = srd_log_cb(srd_log_cb_data, loglevel, format, args);
 	va_end(args);
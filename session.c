@@ -22,7 +22,15 @@
 #include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
 #include <inttypes.h>
+#include <string.h>
 #include <glib.h>
+#ifdef G_OS_UNIX
+#include <errno.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
 
 /**
  * @file
@@ -43,6 +51,23 @@
 SRD_PRIV GSList *sessions = NULL;
 SRD_PRIV int max_session_id = -1;
 
+/* Default limit of the sample data queued by srd_session_send_async(). */
+#define ASYNC_MAX_BYTES		(64 * 1024 * 1024)
+
+/* Default size of the chunks srd_session_send_file() decodes at a time. */
+#define FILE_CHUNK_BYTES	(4 * 1024 * 1024)
+
+/* How much of a file srd_session_send_file() maps at a time. */
+#define FILE_WINDOW_BYTES	(256 * 1024 * 1024)
+
+/* A chunk queued by srd_session_send_async(), its samples follow. */
+struct async_chunk {
+	uint64_t start_samplenum;
+	uint64_t end_samplenum;
+	uint64_t inbuflen;
+	uint64_t unitsize;
+};
+
 /** @endcond */
 
 /** @private */
@@ -70,24 +95,46 @@ SRD_PRIV int session_is_valid(struct srd_session *sess)
  */
 SRD_API int srd_session_new(struct srd_session **sess)
 {
+	PyGILState_STATE gstate;
+
+	if (!srd_check_init())
+		return SRD_ERR;
 
 	if (!sess) {
 		srd_err("Invalid session pointer.");
 		return SRD_ERR_ARG;
 	}
 
-	*sess = g_malloc(sizeof(struct srd_session));
+	*sess = g_malloc0(sizeof(struct srd_session));
+	(*sess)->di_index = g_hash_table_new(g_str_hash, g_str_equal);
+	g_mutex_init(&(*sess)->async_mutex);
+	g_cond_init(&(*sess)->async_cond);
+	(*sess)->async_queue = g_queue_new();
+	(*sess)->async_max_bytes = ASYNC_MAX_BYTES;
+	(*sess)->async_block = TRUE;
+
+	/* The list of sessions is protected by the GIL. */
+	gstate = PyGILState_Ensure();
 	(*sess)->session_id = ++max_session_id;
-	(*sess)->di_list = (*sess)->callbacks = NULL;
 
 	/* Keep a list of all sessions, so we can clean up as needed. */
 	sessions = g_slist_append(sessions, *sess);
+	PyGILState_Release(gstate);
 
 	srd_dbg("Created session %d.", (*sess)->session_id);
 
 	return SRD_OK;
 }
 
+/* Wait until all chunks queued by srd_session_send_async() were decoded. */
+static void async_drain(struct srd_session *sess)
+{
+	g_mutex_lock(&sess->async_mutex);
+	while (!g_queue_is_empty(sess->async_queue) || sess->async_busy)
+		g_cond_wait(&sess->async_cond, &sess->async_mutex);
+	g_mutex_unlock(&sess->async_mutex);
+}
+
 /**
  * Start a decoding session.
  *
@@ -104,6 +151,7 @@ SRD_API int srd_session_start(struct srd_session *sess)
 {
 	GSList *d;
 	struct srd_decoder_inst *di;
+	PyGILState_STATE gstate;
 	int ret;
 
 	if (session_is_valid(sess) != SRD_OK) {
@@ -113,17 +161,72 @@ SRD_API int srd_session_start(struct srd_session *sess)
 
 	srd_dbg("Calling start() on all instances in session %d.", sess->session_id);
 
+	async_drain(sess);
+
 	/* Run the start() method on all decoders receiving frontend data. */
 	ret = SRD_OK;
+	gstate = PyGILState_Ensure();
 	for (d = sess->di_list; d; d = d->next) {
 		di = d->data;
 		if ((ret = srd_inst_start(di)) != SRD_OK)
 			break;
 	}
 
+	/* Workers are forked from the started instances. */
+	srd_workers_stop(sess);
+	if (ret == SRD_OK)
+		ret = srd_workers_start(sess);
+	PyGILState_Release(gstate);
+
 	return ret;
 }
 
+/**
+ * Decode each of a session's stacks in a worker process of its own.
+ *
+ * When enabled, srd_session_start() forks a worker process for each
+ * bottom-level decoder instance in the session, which decodes the stack
+ * on top of it. The stacks are decoded at the same time, and their output
+ * is passed to the frontend callbacks in the same order as when they are
+ * decoded in-process, one stack after the other.
+ *
+ * The session's instances, stacks, callbacks and annotation filters must
+ * be set up before srd_session_start() is called. Changes made later
+ * don't reach the worker processes. Sessions with callbacks for
+ * SRD_OUTPUT_PYTHON, or with a single stack, decode in-process.
+ *
+ * This is only available on platforms that have fork(). The workers are
+ * forked from the thread calling srd_session_start(), so no other thread
+ * may use libsigrokdecode at that time. While any session is decoding
+ * chunks queued by srd_session_send_async(), the session decodes
+ * in-process.
+ *
+ * @param sess The session.
+ * @param enable TRUE to use worker processes, FALSE to decode in-process.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_session_workers_set(struct srd_session *sess,
+		gboolean enable)
+{
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	if (sess->workers) {
+		srd_err("Session %d already started its workers.",
+			sess->session_id);
+		return SRD_ERR;
+	}
+
+	sess->use_workers = enable;
+
+	return SRD_OK;
+}
+
 static int srd_inst_send_meta(struct srd_decoder_inst *di, int key,
 		GVariant *data)
 {
@@ -170,6 +273,7 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 		GVariant *data)
 {
 	GSList *l;
+	PyGILState_STATE gstate;
 	int ret;
 
 	if (session_is_valid(sess) != SRD_OK) {
@@ -202,17 +306,69 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 	srd_dbg("Setting session %d samplerate to %"PRIu64".",
 			sess->session_id, g_variant_get_uint64(data));
 
+	/* Chunks queued before still decode with the old value. */
+	async_drain(sess);
+
 	ret = SRD_OK;
+	gstate = PyGILState_Ensure();
 	for (l = sess->di_list; l; l = l->next) {
 		if ((ret = srd_inst_send_meta(l->data, key, data)) != SRD_OK)
 			break;
 	}
+	if (ret == SRD_OK && sess->workers)
+		ret = srd_workers_metadata_set(sess, key,
+				g_variant_get_uint64(data));
+	PyGILState_Release(gstate);
 
 	g_variant_unref(data);
 
 	return ret;
 }
 
+/* Decode a chunk in all of a session's stacks. The GIL must be held. */
+static int session_send(struct srd_session *sess,
+		uint64_t start_samplenum, uint64_t end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	GSList *d;
+	int ret;
+
+	if (sess->workers)
+		return srd_workers_send(sess, start_samplenum, end_samplenum,
+				inbuf, inbuflen, unitsize);
+
+	ret = SRD_OK;
+	for (d = sess->di_list; d; d = d->next) {
+		ret = srd_inst_decode(d->data, start_samplenum, end_samplenum,
+				inbuf, inbuflen, unitsize);
+		/* The stack is done with this chunk, batched input or not. */
+		srd_inst_decode_batch_flush(d->data);
+		if (ret != SRD_OK)
+			break;
+	}
+
+	return ret;
+}
+
+/* Decode a chunk, and hand out the batched annotations. */
+static int session_send_chunk(struct srd_session *sess,
+		uint64_t start_samplenum, uint64_t end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	PyGILState_STATE gstate;
+	int ret;
+
+	gstate = PyGILState_Ensure();
+	ret = session_send(sess, start_samplenum, end_samplenum, inbuf,
+			inbuflen, unitsize);
+
+	/* Hand out whatever was batched up while decoding this chunk. */
+	srd_pd_output_batch_flush(sess);
+	PyGILState_Release(gstate);
+
+	return ret;
+}
+
 /**
  * Send a chunk of logic sample data to a running decoder session.
  *
@@ -238,8 +394,72 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 SRD_API int srd_session_send(struct srd_session *sess,
 		uint64_t start_samplenum, uint64_t end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	if (sess->segmented) {
+		srd_err("Session %d was decoded in segments, it can't "
+			"decode more data.", sess->session_id);
+		return SRD_ERR;
+	}
+
+	/* Chunks queued before go first. */
+	async_drain(sess);
+
+	return session_send_chunk(sess, start_samplenum, end_samplenum,
+			inbuf, inbuflen, unitsize);
+}
+
+/**
+ * Decode a complete capture in segments, at the same time.
+ *
+ * The capture is split where all bottom-level decoders are known to be
+ * back in their initial state. Decoders declare when this is the case
+ * with a resync() method, which returns a tuple (num_samples, levels):
+ * once none of the decoder's channels changed for num_samples samples,
+ * and each of them is at the level given in 'levels' (0, 1, or None for
+ * any level), the decoder is in the state it started in.
+ *
+ * Each segment is decoded in a worker process of its own, starting a
+ * little before the split so the decoders see some idle time. Output of
+ * the bottom-level decoders is passed to the frontend callbacks, and to
+ * the stacked decoders which run in the frontend process, segment by
+ * segment in sample order. Decoding in segments is only possible where
+ * fork() is available. If it isn't, or if any bottom-level decoder can't
+ * tell where it resyncs, the capture is decoded in-process as if passed
+ * to srd_session_send(). The same goes while any session is decoding
+ * chunks queued by srd_session_send_async(): the workers are forked from
+ * the calling thread, and no other thread may use libsigrokdecode at
+ * that time.
+ *
+ * The segments start out from the decoders' state at the time of the
+ * call. This is meant for sessions which didn't decode any data yet, and
+ * once the capture was decoded in segments, the session can't decode
+ * more data.
+ *
+ * @param sess The session to use.
+ * @param start_samplenum The sample number of the first sample in inbuf.
+ * @param inbuf Pointer to the sample data of the complete capture.
+ * @param inbuflen Length in bytes of the buffer.
+ * @param unitsize The number of bytes per sample.
+ * @param max_segments The maximum number of segments to decode at the
+ *                     same time. 0 uses one per online CPU.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_session_send_segmented(struct srd_session *sess,
+		uint64_t start_samplenum, const uint8_t *inbuf,
+		uint64_t inbuflen, uint64_t unitsize,
+		unsigned int max_segments)
 {
 	GSList *d;
+	PyGILState_STATE gstate;
+	gboolean segmented;
 	int ret;
 
 	if (session_is_valid(sess) != SRD_OK) {
@@ -247,15 +467,450 @@ SRD_API int srd_session_send(struct srd_session *sess,
 		return SRD_ERR_ARG;
 	}
 
-	for (d = sess->di_list; d; d = d->next) {
-		if ((ret = srd_inst_decode(d->data, start_samplenum,
-				end_samplenum, inbuf, inbuflen, unitsize)) != SRD_OK)
-			return ret;
+	if (!inbuf || unitsize == 0) {
+		srd_err("Invalid sample data.");
+		return SRD_ERR_ARG;
+	}
+
+	if (sess->segmented) {
+		srd_err("Session %d was decoded in segments, it can't "
+			"decode more data.", sess->session_id);
+		return SRD_ERR;
+	}
+
+	async_drain(sess);
+
+	gstate = PyGILState_Ensure();
+	ret = srd_segments_send(sess, start_samplenum, inbuf, inbuflen,
+			unitsize, max_segments, &segmented);
+	if (segmented) {
+		sess->segmented = TRUE;
+		for (d = sess->di_list; d; d = d->next)
+			srd_inst_decode_batch_flush(d->data);
+	} else if (ret == SRD_OK) {
+		ret = session_send(sess, start_samplenum,
+				start_samplenum + inbuflen / unitsize, inbuf,
+				inbuflen, unitsize);
+	}
+	srd_pd_output_batch_flush(sess);
+	PyGILState_Release(gstate);
+
+	return ret;
+}
+
+#ifdef G_OS_UNIX
+
+/*
+ * Decode a file through windows mapped one after the other, so it needn't
+ * fit into the address space as a whole. Every window holds at least one
+ * chunk, a sample cut off at the end of a window goes into the next one.
+ */
+static int send_file(struct srd_session *sess, const char *filename,
+		uint64_t start_samplenum, uint64_t unitsize,
+		uint64_t chunk_size)
+{
+	struct stat st;
+	uint8_t *map;
+	uint64_t page_size, samplenum, pos, end, map_start, map_len;
+	uint64_t len, next;
+	int fd, ret;
+
+	if ((fd = open(filename, O_RDONLY)) < 0) {
+		srd_err("Failed to open %s: %s.", filename, g_strerror(errno));
+		return SRD_ERR;
+	}
+	if (fstat(fd, &st) < 0) {
+		srd_err("Failed to stat %s: %s.", filename, g_strerror(errno));
+		close(fd);
+		return SRD_ERR;
+	}
+
+	/* A trailing partial sample is left alone. */
+	end = (uint64_t)st.st_size / unitsize * unitsize;
+	if (start_samplenum > end / unitsize) {
+		srd_err("Sample %" PRIu64 " is beyond the end of %s.",
+			start_samplenum, filename);
+		close(fd);
+		return SRD_ERR_ARG;
+	}
+
+	page_size = sysconf(_SC_PAGESIZE);
+	samplenum = start_samplenum;
+	pos = start_samplenum * unitsize;
+	ret = SRD_OK;
+	while (pos < end && ret == SRD_OK) {
+		map_start = pos - pos % page_size;
+		map_len = MAX(FILE_WINDOW_BYTES, pos - map_start + chunk_size);
+		map_len = MIN(map_len, end - map_start);
+		map = mmap(NULL, map_len, PROT_READ, MAP_SHARED, fd,
+				(off_t)map_start);
+		if (map == MAP_FAILED) {
+			srd_err("Failed to map %s: %s.", filename,
+				g_strerror(errno));
+			ret = SRD_ERR;
+			break;
+		}
+		/*
+		 * Have the kernel read ahead. This doesn't drop what was
+		 * decoded, the window is unmapped as a whole when done.
+		 */
+		posix_madvise(map, map_len, POSIX_MADV_SEQUENTIAL);
+
+		while (ret == SRD_OK) {
+			len = MIN(chunk_size, map_start + map_len - pos);
+			len -= len % unitsize;
+			if (len == 0)
+				break;
+			/* Page in the next chunk while this one is decoded. */
+			next = pos + len - map_start;
+			if (next < map_len) {
+				next -= next % page_size;
+				posix_madvise(map + next,
+					MIN(chunk_size + page_size,
+					map_len - next), POSIX_MADV_WILLNEED);
+			}
+			ret = session_send_chunk(sess, samplenum,
+					samplenum + len / unitsize,
+					map + (pos - map_start), len, unitsize);
+			pos += len;
+			samplenum += len / unitsize;
+		}
+		munmap(map, map_len);
+	}
+	close(fd);
+
+	return ret;
+}
+
+#else
+
+/* Without mmap(), GLib maps the whole file, and can't be advised. */
+static int send_file(struct srd_session *sess, const char *filename,
+		uint64_t start_samplenum, uint64_t unitsize,
+		uint64_t chunk_size)
+{
+	GMappedFile *file;
+	GError *error;
+	const uint8_t *data;
+	uint64_t samplenum, pos, end, len;
+	int ret;
+
+	error = NULL;
+	if (!(file = g_mapped_file_new(filename, FALSE, &error))) {
+		srd_err("Failed to map %s: %s.", filename, error->message);
+		g_error_free(error);
+		return SRD_ERR;
+	}
+
+	/* A trailing partial sample is left alone. */
+	end = g_mapped_file_get_length(file) / unitsize * unitsize;
+	if (start_samplenum > end / unitsize) {
+		srd_err("Sample %" PRIu64 " is beyond the end of %s.",
+			start_samplenum, filename);
+		g_mapped_file_unref(file);
+		return SRD_ERR_ARG;
+	}
+
+	data = (const uint8_t *)g_mapped_file_get_contents(file);
+	samplenum = start_samplenum;
+	ret = SRD_OK;
+	for (pos = start_samplenum * unitsize; pos < end && ret == SRD_OK;
+			pos += len) {
+		len = MIN(chunk_size, end - pos);
+		ret = session_send_chunk(sess, samplenum,
+				samplenum + len / unitsize, data + pos, len,
+				unitsize);
+		samplenum += len / unitsize;
+	}
+	g_mapped_file_unref(file);
+
+	return ret;
+}
+
+#endif
+
+/**
+ * Decode a capture file of raw sample data.
+ *
+ * The file holds nothing but samples of 'unitsize' bytes each, laid out
+ * like the sample data passed to srd_session_send(). Samples are numbered
+ * by their position in the file. The file is mapped into memory and
+ * decoded in chunks straight from the mapping, without copying it into
+ * a buffer of the frontend's first. Where mmap() is available, the file
+ * is mapped a window at a time, and the kernel is advised to read ahead,
+ * so files larger than the available memory can be decoded.
+ *
+ * Decoding stops at the end of the file, a trailing partial sample is
+ * ignored. The file must not be truncated while it is decoded, accessing
+ * the mapping beyond the new end raises SIGBUS.
+ *
+ * @param sess The session to use.
+ * @param filename The name of the file.
+ * @param start_samplenum The number of the first sample to decode, the
+ *                        samples before it are skipped.
+ * @param unitsize The number of bytes per sample.
+ * @param chunk_size The number of bytes to decode at a time, rounded down
+ *                   to whole samples. 0 uses a default of 4 MiB.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_session_send_file(struct srd_session *sess,
+		const char *filename, uint64_t start_samplenum,
+		uint64_t unitsize, uint64_t chunk_size)
+{
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	if (!filename || unitsize == 0) {
+		srd_err("Invalid sample data.");
+		return SRD_ERR_ARG;
+	}
+
+	if (sess->segmented) {
+		srd_err("Session %d was decoded in segments, it can't "
+			"decode more data.", sess->session_id);
+		return SRD_ERR;
+	}
+
+	if (chunk_size == 0)
+		chunk_size = FILE_CHUNK_BYTES;
+	chunk_size = MAX(chunk_size / unitsize, 1) * unitsize;
+
+	/* Chunks queued before go first. */
+	async_drain(sess);
+
+	return send_file(sess, filename, start_samplenum, unitsize,
+			chunk_size);
+}
+
+/* Decode the chunks queued by srd_session_send_async(), in order. */
+static gpointer async_thread_main(gpointer data)
+{
+	struct srd_session *sess;
+	struct async_chunk *chunk;
+	int ret;
+
+	sess = data;
+	g_mutex_lock(&sess->async_mutex);
+	while (TRUE) {
+		while (g_queue_is_empty(sess->async_queue) && !sess->async_stop)
+			g_cond_wait(&sess->async_cond, &sess->async_mutex);
+		if (!(chunk = g_queue_pop_head(sess->async_queue)))
+			break;
+		sess->async_busy = TRUE;
+		g_mutex_unlock(&sess->async_mutex);
+
+		ret = session_send_chunk(sess, chunk->start_samplenum,
+				chunk->end_samplenum, (const uint8_t *)(chunk + 1),
+				chunk->inbuflen, chunk->unitsize);
+
+		g_mutex_lock(&sess->async_mutex);
+		sess->async_bytes -= chunk->inbuflen;
+		sess->async_busy = FALSE;
+		if (sess->async_ret == SRD_OK)
+			sess->async_ret = ret;
+		g_cond_broadcast(&sess->async_cond);
+		g_free(chunk);
+	}
+	g_mutex_unlock(&sess->async_mutex);
+
+	return NULL;
+}
+
+/**
+ * Stop a session's decode thread, if any, once it decoded the queued
+ * chunks.
+ *
+ * The thread needs the GIL to decode, so this must be called without it.
+ *
+ * @param sess The session.
+ *
+ * @private
+ */
+SRD_PRIV void srd_session_async_stop(struct srd_session *sess)
+{
+	if (!sess->async_thread)
+		return;
+
+	g_mutex_lock(&sess->async_mutex);
+	sess->async_stop = TRUE;
+	g_cond_broadcast(&sess->async_cond);
+	g_mutex_unlock(&sess->async_mutex);
+	g_thread_join(sess->async_thread);
+	sess->async_thread = NULL;
+}
+
+/**
+ * Set how much sample data srd_session_send_async() may queue.
+ *
+ * Once the queued chunks hold 'max_bytes' bytes of sample data, another
+ * chunk is only queued when there is room for it. A chunk larger than
+ * 'max_bytes' is queued once the queue is empty.
+ *
+ * The default is 64 MiB, waiting for room.
+ *
+ * @param sess The session.
+ * @param max_bytes The maximum number of bytes queued. 0 for no limit.
+ * @param block If TRUE, srd_session_send_async() waits until there is
+ *              room in the queue. If FALSE, it fails with SRD_ERR.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_session_async_set(struct srd_session *sess,
+		uint64_t max_bytes, gboolean block)
+{
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
 	}
 
+	g_mutex_lock(&sess->async_mutex);
+	sess->async_max_bytes = max_bytes;
+	sess->async_block = block;
+	/* Waiting senders may fit now. */
+	g_cond_broadcast(&sess->async_cond);
+	g_mutex_unlock(&sess->async_mutex);
+
 	return SRD_OK;
 }
 
+/**
+ * Queue a chunk of logic sample data for decoding in the background.
+ *
+ * This is srd_session_send() for frontends which acquire data while it
+ * is decoded. The chunk is copied to a queue, so the frontend can reuse
+ * its buffer right away, and decoded by a thread of the session. Chunks
+ * are decoded in the order they were queued, and the output callbacks
+ * are called from that thread.
+ *
+ * How much data can be queued is set with srd_session_async_set(). Use
+ * srd_session_wait() to wait until all queued chunks were decoded, and
+ * get their result. srd_session_send(), srd_session_metadata_set(),
+ * srd_session_start() and srd_session_destroy() wait for the queued
+ * chunks first. Instances and callbacks must not be changed while chunks
+ * are queued.
+ *
+ * @param sess The session to use.
+ * @param start_samplenum The sample number of the first sample in this chunk.
+ * @param end_samplenum The sample number of the last sample in this chunk.
+ * @param inbuf Pointer to sample data.
+ * @param inbuflen Length in bytes of the buffer.
+ * @param unitsize The number of bytes per sample.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise. This
+ *         only covers queueing the chunk, see srd_session_wait().
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_session_send_async(struct srd_session *sess,
+		uint64_t start_samplenum, uint64_t end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	struct async_chunk *chunk;
+	char *name;
+
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	if (!inbuf || inbuflen == 0 || unitsize == 0) {
+		srd_err("Invalid sample data.");
+		return SRD_ERR_ARG;
+	}
+
+	if (sess->segmented) {
+		srd_err("Session %d was decoded in segments, it can't "
+			"decode more data.", sess->session_id);
+		return SRD_ERR;
+	}
+
+	chunk = g_malloc(sizeof(struct async_chunk) + inbuflen);
+	chunk->start_samplenum = start_samplenum;
+	chunk->end_samplenum = end_samplenum;
+	chunk->inbuflen = inbuflen;
+	chunk->unitsize = unitsize;
+	memcpy(chunk + 1, inbuf, inbuflen);
+
+	g_mutex_lock(&sess->async_mutex);
+	while (sess->async_max_bytes && !g_queue_is_empty(sess->async_queue)
+			&& sess->async_bytes + inbuflen > sess->async_max_bytes) {
+		if (!sess->async_block) {
+			g_mutex_unlock(&sess->async_mutex);
+			g_free(chunk);
+			srd_dbg("Session %d decode queue is full.",
+				sess->session_id);
+			return SRD_ERR;
+		}
+		g_cond_wait(&sess->async_cond, &sess->async_mutex);
+	}
+	g_queue_push_tail(sess->async_queue, chunk);
+	sess->async_bytes += inbuflen;
+	if (!sess->async_thread) {
+		name = g_strdup_printf("srd-session-%d", sess->session_id);
+		sess->async_thread = g_thread_new(name, async_thread_main, sess);
+		g_free(name);
+	}
+	g_cond_broadcast(&sess->async_cond);
+	g_mutex_unlock(&sess->async_mutex);
+
+	return SRD_OK;
+}
+
+/**
+ * Wait until all chunks queued by srd_session_send_async() were decoded.
+ *
+ * @param sess The session.
+ *
+ * @return SRD_OK if all chunks queued since the last call were decoded
+ *         successfully, otherwise the error code of the first one that
+ *         failed.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_session_wait(struct srd_session *sess)
+{
+	int ret;
+
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	async_drain(sess);
+	g_mutex_lock(&sess->async_mutex);
+	ret = sess->async_ret;
+	sess->async_ret = SRD_OK;
+	g_mutex_unlock(&sess->async_mutex);
+
+	return ret;
+}
+
+static void batch_free(struct srd_session *sess)
+{
+	g_free(sess->batch_pdata);
+	sess->batch_pdata = NULL;
+	g_free(sess->batch_anns);
+	sess->batch_anns = NULL;
+	g_free(sess->batch_text_idx);
+	sess->batch_text_idx = NULL;
+	if (sess->batch_texts) {
+		g_ptr_array_free(sess->batch_texts, TRUE);
+		sess->batch_texts = NULL;
+	}
+	if (sess->batch_strings) {
+		g_string_chunk_free(sess->batch_strings);
+		sess->batch_strings = NULL;
+	}
+	sess->batch_count = sess->batch_size = 0;
+}
+
 /**
  * Destroy a decoding session.
  *
@@ -269,19 +924,33 @@ SRD_API int srd_session_send(struct srd_session *sess,
  */
 SRD_API int srd_session_destroy(struct srd_session *sess)
 {
-	int session_id;
+	PyGILState_STATE gstate;
+	int session_id, i;
 
 	if (!sess) {
 		srd_err("Invalid session.");
 		return SRD_ERR_ARG;
 	}
 
+	srd_session_async_stop(sess);
+
+	gstate = PyGILState_Ensure();
 	session_id = sess->session_id;
+	srd_workers_stop(sess);
 	if (sess->di_list)
 		srd_inst_free_all(sess, NULL);
+	sessions = g_slist_remove(sessions, sess);
+	PyGILState_Release(gstate);
+
+	for (i = 0; i < SRD_OUTPUT_TYPE_COUNT; i++)
+		g_slist_free(sess->output_callbacks[i]);
+	batch_free(sess);
 	if (sess->callbacks)
 		g_slist_free_full(sess->callbacks, g_free);
-	sessions = g_slist_remove(sessions, sess);
+	g_hash_table_destroy(sess->di_index);
+	g_queue_free(sess->async_queue);
+	g_cond_clear(&sess->async_cond);
+	g_mutex_clear(&sess->async_mutex);
 	g_free(sess);
 
 	srd_dbg("Destroyed session %d.", session_id);
@@ -296,9 +965,11 @@ SRD_API int srd_session_destroy(struct srd_session *sess)
  * to the PD controller (except for Python objects, which only go up the
  * stack).
  *
+ * Multiple callbacks can be registered for the same output type, they are
+ * called in the order in which they were registered.
+ *
  * @param sess The output session in which to register the callback.
- * @param output_type The output type this callback will receive. Only one
- *                    callback per output type can be registered.
+ * @param output_type The output type this callback will receive.
  * @param cb The function to call. Must not be NULL.
  * @param cb_data Private data for the callback function. Can be NULL.
  *
@@ -314,6 +985,11 @@ SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 		return SRD_ERR_ARG;
 	}
 
+	if (output_type < 0 || output_type >= SRD_OUTPUT_TYPE_COUNT) {
+		srd_err("Invalid output type %d.", output_type);
+		return SRD_ERR_ARG;
+	}
+
 	srd_dbg("Registering new callback for output type %d.", output_type);
 
 	pd_cb = g_malloc(sizeof(struct srd_pd_callback));
@@ -321,32 +997,279 @@ SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 	pd_cb->cb = cb;
 	pd_cb->cb_data = cb_data;
 	sess->callbacks = g_slist_append(sess->callbacks, pd_cb);
+	sess->output_callbacks[output_type] = g_slist_append(
+			sess->output_callbacks[output_type], pd_cb);
 
 	return SRD_OK;
 }
 
-/** @private */
-SRD_PRIV struct srd_pd_callback *srd_pd_output_callback_find(
-		struct srd_session *sess, int output_type)
+/**
+ * Set the batched annotation output callback of a session.
+ *
+ * Instead of one callback call per annotation, annotations are collected
+ * in a buffer owned by the session and passed to this callback in bulk:
+ * whenever batch_size annotations are pending, and at the end of every
+ * srd_session_send() call. This works alongside callbacks registered with
+ * srd_pd_output_callback_add().
+ *
+ * The callback gets an array of num_items struct srd_proto_data, whose
+ * data fields point to struct srd_proto_data_annotation. All of this,
+ * including the annotation texts, remains owned by the session and is
+ * only valid until the callback returns. Frontends must copy whatever
+ * they want to keep.
+ *
+ * @param sess The session in which to set the callback.
+ * @param batch_size The maximum number of annotations per callback call.
+ *                   Must be greater than 0.
+ * @param cb The function to call. NULL disables batched output.
+ * @param cb_data Private data for the callback function. Can be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_pd_output_batch_callback_set(struct srd_session *sess,
+		unsigned int batch_size, srd_pd_output_batch_callback cb,
+		void *cb_data)
+{
+	PyGILState_STATE gstate;
+
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	if (cb && batch_size == 0) {
+		srd_err("Invalid batch size 0.");
+		return SRD_ERR_ARG;
+	}
+
+	/* Annotations batched up so far go to the previous callback. */
+	gstate = PyGILState_Ensure();
+	srd_pd_output_batch_flush(sess);
+	PyGILState_Release(gstate);
+	batch_free(sess);
+
+	sess->batch_cb = cb;
+	sess->batch_cb_data = cb_data;
+	if (!cb)
+		return SRD_OK;
+
+	srd_dbg("Setting batch callback for up to %u annotations.",
+		batch_size);
+
+	sess->batch_size = batch_size;
+	sess->batch_pdata = g_malloc(sizeof(struct srd_proto_data) * batch_size);
+	sess->batch_anns = g_malloc(sizeof(struct srd_proto_data_annotation)
+			* batch_size);
+	sess->batch_text_idx = g_malloc(sizeof(guint) * batch_size);
+	sess->batch_texts = g_ptr_array_new();
+	sess->batch_strings = g_string_chunk_new(4096);
+
+	return SRD_OK;
+}
+
+/**
+ * Get the performance counters of all decoder instances in a session,
+ * added up.
+ *
+ * See srd_inst_stats_get() for details.
+ *
+ * @param sess The session.
+ * @param stats Pointer to a struct the counters are stored in.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_session_stats_get(struct srd_session *sess,
+		struct srd_inst_stats *stats)
 {
+	PyGILState_STATE gstate;
 	GSList *l;
-	struct srd_pd_callback *tmp, *pd_cb;
 
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	if (!stats) {
+		srd_err("Invalid stats pointer.");
+		return SRD_ERR_ARG;
+	}
+
+	memset(stats, 0, sizeof(struct srd_inst_stats));
+	gstate = PyGILState_Ensure();
+	for (l = sess->di_list; l; l = l->next)
+		srd_inst_stats_sum(l->data, stats);
+	PyGILState_Release(gstate);
+
+	return SRD_OK;
+}
+
+/**
+ * Reset the performance counters of all decoder instances in a session
+ * to zero.
+ *
+ * @param sess The session.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.5.0
+ */
+SRD_API int srd_session_stats_reset(struct srd_session *sess)
+{
+	PyGILState_STATE gstate;
+	GSList *l;
+
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	gstate = PyGILState_Ensure();
+	for (l = sess->di_list; l; l = l->next)
+		srd_inst_stats_clear(l->data);
+	PyGILState_Release(gstate);
+
+	return SRD_OK;
+}
+
+/**
+ * Get the callbacks registered for an output type.
+ *
+ * @param sess The session to look in.
+ * @param output_type The output type.
+ *
+ * @return List of struct srd_pd_callback, in the order of registration.
+ *         NULL if there are none. The list is owned by the session.
+ *
+ * @private
+ */
+SRD_PRIV GSList *srd_pd_output_callbacks_get(struct srd_session *sess,
+		int output_type)
+{
 	if (session_is_valid(sess) != SRD_OK) {
 		srd_err("Invalid session.");
 		return NULL;
 	}
 
-	pd_cb = NULL;
-	for (l = sess->callbacks; l; l = l->next) {
-		tmp = l->data;
-		if (tmp->output_type == output_type) {
-			pd_cb = tmp;
-			break;
+	if (output_type < 0 || output_type >= SRD_OUTPUT_TYPE_COUNT)
+		return NULL;
+
+	return sess->output_callbacks[output_type];
+}
+
+/**
+ * Pass decoder output to each of the given callbacks.
+ *
+ * Must be called with the GIL held. It is released while the callbacks
+ * run, except for SRD_OUTPUT_PYTHON whose callbacks get Python objects.
+ *
+ * @param callbacks List of struct srd_pd_callback, as returned by
+ *                  srd_pd_output_callbacks_get().
+ * @param pdata The output to pass.
+ *
+ * @private
+ */
+SRD_PRIV void srd_pd_output_callbacks_send(const GSList *callbacks,
+		struct srd_proto_data *pdata)
+{
+	const GSList *l;
+	struct srd_pd_callback *pd_cb;
+	struct srd_decoder_inst *di;
+	struct srd_stats_span span;
+
+	di = pdata->pdo->di;
+	srd_stats_span_begin(di->sess, &span, FALSE);
+
+	/* Python objects need the GIL, frontends don't. */
+	if (pdata->pdo->output_type == SRD_OUTPUT_PYTHON) {
+		for (l = callbacks; l; l = l->next) {
+			pd_cb = l->data;
+			pd_cb->cb(pdata, pd_cb->cb_data);
+		}
+	} else {
+		Py_BEGIN_ALLOW_THREADS
+		for (l = callbacks; l; l = l->next) {
+			pd_cb = l->data;
+			pd_cb->cb(pdata, pd_cb->cb_data);
 		}
+		Py_END_ALLOW_THREADS
+	}
+
+	srd_stats_span_end(di->sess, &span, &di->stats.callback_time, NULL);
+}
+
+/**
+ * Append an annotation to the session's batch, and pass the batch on if
+ * it is full.
+ *
+ * @param sess The session.
+ * @param pdata The annotation's position and output. Its data is ignored.
+ * @param ann_class The annotation class.
+ * @param text_idx Index of the annotation's first text in the batch's
+ *                 texts. The caller must have appended the texts to the
+ *                 batch, followed by a NULL entry.
+ *
+ * @private
+ */
+SRD_PRIV void srd_pd_output_batch_add(struct srd_session *sess,
+		const struct srd_proto_data *pdata, int ann_class,
+		guint text_idx)
+{
+	struct srd_proto_data *item;
+
+	item = &sess->batch_pdata[sess->batch_count];
+	*item = *pdata;
+	item->data = &sess->batch_anns[sess->batch_count];
+	sess->batch_anns[sess->batch_count].ann_class = ann_class;
+	sess->batch_text_idx[sess->batch_count] = text_idx;
+	if (++sess->batch_count == sess->batch_size)
+		srd_pd_output_batch_flush(sess);
+}
+
+/**
+ * Pass the annotations batched up so far to the session's batch callback.
+ *
+ * Must be called with the GIL held. It is released while the callback runs.
+ *
+ * @param sess The session.
+ *
+ * @private
+ */
+SRD_PRIV void srd_pd_output_batch_flush(struct srd_session *sess)
+{
+	struct srd_decoder_inst *di;
+	struct srd_stats_span span;
+	uint64_t cb_time;
+	unsigned int i;
+
+	if (!sess->batch_cb || !sess->batch_count)
+		return;
+
+	/* The text vectors are only located now, batch_texts may move. */
+	for (i = 0; i < sess->batch_count; i++)
+		sess->batch_anns[i].ann_text = (char **)&g_ptr_array_index(
+				sess->batch_texts, sess->batch_text_idx[i]);
+
+	cb_time = 0;
+	srd_stats_span_begin(sess, &span, FALSE);
+	Py_BEGIN_ALLOW_THREADS
+	sess->batch_cb(sess->batch_pdata, sess->batch_count,
+			sess->batch_cb_data);
+	Py_END_ALLOW_THREADS
+	srd_stats_span_end(sess, &span, &cb_time, NULL);
+
+	/* Each annotation's instance gets its share of the callback time. */
+	for (i = 0; i < sess->batch_count; i++) {
+		di = sess->batch_pdata[i].pdo->di;
+		di->stats.callback_time += cb_time / sess->batch_count;
 	}
 
-	return pd_cb;
+	sess->batch_count = 0;
+	g_ptr_array_set_size(sess->batch_texts, 0);
+	g_string_chunk_clear(sess->batch_strings);
 }
 
 /** @} */
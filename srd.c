@@ -32,6 +32,9 @@ SRD_PRIV GSList *searchpaths = NULL;
 extern SRD_PRIV GSList *sessions;
 extern SRD_PRIV int max_session_id;
 
+/* The thread state of the thread which called srd_init(). */
+static PyThreadState *main_tstate = NULL;
+
 /** @endcond */
 
 /**
@@ -60,6 +63,19 @@ extern SRD_PRIV int max_session_id;
  * You can also browse the API documentation by file, or review all
  * data structures.
  *
+ * @section sec_threads Threads
+ *
+ * srd_init() and srd_exit() must be called from the same thread. In
+ * between, the other functions may be called from any thread, and
+ * different sessions can be used from different threads at the same
+ * time. A single session must only be used by one thread at a time.
+ *
+ * All sessions share one Python interpreter, so the decoders themselves
+ * run one at a time. libsigrokdecode releases the Python interpreter lock
+ * while it runs frontend callbacks (except for OUTPUT_PYTHON ones) and
+ * while it unpacks sample data in bulk, so other sessions can decode in
+ * the meantime.
+ *
  * @section sec_mailinglists Mailing lists
  *
  * There is one mailing list for sigrok/libsigrokdecode: <a href="https://lists.sourceforge.net/lists/listinfo/sigrok-devel">sigrok-devel</a>.
@@ -158,6 +174,10 @@ SRD_API int srd_init(const char *path)
 
 	/* Initialize the Python interpreter. */
 	Py_InitializeEx(0);
+#if PY_VERSION_HEX < 0x03070000
+	/* Older Pythons only create the GIL on request. */
+	PyEval_InitThreads();
+#endif
 
 	/* Locations relative to the XDG system data directories. */
 	sys_datadirs = g_get_system_data_dirs();
@@ -200,6 +220,12 @@ SRD_API int srd_init(const char *path)
 
 	max_session_id = 0;
 
+	/*
+	 * Release the GIL, every entry point which needs Python takes it
+	 * from whichever thread it is called in.
+	 */
+	main_tstate = PyEval_SaveThread();
+
 	return SRD_OK;
 }
 
@@ -223,8 +249,18 @@ SRD_API int srd_exit(void)
 
 	srd_dbg("Exiting libsigrokdecode.");
 
+	/* Decode threads need the GIL to finish, so don't take it before. */
 	for (l = sessions; l; l = l->next)
-		srd_session_destroy((struct srd_session *)l->data);
+		srd_session_async_stop(l->data);
+
+	if (main_tstate) {
+		PyEval_RestoreThread(main_tstate);
+		main_tstate = NULL;
+	}
+
+	/* srd_session_destroy() removes each session from the list. */
+	while (sessions)
+		srd_session_destroy(sessions->data);
 
 	srd_decoder_unload_all();
 	g_slist_free_full(searchpaths, g_free);
@@ -284,4 +320,14 @@ SRD_PRIV int srd_decoder_searchpath_add(const char *path)
 	return SRD_OK;
 }
 
+/** @private */
+SRD_PRIV gboolean srd_check_init(void)
+{
+	if (max_session_id < 0) {
+		srd_err("Library is not initialized.");
+		return FALSE;
+	} else
+		return TRUE;
+}
+
 /** @} */
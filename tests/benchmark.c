@@ -0,0 +1,766 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+ */
+
+/*
+ * Simple benchmarks for the decoding hot paths. This is not part of
+ * "make check", build it with "make tests/benchmark" and run it with the
+ * names of the benchmarks to run (all of them by default).
+ */
+
+#include <config.h>
+#include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <inttypes.h>
+#include <stdarg.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <glib/gstdio.h>
+#include "signals.h"
+
+/* The UART decoder's default baudrate, at an integer oversampling. */
+#define UART_BAUDRATE		115200
+#define UART_SAMPLES_PER_BIT	10
+#define UART_SAMPLERATE		(UART_BAUDRATE * UART_SAMPLES_PER_BIT)
+
+/* Start bit, 8 data bits, stop bit, two bits of idle time. */
+#define UART_BITS_PER_FRAME	12
+
+#define UART_NUM_BYTES		2000
+
+struct benchmark {
+	const char *name;
+	const char *desc;
+	int (*run)(void);
+};
+
+static uint64_t num_annotations;
+
+static void count_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	(void)pdata;
+
+	(*(uint64_t *)cb_data)++;
+}
+
+/*
+ * Generate an 8N1 UART signal transmitting the given bytes on channel 0
+ * (the decoder's RX channel). Channel 1 (TX) idles high all the time.
+ */
+static uint8_t *uart_gen(const uint8_t *data, size_t len,
+		uint64_t *num_samples)
+{
+	uint8_t *buf, *p;
+	size_t i;
+	int bit, level, s;
+
+	/* Leading idle time, so the decoder sees the first falling edge. */
+	*num_samples = (len + 1) * UART_BITS_PER_FRAME * UART_SAMPLES_PER_BIT;
+	buf = g_malloc(*num_samples);
+	memset(buf, 0x03, UART_BITS_PER_FRAME * UART_SAMPLES_PER_BIT);
+	p = buf + UART_BITS_PER_FRAME * UART_SAMPLES_PER_BIT;
+
+	for (i = 0; i < len; i++) {
+		for (bit = 0; bit < UART_BITS_PER_FRAME; bit++) {
+			if (bit == 0)
+				level = 0;
+			else if (bit <= 8)
+				level = (data[i] >> (bit - 1)) & 1;
+			else
+				level = 1;
+			for (s = 0; s < UART_SAMPLES_PER_BIT; s++)
+				*p++ = 0x02 | level;
+		}
+	}
+
+	return buf;
+}
+
+static uint8_t *uart_gen_text(uint64_t *num_samples)
+{
+	uint8_t data[UART_NUM_BYTES];
+	int i;
+
+	for (i = 0; i < UART_NUM_BYTES; i++)
+		data[i] = 0x20 + (i % 0x5f);
+
+	return uart_gen(data, UART_NUM_BYTES, num_samples);
+}
+
+static struct srd_session *uart_session_new(int num_instances,
+		gboolean workers, uint64_t *counter)
+{
+	struct srd_session *sess;
+	int i;
+
+	if (srd_session_new(&sess) != SRD_OK)
+		return NULL;
+	for (i = 0; i < num_instances; i++) {
+		if (!srd_inst_new(sess, "uart", NULL))
+			return NULL;
+	}
+	srd_session_workers_set(sess, workers);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_cb, counter);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	if (srd_session_start(sess) != SRD_OK)
+		return NULL;
+
+	return sess;
+}
+
+/*
+ * The cost of a single put() call must not depend on the number of
+ * sessions and decoder instances that exist. Every instance decodes the
+ * same UART data, so the number of annotations grows with the number of
+ * instances while the time per annotation should stay flat.
+ */
+static int bench_put(void)
+{
+	static const int num_sessions[] = { 1, 4, 16 };
+	static const int num_instances[] = { 1, 4, 16 };
+	struct srd_session **sessions;
+	uint8_t *samples;
+	uint64_t num_samples;
+	gint64 start, elapsed;
+	unsigned int s, n;
+	int i, ret;
+
+	if ((ret = srd_decoder_load("uart")) != SRD_OK)
+		return ret;
+	samples = uart_gen_text(&num_samples);
+
+	for (s = 0; s < G_N_ELEMENTS(num_sessions); s++) {
+		for (n = 0; n < G_N_ELEMENTS(num_instances); n++) {
+			num_annotations = 0;
+			sessions = g_malloc0(sizeof(struct srd_session *)
+					* num_sessions[s]);
+			for (i = 0; i < num_sessions[s]; i++) {
+				sessions[i] = uart_session_new(num_instances[n],
+						FALSE, &num_annotations);
+				if (!sessions[i]) {
+					g_free(sessions);
+					g_free(samples);
+					return SRD_ERR;
+				}
+			}
+
+			start = g_get_monotonic_time();
+			for (i = 0; i < num_sessions[s]; i++) {
+				ret = srd_session_send(sessions[i], 0,
+						num_samples, samples,
+						num_samples, 1);
+				if (ret != SRD_OK)
+					break;
+			}
+			elapsed = g_get_monotonic_time() - start;
+
+			for (i = 0; i < num_sessions[s]; i++)
+				srd_session_destroy(sessions[i]);
+			g_free(sessions);
+			if (ret != SRD_OK) {
+				g_free(samples);
+				return ret;
+			}
+
+			printf("put: %2d sessions, %2d instances each: "
+				"%8" PRIu64 " annotations, %8.1f ns/annotation\n",
+				num_sessions[s], num_instances[n],
+				num_annotations, num_annotations ?
+				elapsed * 1000.0 / num_annotations : 0.0);
+		}
+	}
+
+	g_free(samples);
+
+	return SRD_OK;
+}
+
+static int discard_log_cb(void *cb_data, int loglevel, const char *format,
+		va_list args)
+{
+	(void)cb_data;
+	(void)loglevel;
+	(void)format;
+	(void)args;
+
+	return SRD_OK;
+}
+
+/*
+ * The cost of put() at various loglevels. Log messages are discarded, so
+ * this only measures what it costs to produce them. Messages above the
+ * loglevel should be free.
+ */
+static int bench_log(void)
+{
+	static const int loglevels[] = {
+		SRD_LOG_NONE, SRD_LOG_WARN, SRD_LOG_DBG, SRD_LOG_SPEW,
+	};
+	struct srd_session *sess;
+	uint8_t *samples;
+	uint64_t num_samples;
+	gint64 start, elapsed;
+	unsigned int i;
+	int ret;
+
+	if ((ret = srd_decoder_load("uart")) != SRD_OK)
+		return ret;
+	samples = uart_gen_text(&num_samples);
+	srd_log_callback_set(discard_log_cb, NULL);
+
+	ret = SRD_OK;
+	for (i = 0; i < G_N_ELEMENTS(loglevels); i++) {
+		num_annotations = 0;
+		if (!(sess = uart_session_new(1, FALSE, &num_annotations))) {
+			ret = SRD_ERR;
+			break;
+		}
+		srd_log_loglevel_set(loglevels[i]);
+		start = g_get_monotonic_time();
+		ret = srd_session_send(sess, 0, num_samples, samples,
+				num_samples, 1);
+		elapsed = g_get_monotonic_time() - start;
+		srd_log_loglevel_set(SRD_LOG_WARN);
+		srd_session_destroy(sess);
+		if (ret != SRD_OK)
+			break;
+
+		printf("log: loglevel %d: %8" PRIu64 " annotations, "
+			"%8.1f ns/annotation\n", loglevels[i], num_annotations,
+			num_annotations ? elapsed * 1000.0 / num_annotations : 0.0);
+	}
+
+	srd_log_callback_set_default();
+	g_free(samples);
+
+	return ret;
+}
+
+/*
+ * The cost of passing OUTPUT_PYTHON up a stack: UART carrying MIDI note
+ * on/off messages, decoded by uart with midi stacked on top. The UART
+ * decoder emits several Python packets per byte.
+ */
+static int bench_stack(void)
+{
+	static const uint8_t midi_msgs[] = {
+		0x90, 0x3c, 0x40, 0x80, 0x3c, 0x00,
+	};
+	struct srd_session *sess;
+	struct srd_decoder_inst *uart, *midi;
+	uint8_t data[UART_NUM_BYTES], *samples;
+	uint64_t num_samples;
+	gint64 start, elapsed;
+	int i, ret;
+
+	if ((ret = srd_decoder_load("uart")) != SRD_OK
+			|| (ret = srd_decoder_load("midi")) != SRD_OK)
+		return ret;
+	for (i = 0; i < UART_NUM_BYTES; i++)
+		data[i] = midi_msgs[i % G_N_ELEMENTS(midi_msgs)];
+	samples = uart_gen(data, UART_NUM_BYTES, &num_samples);
+
+	num_annotations = 0;
+	srd_session_new(&sess);
+	uart = srd_inst_new(sess, "uart", NULL);
+	midi = srd_inst_new(sess, "midi", NULL);
+	if (!uart || !midi || srd_inst_stack(sess, uart, midi) != SRD_OK) {
+		srd_session_destroy(sess);
+		g_free(samples);
+		return SRD_ERR;
+	}
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_cb,
+			&num_annotations);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	elapsed = 0;
+	if ((ret = srd_session_start(sess)) == SRD_OK) {
+		start = g_get_monotonic_time();
+		ret = srd_session_send(sess, 0, num_samples, samples,
+				num_samples, 1);
+		elapsed = g_get_monotonic_time() - start;
+	}
+	srd_session_destroy(sess);
+	g_free(samples);
+	if (ret != SRD_OK)
+		return ret;
+
+	printf("stack: uart -> midi: %d bytes, %8" PRIu64 " annotations, "
+		"%8.1f ns/byte\n", UART_NUM_BYTES, num_annotations,
+		elapsed * 1000.0 / UART_NUM_BYTES);
+
+	return SRD_OK;
+}
+
+/*
+ * Wall-clock time for decoding independent stacks in-process, one after
+ * the other, and in worker processes at the same time.
+ */
+static int bench_workers(void)
+{
+	static const int num_stacks[] = { 1, 2, 4, 8 };
+	struct srd_session *sess;
+	uint8_t *samples;
+	uint64_t num_samples;
+	gint64 start, elapsed[2];
+	unsigned int i;
+	int w, ret;
+
+	if ((ret = srd_decoder_load("uart")) != SRD_OK)
+		return ret;
+	samples = uart_gen_text(&num_samples);
+
+	for (i = 0; i < G_N_ELEMENTS(num_stacks); i++) {
+		for (w = 0; w < 2; w++) {
+			num_annotations = 0;
+			sess = uart_session_new(num_stacks[i], w,
+					&num_annotations);
+			if (!sess) {
+				g_free(samples);
+				return SRD_ERR;
+			}
+			start = g_get_monotonic_time();
+			ret = srd_session_send(sess, 0, num_samples, samples,
+					num_samples, 1);
+			elapsed[w] = g_get_monotonic_time() - start;
+			srd_session_destroy(sess);
+			if (ret != SRD_OK) {
+				g_free(samples);
+				return ret;
+			}
+		}
+		printf("workers: %d stacks: %8.1f ms in-process, "
+			"%8.1f ms in workers\n", num_stacks[i],
+			elapsed[0] / 1000.0, elapsed[1] / 1000.0);
+	}
+
+	g_free(samples);
+
+	return SRD_OK;
+}
+
+/* Bursts of UART data for bench_segments(), with idle time in between. */
+#define SEGMENTS_BURST_BYTES	64
+#define SEGMENTS_NUM_BURSTS	512
+
+/*
+ * Wall-clock time for decoding a large capture in one go, and in
+ * segments split where the UART decoder resyncs.
+ */
+static int bench_segments(void)
+{
+	struct srd_session *sess;
+	uint8_t data[SEGMENTS_BURST_BYTES], *burst, *samples;
+	uint64_t burst_samples, num_samples, counts[2];
+	gint64 start, elapsed[2];
+	int i, s, ret;
+
+	if ((ret = srd_decoder_load("uart")) != SRD_OK)
+		return ret;
+
+	/* Every burst starts with a frame's worth of idle time. */
+	for (i = 0; i < SEGMENTS_BURST_BYTES; i++)
+		data[i] = 0x20 + (i % 0x5f);
+	burst = uart_gen(data, SEGMENTS_BURST_BYTES, &burst_samples);
+	num_samples = burst_samples * SEGMENTS_NUM_BURSTS;
+	samples = g_malloc(num_samples);
+	for (i = 0; i < SEGMENTS_NUM_BURSTS; i++)
+		memcpy(samples + i * burst_samples, burst, burst_samples);
+	g_free(burst);
+
+	for (s = 0; s < 2; s++) {
+		counts[s] = 0;
+		if (!(sess = uart_session_new(1, FALSE, &counts[s]))) {
+			g_free(samples);
+			return SRD_ERR;
+		}
+		start = g_get_monotonic_time();
+		if (s)
+			ret = srd_session_send_segmented(sess, 0, samples,
+					num_samples, 1, 0);
+		else
+			ret = srd_session_send(sess, 0, num_samples, samples,
+					num_samples, 1);
+		elapsed[s] = g_get_monotonic_time() - start;
+		srd_session_destroy(sess);
+		if (ret != SRD_OK) {
+			g_free(samples);
+			return ret;
+		}
+	}
+	printf("segments: %" PRIu64 " samples: %8.1f ms in one go, "
+		"%8.1f ms in segments (%" PRIu64 "/%" PRIu64 " annotations)\n",
+		num_samples, elapsed[0] / 1000.0, elapsed[1] / 1000.0,
+		counts[0], counts[1]);
+
+	g_free(samples);
+
+	return SRD_OK;
+}
+
+/* Chunks for bench_async(), and how long acquiring one takes. */
+#define ASYNC_CHUNK_SAMPLES	4096
+#define ASYNC_ACQUIRE_USEC	500
+
+/*
+ * Wall-clock time for acquiring and decoding a capture chunk by chunk,
+ * with srd_session_send() and srd_session_send_async(). Acquisition is
+ * simulated by sleeping, so the decoder has the CPU to itself.
+ */
+static int bench_async(void)
+{
+	struct srd_session *sess;
+	uint8_t *samples;
+	uint64_t num_samples, i, len;
+	gint64 start, elapsed[2];
+	int a, ret;
+
+	if ((ret = srd_decoder_load("uart")) != SRD_OK)
+		return ret;
+	samples = uart_gen_text(&num_samples);
+
+	for (a = 0; a < 2; a++) {
+		num_annotations = 0;
+		if (!(sess = uart_session_new(1, FALSE, &num_annotations))) {
+			g_free(samples);
+			return SRD_ERR;
+		}
+		start = g_get_monotonic_time();
+		ret = SRD_OK;
+		for (i = 0; i < num_samples && ret == SRD_OK; i += len) {
+			len = MIN(ASYNC_CHUNK_SAMPLES, num_samples - i);
+			g_usleep(ASYNC_ACQUIRE_USEC);
+			if (a)
+				ret = srd_session_send_async(sess, i, i + len,
+						samples + i, len, 1);
+			else
+				ret = srd_session_send(sess, i, i + len,
+						samples + i, len, 1);
+		}
+		if (ret == SRD_OK)
+			ret = srd_session_wait(sess);
+		elapsed[a] = g_get_monotonic_time() - start;
+		srd_session_destroy(sess);
+		if (ret != SRD_OK) {
+			g_free(samples);
+			return ret;
+		}
+	}
+	printf("async: %" PRIu64 " chunks: %8.1f ms synchronous, "
+		"%8.1f ms asynchronous\n",
+		(num_samples + ASYNC_CHUNK_SAMPLES - 1) / ASYNC_CHUNK_SAMPLES,
+		elapsed[0] / 1000.0, elapsed[1] / 1000.0);
+
+	g_free(samples);
+
+	return SRD_OK;
+}
+
+/*
+ * Startup cost of a frontend using a single decoder: loading all decoders
+ * and creating a uart instance, without the metadata cache, while filling
+ * it, with all decoders taken from it, and with lazy loading.
+ */
+static int bench_startup(void)
+{
+	static const char *const runs[] = {
+		"no cache", "cold cache", "warm cache", "lazy",
+	};
+	struct srd_session *sess;
+	char *path;
+	gint64 start, elapsed;
+	unsigned int i;
+	int fd, ret;
+
+	if ((fd = g_file_open_tmp("srd-decoder-cache-XXXXXX", &path, NULL)) < 0)
+		return SRD_ERR;
+	close(fd);
+
+	ret = SRD_OK;
+	for (i = 0; i < G_N_ELEMENTS(runs); i++) {
+		srd_exit();
+		srd_decoder_cache_set(i == 1 || i == 2 ? path : NULL);
+		srd_decoder_lazy_load_set(i == 3);
+		start = g_get_monotonic_time();
+		srd_init(DECODERS_TESTDIR);
+		srd_decoder_load_all();
+		srd_session_new(&sess);
+		if (!srd_inst_new(sess, "uart", NULL))
+			ret = SRD_ERR;
+		elapsed = g_get_monotonic_time() - start;
+		if (ret != SRD_OK)
+			break;
+
+		printf("startup: %-10s: %8.1f ms\n", runs[i],
+			elapsed / 1000.0);
+	}
+
+	srd_decoder_cache_set(NULL);
+	srd_decoder_lazy_load_set(FALSE);
+	g_unlink(path);
+	g_free(path);
+
+	return ret;
+}
+
+static gint import_time_compare(gconstpointer a, gconstpointer b)
+{
+	uint64_t ta, tb;
+
+	srd_decoder_import_time_get(a, &ta);
+	srd_decoder_import_time_get(b, &tb);
+
+	return ta < tb ? 1 : ta > tb ? -1 : 0;
+}
+
+/* The decoders whose Python modules take longest to import. */
+static int bench_imports(void)
+{
+	GSList *decoders, *l;
+	struct srd_decoder *dec;
+	uint64_t usecs, total;
+	unsigned int i;
+	int ret;
+
+	if ((ret = srd_decoder_load_all()) != SRD_OK)
+		return ret;
+
+	decoders = g_slist_copy((GSList *)srd_decoder_list());
+	decoders = g_slist_sort(decoders, import_time_compare);
+
+	total = 0;
+	for (l = decoders; l; l = l->next) {
+		srd_decoder_import_time_get(l->data, &usecs);
+		total += usecs;
+	}
+	printf("imports: %u decoders: %8.1f ms\n",
+		g_slist_length(decoders), total / 1000.0);
+	for (i = 0, l = decoders; i < 10 && l; i++, l = l->next) {
+		dec = l->data;
+		srd_decoder_import_time_get(dec, &usecs);
+		printf("imports: %-16s %8.1f ms\n", dec->id, usecs / 1000.0);
+	}
+	g_slist_free(decoders);
+
+	return SRD_OK;
+}
+
+/*
+ * The main bottom-level decoders, alone and with the decoders commonly
+ * stacked on top of them. The payload lengths make for signals of very
+ * roughly 16k ticks each.
+ */
+static const struct {
+	const char *stack;
+	signal_gen gen;
+	size_t len;
+} decoder_stacks[] = {
+	{ "uart", signal_uart, 1024 },
+	{ "uart,midi", signal_uart, 1024 },
+	{ "spi", signal_spi, 1024 },
+	{ "spi,spiflash", signal_spi, 1024 },
+	{ "i2c", signal_i2c, 512 },
+	{ "i2c,eeprom24xx", signal_i2c, 512 },
+	{ "can", signal_can, 1024 },
+	{ "usb_signalling", signal_usb, 512 },
+	{ "usb_signalling,usb_packet", signal_usb, 512 },
+	{ "usb_signalling,usb_packet,usb_request", signal_usb, 512 },
+	{ "onewire_link", signal_onewire, 32 },
+	{ "onewire_link,onewire_network", signal_onewire, 32 },
+	{ "i2s", signal_i2s, 1024 },
+	{ "jtag", signal_jtag, 512 },
+	{ "jtag,jtag_stm32", signal_jtag, 512 },
+	{ "swd", signal_swd, 512 },
+	{ "parallel", signal_parallel, 8192 },
+	{ "pwm", signal_pwm, 160 },
+	{ "z80", signal_z80, 4096 },
+};
+
+/* Samples per tick of the protocol's time base. */
+static const unsigned int decoder_oversampling[] = { 4, 16, 64 };
+
+struct decoder_counts {
+	struct srd_decoder_inst *top;
+	uint64_t annotations;
+	uint64_t top_annotations;
+};
+
+static void decoder_count_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct decoder_counts *counts;
+
+	counts = cb_data;
+	counts->annotations++;
+	if (pdata->pdo->di == counts->top)
+		counts->top_annotations++;
+}
+
+static int decoder_stack_run(const char *stack, signal_gen gen, size_t len,
+		unsigned int oversampling)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *di, *prev;
+	struct decoder_counts counts;
+	struct signal s;
+	uint64_t num_samples;
+	gint64 start, elapsed;
+	double secs;
+	char **ids;
+	int i, ret;
+
+	gen(&s, oversampling, len);
+	num_samples = signal_num_samples(&s);
+
+	srd_session_new(&sess);
+	ids = g_strsplit(stack, ",", 0);
+	ret = SRD_OK;
+	prev = NULL;
+	for (i = 0; ids[i] && ret == SRD_OK; i++) {
+		if ((ret = srd_decoder_load(ids[i])) != SRD_OK)
+			break;
+		if (!(di = srd_inst_new(sess, ids[i], NULL)))
+			ret = SRD_ERR;
+		else if (prev)
+			ret = srd_inst_stack(sess, prev, di);
+		prev = di;
+	}
+	g_strfreev(ids);
+
+	counts.top = prev;
+	counts.annotations = counts.top_annotations = 0;
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, decoder_count_cb,
+			&counts);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(s.samplerate));
+	elapsed = 0;
+	if (ret == SRD_OK && (ret = srd_session_start(sess)) == SRD_OK) {
+		start = g_get_monotonic_time();
+		ret = srd_session_send(sess, 0, num_samples, s.samples->data,
+				s.samples->len, s.unitsize);
+		elapsed = g_get_monotonic_time() - start;
+	}
+	srd_session_destroy(sess);
+	signal_free(&s);
+	if (ret != SRD_OK)
+		return ret;
+
+	/* Catch generators and decoders drifting apart. */
+	if (!counts.top_annotations) {
+		fprintf(stderr, "decoders: %s decoded nothing\n", stack);
+		return SRD_ERR;
+	}
+
+	secs = MAX(elapsed, 1) / 1000000.0;
+	printf("decoders: stack=%s unitsize=%u samplerate=%" PRIu64
+		" oversampling=%u samples=%" PRIu64 " annotations=%" PRIu64
+		" seconds=%.6f samples_per_s=%.0f annotations_per_s=%.0f\n",
+		stack, s.unitsize, s.samplerate, oversampling, num_samples,
+		counts.annotations, secs, num_samples / secs,
+		counts.annotations / secs);
+
+	return SRD_OK;
+}
+
+/*
+ * Throughput of the main decoders and their stacks on synthetic signals,
+ * at several oversampling factors and thus samplerates. There is one line
+ * of key=value pairs per run, for scripts to pick up.
+ */
+static int bench_decoders(void)
+{
+	unsigned int i, o;
+	int ret;
+
+	for (i = 0; i < G_N_ELEMENTS(decoder_stacks); i++) {
+		for (o = 0; o < G_N_ELEMENTS(decoder_oversampling); o++) {
+			ret = decoder_stack_run(decoder_stacks[i].stack,
+					decoder_stacks[i].gen,
+					decoder_stacks[i].len,
+					decoder_oversampling[o]);
+			if (ret != SRD_OK)
+				return ret;
+		}
+	}
+
+	return SRD_OK;
+}
+
+static const struct benchmark benchmarks[] = {
+	{ "put", "put() cost vs. number of sessions and instances", bench_put },
+	{ "log", "put() cost vs. loglevel", bench_log },
+	{ "stack", "OUTPUT_PYTHON passed up a uart -> midi stack", bench_stack },
+	{ "workers", "stacks decoded in-process vs. in workers", bench_workers },
+	{ "segments", "large capture decoded in one go vs. in segments", bench_segments },
+	{ "async", "chunks acquired and decoded one after the other vs. overlapped", bench_async },
+	{ "startup", "loading all decoders with and without the metadata cache", bench_startup },
+	{ "imports", "decoders with the slowest imports", bench_imports },
+	{ "decoders", "decoder and stack throughput on synthetic signals", bench_decoders },
+};
+
+static void usage(const char *argv0)
+{
+	unsigned int i;
+
+	printf("Usage: %s [benchmark...]\n\nAvailable benchmarks:\n", argv0);
+	for (i = 0; i < G_N_ELEMENTS(benchmarks); i++)
+		printf("  %-12s %s\n", benchmarks[i].name, benchmarks[i].desc);
+}
+
+static int run(const struct benchmark *b)
+{
+	int ret;
+
+	if ((ret = srd_init(DECODERS_TESTDIR)) != SRD_OK)
+		return ret;
+	if ((ret = b->run()) != SRD_OK)
+		fprintf(stderr, "Benchmark %s failed: %s\n", b->name,
+			srd_strerror(ret));
+	srd_exit();
+
+	return ret;
+}
+
+int main(int argc, char **argv)
+{
+	unsigned int i;
+	int a, failed;
+
+	srd_log_loglevel_set(SRD_LOG_WARN);
+
+	failed = 0;
+	if (argc < 2) {
+		for (i = 0; i < G_N_ELEMENTS(benchmarks); i++)
+			failed |= run(&benchmarks[i]) != SRD_OK;
+		return failed ? EXIT_FAILURE : EXIT_SUCCESS;
+	}
+
+	for (a = 1; a < argc; a++) {
+		for (i = 0; i < G_N_ELEMENTS(benchmarks); i++) {
+			if (!strcmp(argv[a], benchmarks[i].name))
+				break;
+		}
+		if (i == G_N_ELEMENTS(benchmarks)) {
+			usage(argv[0]);
+			return EXIT_FAILURE;
+		}
+		failed |= run(&benchmarks[i]) != SRD_OK;
+	}
+
+	return failed ? EXIT_FAILURE : EXIT_SUCCESS;
+}
@@ -19,8 +19,12 @@
  */
 
 #include <config.h>
-#include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <libsigrokdecode-internal.h> /* First, to avoid compiler warning. */
+#include <libsigrokdecode.h>
 #include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <glib/gstdio.h>
 #include <check.h>
 #include "lib.h"
 
@@ -72,6 +76,169 @@ START_TEST(test_load)
 }
 END_TEST
 
+/*
+ * Check whether the annotation and binary class tables of a loaded decoder
+ * match its class lists.
+ * If any entry differs (or the tables are missing) this test will fail.
+ */
+START_TEST(test_load_class_tables)
+{
+	struct srd_decoder *dec;
+	GSList *l;
+	guint i;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	dec = srd_decoder_get_by_id("uart");
+	fail_unless(dec != NULL, "srd_decoder_get_by_id(uart) failed.");
+	fail_unless(dec->annotation_table != NULL);
+	fail_unless(dec->binary_table != NULL);
+	fail_unless(dec->annotation_table->len
+			== g_slist_length(dec->annotations));
+	fail_unless(dec->binary_table->len == g_slist_length(dec->binary));
+	for (i = 0, l = dec->annotations; l; i++, l = l->next)
+		fail_unless(g_ptr_array_index(dec->annotation_table, i)
+				== l->data);
+	for (i = 0, l = dec->binary; l; i++, l = l->next)
+		fail_unless(g_ptr_array_index(dec->binary_table, i) == l->data);
+	srd_exit();
+}
+END_TEST
+
+/* Describe the metadata of all loaded decoders, sorted by ID. */
+static char *decoder_list_summary(void)
+{
+	const GSList *l;
+	GSList *summaries, *ll;
+	struct srd_decoder *dec;
+	struct srd_decoder_option *o;
+	GString *s;
+	char *def;
+
+	summaries = NULL;
+	for (l = srd_decoder_list(); l; l = l->next) {
+		dec = l->data;
+		s = g_string_new(NULL);
+		g_string_append_printf(s, "%s/%s/%s/%s/%s/%u/%u/%u/%u/%u:",
+			dec->id, dec->name, dec->longname, dec->desc,
+			dec->license, g_slist_length(dec->channels),
+			g_slist_length(dec->opt_channels),
+			g_slist_length(dec->annotations),
+			g_slist_length(dec->annotation_rows),
+			g_slist_length(dec->binary));
+		for (ll = dec->options; ll; ll = ll->next) {
+			o = ll->data;
+			def = o->def ? g_variant_print(o->def, TRUE) : NULL;
+			g_string_append_printf(s, " %s=%s/%u", o->id,
+				def, g_slist_length(o->values));
+			g_free(def);
+		}
+		summaries = g_slist_insert_sorted(summaries,
+				g_string_free(s, FALSE), (GCompareFunc)strcmp);
+	}
+
+	s = g_string_new(NULL);
+	for (ll = summaries; ll; ll = ll->next)
+		g_string_append_printf(s, "%s\n", (char *)ll->data);
+	g_slist_free_full(summaries, g_free);
+
+	return g_string_free(s, FALSE);
+}
+
+/*
+ * Check whether srd_decoder_load_all() with a cache file loads the same
+ * decoders as without, and whether decoders loaded from the cache can be
+ * instantiated.
+ * If the decoders differ (or the instance can't be created) this test
+ * will fail.
+ */
+START_TEST(test_load_all_cached)
+{
+	struct srd_session *sess;
+	struct srd_decoder *dec;
+	char *path, *expected, *summary, *doc;
+	int fd, i;
+
+	fd = g_file_open_tmp("srd-decoder-cache-XXXXXX", &path, NULL);
+	fail_unless(fd >= 0);
+	close(fd);
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load_all();
+	expected = decoder_list_summary();
+	srd_exit();
+
+	/* The first run fills the cache, the second one uses it. */
+	srd_decoder_cache_set(path);
+	for (i = 0; i < 2; i++) {
+		srd_init(DECODERS_TESTDIR);
+		fail_unless(srd_decoder_load_all() == SRD_OK);
+		summary = decoder_list_summary();
+		fail_unless(!strcmp(summary, expected),
+			"Run %d loaded different decoders.", i);
+		g_free(summary);
+		dec = srd_decoder_get_by_id("uart");
+		fail_unless(dec != NULL);
+		if (i == 1)
+			fail_unless(dec->py_dec == NULL,
+				"Cached decoder was imported.");
+		srd_session_new(&sess);
+		fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+		fail_unless(dec->py_dec != NULL);
+		doc = srd_decoder_doc_get(srd_decoder_get_by_id("spi"));
+		fail_unless(doc != NULL);
+		g_free(doc);
+		srd_exit();
+	}
+	srd_decoder_cache_set(NULL);
+
+	g_unlink(path);
+	g_free(path);
+	g_free(expected);
+}
+END_TEST
+
+/*
+ * Check whether decoders can be looked up with lazy loading, and whether
+ * srd_decoder_list() then yields the same decoders as a full load.
+ * If a decoder is missing (or differs) this test will fail.
+ */
+START_TEST(test_load_all_lazy)
+{
+	struct srd_decoder *dec;
+	PyGILState_STATE gstate;
+	char *expected, *summary;
+	uint64_t usecs;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load_all();
+	expected = decoder_list_summary();
+	srd_exit();
+
+	srd_decoder_lazy_load_set(TRUE);
+	srd_init(DECODERS_TESTDIR);
+	fail_unless(srd_decoder_load_all() == SRD_OK);
+	dec = srd_decoder_get_by_id("uart");
+	fail_unless(dec != NULL);
+	fail_unless(srd_decoder_import_time_get(dec, &usecs) == SRD_OK);
+	fail_unless(srd_decoder_import_time_get(NULL, &usecs) == SRD_ERR_ARG);
+	fail_unless(srd_decoder_import_time_get(dec, NULL) == SRD_ERR_ARG);
+	fail_unless(srd_decoder_get_by_id("nonexisting") == NULL);
+	/* Looking up a missing decoder doesn't load the others. */
+	gstate = PyGILState_Ensure();
+	fail_unless(!PyDict_GetItemString(PyImport_GetModuleDict(), "spi"),
+			"A lookup of a missing decoder loaded spi.");
+	PyGILState_Release(gstate);
+	summary = decoder_list_summary();
+	fail_unless(!strcmp(summary, expected));
+	g_free(summary);
+	srd_exit();
+	srd_decoder_lazy_load_set(FALSE);
+
+	g_free(expected);
+}
+END_TEST
+
 /*
  * Check whether srd_decoder_load() fails for non-existing or bogus PDs.
  * If it returns SRD_OK (or segfaults) this test will fail.
@@ -428,6 +595,9 @@ Suite *suite_decoder(void)
 	tcase_add_test(tc, test_load_valid_and_bogus);
 	tcase_add_test(tc, test_load_multiple);
 	tcase_add_test(tc, test_load_nonexisting_pd_dir);
+	tcase_add_test(tc, test_load_class_tables);
+	tcase_add_test(tc, test_load_all_cached);
+	tcase_add_test(tc, test_load_all_lazy);
 	suite_add_tcase(s, tc);
 
 	tc = tcase_create("unload");
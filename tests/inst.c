@@ -19,7 +19,8 @@
  */
 
 #include <config.h>
-#include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <libsigrokdecode-internal.h> /* First, to avoid compiler warning. */
+#include <libsigrokdecode.h>
 #include <stdlib.h>
 #include <check.h>
 #include "lib.h"
@@ -79,6 +80,72 @@ START_TEST(test_inst_new_multiple)
 }
 END_TEST
 
+/*
+ * Check whether srd_inst_find_by_id() finds instances anywhere in the
+ * stack, and the first one of several sharing an ID.
+ * If it returns a wrong instance (or segfaults) this test will fail.
+ */
+START_TEST(test_inst_find_by_id)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *uart, *uart2, *midi, *uart_dup;
+	GHashTable *options;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load_all();
+	srd_session_new(&sess);
+
+	options = g_hash_table_new(g_str_hash, g_str_equal);
+	uart = srd_inst_new(sess, "uart", NULL);
+	g_hash_table_insert(options, "id", "uart2");
+	uart2 = srd_inst_new(sess, "uart", options);
+	midi = srd_inst_new(sess, "midi", NULL);
+	uart_dup = srd_inst_new(sess, "uart", NULL);
+	g_hash_table_destroy(options);
+	fail_unless(uart && uart2 && midi && uart_dup);
+	srd_inst_stack(sess, uart2, midi);
+
+	fail_unless(srd_inst_find_by_id(sess, "uart") == uart);
+	fail_unless(srd_inst_find_by_id(sess, "uart2") == uart2);
+	fail_unless(srd_inst_find_by_id(sess, "midi") == midi);
+	fail_unless(srd_inst_find_by_id(sess, "spi") == NULL);
+	fail_unless(srd_inst_find_by_id(sess, NULL) == NULL);
+
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_inst_new() without options sets the defaults.
+ * If the instance's options lack the default baudrate this test will fail.
+ */
+START_TEST(test_inst_new_default_options)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *inst;
+	PyGILState_STATE gstate;
+	PyObject *py_options, *py_baudrate;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	inst = srd_inst_new(sess, "uart", NULL);
+	fail_unless(inst != NULL);
+
+	gstate = PyGILState_Ensure();
+	py_options = PyObject_GetAttrString(inst->py_inst, "options");
+	fail_unless(py_options != NULL && PyDict_Check(py_options),
+			"Instance options aren't a dict.");
+	py_baudrate = PyDict_GetItemString(py_options, "baudrate");
+	fail_unless(py_baudrate && PyLong_AsLong(py_baudrate) == 115200,
+			"Instance lacks the default baudrate.");
+	Py_DECREF(py_options);
+	PyGILState_Release(gstate);
+
+	srd_exit();
+}
+END_TEST
+
 /*
  * Check whether srd_inst_option_set() works for an empty options hash.
  * If it returns != SRD_OK (or segfaults) this test will fail.
@@ -141,6 +208,47 @@ START_TEST(test_inst_option_set_bogus)
 }
 END_TEST
 
+/*
+ * Check whether srd_inst_channel_set_all() updates the per-channel sample
+ * lookup tables of the instance.
+ * If the byte offsets or bit masks don't match the new channel map (or the
+ * call segfaults) this test will fail.
+ */
+START_TEST(test_inst_channel_set_all_lookup)
+{
+	int ret;
+	struct srd_session *sess;
+	struct srd_decoder_inst *inst;
+	GHashTable *channels;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	inst = srd_inst_new(sess, "uart", NULL);
+	fail_unless(inst != NULL, "srd_inst_new() failed.");
+
+	/* By default, decoder channel i is mapped to channel i. */
+	fail_unless(inst->channel_byte_offsets[1] == 0);
+	fail_unless(inst->channel_bit_masks[1] == (1 << 1));
+	fail_unless(inst->pins_cache != NULL);
+
+	/* Map TX to channel 10, leaving the optional RX unused. */
+	channels = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)g_variant_unref);
+	g_hash_table_insert(channels, g_strdup("tx"), g_variant_new_int32(10));
+	ret = srd_inst_channel_set_all(inst, channels);
+	fail_unless(ret == SRD_OK, "srd_inst_channel_set_all() failed: %d.",
+			ret);
+	fail_unless(inst->channel_byte_offsets[0] == -1);
+	fail_unless(inst->channel_samples[0] == 0xff);
+	fail_unless(inst->channel_byte_offsets[1] == 1);
+	fail_unless(inst->channel_bit_masks[1] == (1 << 2));
+	g_hash_table_destroy(channels);
+
+	srd_exit();
+}
+END_TEST
+
 Suite *suite_inst(void)
 {
 	Suite *s;
@@ -152,6 +260,12 @@ Suite *suite_inst(void)
 	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
 	tcase_add_test(tc, test_inst_new);
 	tcase_add_test(tc, test_inst_new_multiple);
+	tcase_add_test(tc, test_inst_new_default_options);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("find");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_inst_find_by_id);
 	suite_add_tcase(s, tc);
 
 	tc = tcase_create("option");
@@ -160,5 +274,10 @@ Suite *suite_inst(void)
 	tcase_add_test(tc, test_inst_option_set_bogus);
 	suite_add_tcase(s, tc);
 
+	tc = tcase_create("channel");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_inst_channel_set_all_lookup);
+	suite_add_tcase(s, tc);
+
 	return s;
 }
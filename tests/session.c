@@ -21,8 +21,12 @@
 #include <config.h>
 #include <libsigrokdecode-internal.h> /* First, to avoid compiler warning. */
 #include <libsigrokdecode.h>
+#include <inttypes.h>
 #include <stdint.h>
+#include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
 #include <check.h>
 #include "lib.h"
 
@@ -49,6 +53,11 @@ END_TEST
 START_TEST(test_session_new_bogus)
 {
 	int ret;
+	struct srd_session *sess;
+
+	ret = srd_session_new(&sess);
+	fail_unless(ret != SRD_OK, "srd_session_new() before srd_init() "
+			"worked.");
 
 	srd_init(NULL);
 	ret = srd_session_new(NULL);
@@ -225,6 +234,1070 @@ START_TEST(test_session_metadata_set_bogus)
 }
 END_TEST
 
+/* UART test signal: the decoder's default 115200 baud, 10 samples per bit. */
+#define UART_SAMPLES_PER_BIT 10
+#define UART_SAMPLERATE (115200 * UART_SAMPLES_PER_BIT)
+
+/*
+ * Generate an 8N1 UART signal transmitting the given text on channel 0
+ * (RX), with channel 1 (TX) idling high.
+ */
+static uint8_t *uart_samples_new(const char *text, uint64_t *num_samples)
+{
+	uint8_t *buf, *p;
+	size_t i, len;
+	int bit, level, s;
+
+	/* Idle, then start bit, 8 data bits and stop bit per character. */
+	len = strlen(text);
+	*num_samples = (len * 10 + 2) * UART_SAMPLES_PER_BIT;
+	p = buf = g_malloc(*num_samples);
+	memset(p, 0x03, UART_SAMPLES_PER_BIT);
+	p += UART_SAMPLES_PER_BIT;
+	for (i = 0; i < len; i++) {
+		for (bit = 0; bit < 10; bit++) {
+			if (bit == 0)
+				level = 0;
+			else if (bit <= 8)
+				level = (text[i] >> (bit - 1)) & 1;
+			else
+				level = 1;
+			for (s = 0; s < UART_SAMPLES_PER_BIT; s++)
+				*p++ = 0x02 | level;
+		}
+	}
+	memset(p, 0x03, UART_SAMPLES_PER_BIT);
+
+	return buf;
+}
+
+static void count_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	(void)pdata;
+
+	(*(int *)cb_data)++;
+}
+
+/*
+ * Check whether multiple callbacks for the same output type all get
+ * called, and whether registering a bogus output type fails.
+ */
+START_TEST(test_session_callback_multiple)
+{
+	int ret, count1, count2, count_bin;
+	struct srd_session *sess;
+	uint8_t *samples;
+	uint64_t num_samples;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+
+	count1 = count2 = count_bin = 0;
+	ret = srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN,
+			count_cb, &count1);
+	fail_unless(ret == SRD_OK, "srd_pd_output_callback_add() failed: %d.",
+			ret);
+	ret = srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN,
+			count_cb, &count2);
+	fail_unless(ret == SRD_OK, "srd_pd_output_callback_add() failed: %d.",
+			ret);
+	ret = srd_pd_output_callback_add(sess, SRD_OUTPUT_BINARY,
+			count_cb, &count_bin);
+	fail_unless(ret == SRD_OK, "srd_pd_output_callback_add() failed: %d.",
+			ret);
+	ret = srd_pd_output_callback_add(sess, 123, count_cb, &count1);
+	fail_unless(ret != SRD_OK, "srd_pd_output_callback_add() with bogus "
+			"output type succeeded.");
+
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+	samples = uart_samples_new("Hello", &num_samples);
+	ret = srd_session_send(sess, 0, num_samples, samples, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	g_free(samples);
+
+	fail_unless(count1 > 0, "No annotations received.");
+	fail_unless(count1 == count2, "Callbacks received %d and %d "
+			"annotations.", count1, count2);
+	fail_unless(count_bin > 0, "No binary output received.");
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+struct batch_stats {
+	int num_calls;
+	int num_items;
+	unsigned int max_items;
+	gboolean texts_ok;
+};
+
+static void batch_cb(struct srd_proto_data *pdata, unsigned int num_items,
+		void *cb_data)
+{
+	struct batch_stats *stats;
+	struct srd_proto_data_annotation *pda;
+	unsigned int i;
+
+	stats = cb_data;
+	stats->num_calls++;
+	stats->num_items += num_items;
+	stats->max_items = MAX(stats->max_items, num_items);
+	for (i = 0; i < num_items; i++) {
+		pda = pdata[i].data;
+		if (!pda->ann_text || !pda->ann_text[0])
+			stats->texts_ok = FALSE;
+	}
+}
+
+/*
+ * Check whether batched annotation output delivers the same annotations
+ * as the regular callback, in batches of at most the requested size.
+ */
+START_TEST(test_session_batch_callback)
+{
+	int ret, count;
+	struct srd_session *sess;
+	struct batch_stats stats;
+	uint8_t *samples;
+	uint64_t num_samples;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+
+	count = 0;
+	memset(&stats, 0, sizeof(stats));
+	stats.texts_ok = TRUE;
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_cb, &count);
+	ret = srd_pd_output_batch_callback_set(sess, 0, batch_cb, &stats);
+	fail_unless(ret != SRD_OK, "Batch size 0 was accepted.");
+	ret = srd_pd_output_batch_callback_set(sess, 4, batch_cb, &stats);
+	fail_unless(ret == SRD_OK, "srd_pd_output_batch_callback_set() "
+			"failed: %d.", ret);
+
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+	samples = uart_samples_new("Hello", &num_samples);
+	ret = srd_session_send(sess, 0, num_samples, samples, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	g_free(samples);
+
+	fail_unless(count > 0, "No annotations received.");
+	fail_unless(stats.num_items == count, "Batches held %d annotations "
+			"instead of %d.", stats.num_items, count);
+	fail_unless(stats.max_items <= 4, "Batch of %u annotations.",
+			stats.max_items);
+	fail_unless(stats.num_calls >= count / 4);
+	fail_unless(stats.texts_ok, "Batched annotation without texts.");
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+static void binary_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_proto_data_binary *pdb;
+
+	pdb = pdata->data;
+	if (pdb->bin_class == 0)
+		g_string_append_len(cb_data, (const char *)pdb->data, pdb->size);
+}
+
+/*
+ * Check whether binary output reaches the frontend intact.
+ */
+START_TEST(test_session_binary_output)
+{
+	int ret;
+	struct srd_session *sess;
+	uint8_t *samples;
+	uint64_t num_samples;
+	GString *rx;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+
+	rx = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_BINARY, binary_cb, rx);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+	samples = uart_samples_new("Hello", &num_samples);
+	ret = srd_session_send(sess, 0, num_samples, samples, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	g_free(samples);
+
+	fail_unless(!strcmp(rx->str, "Hello"), "Received '%s' instead of "
+			"'Hello'.", rx->str);
+	g_string_free(rx, TRUE);
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+static void class_count_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_proto_data_annotation *pda;
+
+	pda = pdata->data;
+	((int *)cb_data)[pda->ann_class]++;
+}
+
+/*
+ * Check whether disabled annotation classes and rows are dropped, and
+ * whether bogus classes and rows are rejected.
+ */
+START_TEST(test_session_ann_class_filter)
+{
+	int ret, counts[32];
+	struct srd_session *sess;
+	struct srd_decoder_inst *inst;
+	uint8_t *samples;
+	uint64_t num_samples;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	inst = srd_inst_new(sess, "uart", NULL);
+	fail_unless(inst != NULL);
+
+	/* UART class 2 is "rx-start", row "rx-data-bits" holds class 12. */
+	ret = srd_inst_ann_class_enable_set(inst, 2, FALSE);
+	fail_unless(ret == SRD_OK, "Disabling class 2 failed: %d.", ret);
+	ret = srd_inst_ann_row_enable_set(inst, "rx-data-bits", FALSE);
+	fail_unless(ret == SRD_OK, "Disabling row failed: %d.", ret);
+	ret = srd_inst_ann_class_enable_set(inst, 123, FALSE);
+	fail_unless(ret != SRD_OK, "Disabling bogus class succeeded.");
+	ret = srd_inst_ann_row_enable_set(inst, "bogus", FALSE);
+	fail_unless(ret != SRD_OK, "Disabling bogus row succeeded.");
+
+	memset(counts, 0, sizeof(counts));
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, class_count_cb,
+			counts);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+	samples = uart_samples_new("Hello", &num_samples);
+	ret = srd_session_send(sess, 0, num_samples, samples, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	g_free(samples);
+
+	fail_unless(counts[0] == 5, "Got %d RX data annotations.", counts[0]);
+	fail_unless(counts[2] == 0, "Disabled class 2 was not dropped.");
+	fail_unless(counts[12] == 0, "Disabled row was not dropped.");
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+static gpointer decode_thread(gpointer data)
+{
+	struct srd_session *sess;
+	uint8_t *samples;
+	uint64_t num_samples;
+	GString *rx;
+
+	rx = g_string_new(NULL);
+	if (srd_session_new(&sess) != SRD_OK)
+		return rx;
+	if (srd_inst_new(sess, "uart", NULL)) {
+		srd_pd_output_callback_add(sess, SRD_OUTPUT_BINARY,
+				binary_cb, rx);
+		srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+				g_variant_new_uint64(UART_SAMPLERATE));
+		srd_session_start(sess);
+		samples = uart_samples_new(data, &num_samples);
+		srd_session_send(sess, 0, num_samples, samples,
+				num_samples, 1);
+		g_free(samples);
+	}
+	srd_session_destroy(sess);
+
+	return rx;
+}
+
+/*
+ * Check whether sessions can decode in multiple threads at the same time,
+ * each one getting its own output.
+ */
+START_TEST(test_session_threads)
+{
+	static const char *texts[] = { "Hello", "World" };
+	GThread *threads[G_N_ELEMENTS(texts)];
+	GString *rx;
+	unsigned int i;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	for (i = 0; i < G_N_ELEMENTS(texts); i++)
+		threads[i] = g_thread_new(NULL, decode_thread,
+				(gpointer)texts[i]);
+	for (i = 0; i < G_N_ELEMENTS(texts); i++) {
+		rx = g_thread_join(threads[i]);
+		fail_unless(!strcmp(rx->str, texts[i]), "Thread %u received "
+				"'%s' instead of '%s'.", i, rx->str, texts[i]);
+		g_string_free(rx, TRUE);
+	}
+
+	srd_exit();
+}
+END_TEST
+
+static void ann_log_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_proto_data_annotation *pda;
+
+	pda = pdata->data;
+	g_string_append_printf(cb_data, "%s %d %" PRIu64 "-%" PRIu64 " %s\n",
+			pdata->pdo->di->inst_id, pda->ann_class,
+			pdata->start_sample, pdata->end_sample,
+			pda->ann_text[0]);
+}
+
+/* Decode "Hello" with two UART stacks, and log all annotations. */
+static GString *decode_two_stacks(gboolean workers)
+{
+	int ret;
+	struct srd_session *sess;
+	uint8_t *samples;
+	uint64_t num_samples;
+	GString *log;
+
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+	ret = srd_session_workers_set(sess, workers);
+	fail_unless(ret == SRD_OK, "srd_session_workers_set() failed: %d.",
+			ret);
+
+	log = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, ann_log_cb, log);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+	samples = uart_samples_new("Hello", &num_samples);
+	ret = srd_session_send(sess, 0, num_samples, samples, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	g_free(samples);
+	srd_session_destroy(sess);
+
+	return log;
+}
+
+/*
+ * Check whether decoding stacks in worker processes yields the same
+ * output, in the same order, as decoding them in-process.
+ */
+START_TEST(test_session_workers)
+{
+	GString *inproc, *workers;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	fail_unless(srd_session_workers_set(NULL, TRUE) != SRD_OK);
+
+	inproc = decode_two_stacks(FALSE);
+	workers = decode_two_stacks(TRUE);
+	fail_unless(inproc->len > 0, "No annotations received.");
+	fail_unless(!strcmp(inproc->str, workers->str), "Worker output "
+			"differs from in-process output.");
+	g_string_free(inproc, TRUE);
+	g_string_free(workers, TRUE);
+
+	srd_exit();
+}
+END_TEST
+
+/* Idle time between the bursts of a segmented capture, in samples. */
+#define SEGMENT_GAP 200
+#define SEGMENT_BURSTS 8
+
+/*
+ * Decode "Hello" SEGMENT_BURSTS times, with idle time in between, and
+ * log all annotations. 'max_segments' 0 decodes with srd_session_send().
+ */
+static GString *decode_segments(unsigned int max_segments, int *counts)
+{
+	int ret, i;
+	struct srd_session *sess;
+	uint8_t *burst, *samples;
+	uint64_t burst_samples, num_samples;
+	GString *log;
+
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+	log = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, ann_log_cb, log);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, class_count_cb,
+			counts);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+
+	burst = uart_samples_new("Hello", &burst_samples);
+	num_samples = SEGMENT_BURSTS * (burst_samples + SEGMENT_GAP);
+	samples = g_malloc(num_samples);
+	for (i = 0; i < SEGMENT_BURSTS; i++) {
+		memcpy(samples + i * (burst_samples + SEGMENT_GAP), burst,
+				burst_samples);
+		memset(samples + i * (burst_samples + SEGMENT_GAP)
+				+ burst_samples, 0x03, SEGMENT_GAP);
+	}
+	if (max_segments)
+		ret = srd_session_send_segmented(sess, 0, samples,
+				num_samples, 1, max_segments);
+	else
+		ret = srd_session_send(sess, 0, num_samples, samples,
+				num_samples, 1);
+	fail_unless(ret == SRD_OK, "Decoding failed: %d.", ret);
+	if (max_segments) {
+		/* Segmented sessions can't decode more data. */
+		ret = srd_session_send(sess, num_samples, num_samples + 1,
+				samples, 1, 1);
+		fail_unless(ret != SRD_OK);
+	}
+	g_free(burst);
+	g_free(samples);
+	srd_session_destroy(sess);
+
+	return log;
+}
+
+/*
+ * Check whether decoding a capture in segments yields the same output,
+ * in the same order, as decoding it in one go.
+ */
+START_TEST(test_session_segmented)
+{
+	int counts[2][32];
+	GString *whole, *segmented;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	fail_unless(srd_session_send_segmented(NULL, 0, NULL, 0, 1, 4)
+			!= SRD_OK);
+
+	memset(counts, 0, sizeof(counts));
+	whole = decode_segments(0, counts[0]);
+	segmented = decode_segments(4, counts[1]);
+	fail_unless(counts[0][0] == 5 * SEGMENT_BURSTS,
+			"Expected %d RX data annotations, got %d.",
+			5 * SEGMENT_BURSTS, counts[0][0]);
+	fail_unless(!memcmp(counts[0], counts[1], sizeof(counts[0])),
+			"Segmented decoding yields other annotations.");
+	fail_unless(!strcmp(whole->str, segmented->str), "Segmented output "
+			"differs from output decoded in one go.");
+	g_string_free(whole, TRUE);
+	g_string_free(segmented, TRUE);
+
+	srd_exit();
+}
+END_TEST
+
+/* Decode "Hello" in small chunks, and log all annotations. */
+static GString *decode_chunks(gboolean async)
+{
+	int ret;
+	struct srd_session *sess;
+	uint8_t *samples;
+	uint64_t num_samples, i, len;
+	GString *log;
+
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+	log = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, ann_log_cb, log);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	/* A tiny queue, so queueing has to wait for the decode thread. */
+	ret = srd_session_async_set(sess, 64, TRUE);
+	fail_unless(ret == SRD_OK, "srd_session_async_set() failed: %d.",
+			ret);
+	srd_session_start(sess);
+
+	samples = uart_samples_new("Hello", &num_samples);
+	for (i = 0; i < num_samples; i += len) {
+		len = MIN(37, num_samples - i);
+		if (async)
+			ret = srd_session_send_async(sess, i, i + len,
+					samples + i, len, 1);
+		else
+			ret = srd_session_send(sess, i, i + len, samples + i,
+					len, 1);
+		fail_unless(ret == SRD_OK, "Sending chunk failed: %d.", ret);
+	}
+	/* The frontend's buffer isn't needed anymore. */
+	g_free(samples);
+	ret = srd_session_wait(sess);
+	fail_unless(ret == SRD_OK, "srd_session_wait() failed: %d.", ret);
+	srd_session_destroy(sess);
+
+	return log;
+}
+
+/*
+ * Check whether chunks queued with srd_session_send_async() yield the
+ * same output as chunks passed to srd_session_send().
+ */
+START_TEST(test_session_send_async)
+{
+	int ret;
+	struct srd_session *sess;
+	uint8_t sample;
+	GString *sync, *async;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	fail_unless(srd_session_send_async(NULL, 0, 1, NULL, 0, 1) != SRD_OK);
+	fail_unless(srd_session_async_set(NULL, 0, TRUE) != SRD_OK);
+	fail_unless(srd_session_wait(NULL) != SRD_OK);
+
+	/* Bogus sample data is rejected before anything is queued. */
+	sample = 0xff;
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+	ret = srd_session_send_async(sess, 0, 1, NULL, 1, 1);
+	fail_unless(ret == SRD_ERR_ARG, "NULL buffer: %d.", ret);
+	ret = srd_session_send_async(sess, 0, 1, &sample, 1, 0);
+	fail_unless(ret == SRD_ERR_ARG, "Zero unitsize: %d.", ret);
+	ret = srd_session_send_async(sess, 0, 0, &sample, 0, 1);
+	fail_unless(ret == SRD_ERR_ARG, "Empty buffer: %d.", ret);
+	ret = srd_session_wait(sess);
+	fail_unless(ret == SRD_OK, "Nothing queued, wait failed: %d.", ret);
+	srd_session_destroy(sess);
+
+	sync = decode_chunks(FALSE);
+	async = decode_chunks(TRUE);
+	fail_unless(sync->len > 0, "No annotations received.");
+	fail_unless(!strcmp(sync->str, async->str), "Asynchronous output "
+			"differs from synchronous output.");
+	g_string_free(sync, TRUE);
+	g_string_free(async, TRUE);
+
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_exit() lets the decode threads finish the chunks
+ * which are still queued.
+ */
+START_TEST(test_session_exit_async)
+{
+	int ret;
+	struct srd_session *sess;
+	uint8_t *samples;
+	uint64_t num_samples, i, len;
+	GString *sync, *async;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	sync = decode_chunks(FALSE);
+
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+	async = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, ann_log_cb, async);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+	samples = uart_samples_new("Hello", &num_samples);
+	for (i = 0; i < num_samples; i += len) {
+		len = MIN(37, num_samples - i);
+		ret = srd_session_send_async(sess, i, i + len, samples + i,
+				len, 1);
+		fail_unless(ret == SRD_OK, "Queueing chunk failed: %d.", ret);
+	}
+	g_free(samples);
+
+	/* Neither waiting for the queue, nor destroying the session. */
+	srd_exit();
+	fail_unless(!strcmp(sync->str, async->str), "Not all queued chunks "
+			"were decoded.");
+	g_string_free(sync, TRUE);
+	g_string_free(async, TRUE);
+}
+END_TEST
+
+/* Decode a file holding "Hello", and log all annotations. */
+static GString *decode_file(const char *filename, uint64_t start_samplenum,
+		uint64_t chunk_size)
+{
+	int ret;
+	struct srd_session *sess;
+	GString *log;
+
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+	log = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, ann_log_cb, log);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+	ret = srd_session_send_file(sess, filename, start_samplenum, 2,
+			chunk_size);
+	fail_unless(ret == SRD_OK, "srd_session_send_file() failed: %d.", ret);
+	srd_session_destroy(sess);
+
+	return log;
+}
+
+/*
+ * Check whether decoding a capture file yields the same output as
+ * passing its samples to srd_session_send(), in whatever chunks.
+ */
+START_TEST(test_session_send_file)
+{
+	int fd, ret;
+	struct srd_session *sess;
+	uint8_t *samples, *contents;
+	uint64_t num_samples, i;
+	char *filename;
+	GString *mem, *file, *chunks, *skip;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	/* Samples of two bytes each, then a partial sample. */
+	samples = uart_samples_new("Hello", &num_samples);
+	contents = g_malloc0(num_samples * 2 + 1);
+	for (i = 0; i < num_samples; i++)
+		contents[i * 2] = samples[i];
+	g_free(samples);
+	fd = g_file_open_tmp("srd-test-XXXXXX", &filename, NULL);
+	fail_unless(fd >= 0, "Failed to create a temporary file.");
+	close(fd);
+	fail_unless(g_file_set_contents(filename, (const char *)contents,
+			num_samples * 2 + 1, NULL));
+	g_free(contents);
+
+	mem = decode_chunks(FALSE);
+	file = decode_file(filename, 0, 0);
+	chunks = decode_file(filename, 0, 75);
+	/* Skip "H", starting halfway into its stop bit. */
+	skip = decode_file(filename, 10 * UART_SAMPLES_PER_BIT + 5, 1);
+	fail_unless(mem->len > 0, "No annotations received.");
+	fail_unless(!strcmp(mem->str, file->str), "Output of the file "
+			"differs from output of the samples.");
+	fail_unless(!strcmp(mem->str, chunks->str), "Output of the file in "
+			"chunks differs from output of the samples.");
+	fail_unless(skip->len > 0 && skip->len < mem->len &&
+			!strcmp(mem->str + mem->len - skip->len, skip->str),
+			"Output of the file's last samples is wrong.");
+	g_string_free(mem, TRUE);
+	g_string_free(file, TRUE);
+	g_string_free(chunks, TRUE);
+	g_string_free(skip, TRUE);
+
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+	srd_session_start(sess);
+	ret = srd_session_send_file(NULL, filename, 0, 2, 0);
+	fail_unless(ret != SRD_OK, "Decoding without a session succeeded.");
+	ret = srd_session_send_file(sess, NULL, 0, 2, 0);
+	fail_unless(ret != SRD_OK, "Decoding without a file succeeded.");
+	ret = srd_session_send_file(sess, filename, 0, 0, 0);
+	fail_unless(ret != SRD_OK, "Decoding with unitsize 0 succeeded.");
+	ret = srd_session_send_file(sess, filename, num_samples + 1, 2, 0);
+	fail_unless(ret != SRD_OK, "Decoding beyond the end succeeded.");
+	/* At the very end, there's nothing left to decode. */
+	ret = srd_session_send_file(sess, filename, num_samples, 2, 0);
+	fail_unless(ret == SRD_OK, "Decoding at the end failed: %d.", ret);
+	unlink(filename);
+	ret = srd_session_send_file(sess, filename, 0, 2, 0);
+	fail_unless(ret != SRD_OK, "Decoding a missing file succeeded.");
+	srd_session_destroy(sess);
+	g_free(filename);
+
+	srd_exit();
+}
+END_TEST
+
+static void midi_count_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	if (!strcmp(pdata->pdo->di->decoder->id, "midi"))
+		(*(int *)cb_data)++;
+}
+
+/*
+ * Give an instance a decode_batch() method, which passes each packet to
+ * decode(), and counts its calls in the instance's num_batches.
+ */
+static void decode_batch_add(struct srd_decoder_inst *di)
+{
+	PyGILState_STATE gstate;
+	PyObject *py_builtins, *py_globals, *py_res;
+
+	gstate = PyGILState_Ensure();
+	py_builtins = PyImport_ImportModule("builtins");
+	py_globals = PyDict_New();
+	fail_unless(py_builtins != NULL && py_globals != NULL);
+	PyDict_SetItemString(py_globals, "inst", di->py_inst);
+	py_res = PyObject_CallMethod(py_builtins, "exec", "sO",
+			"def decode_batch(packets):\n"
+			"    inst.num_batches += 1\n"
+			"    for ss, es, data in packets:\n"
+			"        inst.decode(ss, es, data)\n"
+			"inst.num_batches = 0\n"
+			"inst.decode_batch = decode_batch\n", py_globals);
+	fail_unless(py_res != NULL, "Failed to add decode_batch().");
+	Py_DECREF(py_res);
+	Py_DECREF(py_globals);
+	Py_DECREF(py_builtins);
+	PyGILState_Release(gstate);
+}
+
+/*
+ * Decode MIDI note on/off messages with uart -> midi, in chunks of the
+ * given size, and return the number of MIDI annotations. If 'num_batches'
+ * is given, midi takes its input in batches, and it is set to their
+ * number.
+ */
+static int decode_midi(uint64_t chunk_size, long *num_batches)
+{
+	int ret, count;
+	struct srd_session *sess;
+	struct srd_decoder_inst *uart, *midi;
+	PyGILState_STATE gstate;
+	PyObject *py_num;
+	uint8_t *samples;
+	uint64_t num_samples, i, len;
+
+	srd_session_new(&sess);
+	uart = srd_inst_new(sess, "uart", NULL);
+	midi = srd_inst_new(sess, "midi", NULL);
+	fail_unless(uart != NULL && midi != NULL);
+	if (num_batches)
+		decode_batch_add(midi);
+	ret = srd_inst_stack(sess, uart, midi);
+	fail_unless(ret == SRD_OK, "srd_inst_stack() failed: %d.", ret);
+	count = 0;
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, midi_count_cb,
+			&count);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+
+	samples = uart_samples_new("\x90\x3c\x40\x80\x3c\x01", &num_samples);
+	for (i = 0; i < num_samples; i += len) {
+		len = MIN(chunk_size, num_samples - i);
+		ret = srd_session_send(sess, i, i + len, samples + i, len, 1);
+		fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.",
+				ret);
+	}
+	g_free(samples);
+
+	if (num_batches) {
+		gstate = PyGILState_Ensure();
+		py_num = PyObject_GetAttrString(midi->py_inst, "num_batches");
+		fail_unless(py_num != NULL);
+		*num_batches = PyLong_AsLong(py_num);
+		Py_DECREF(py_num);
+		PyGILState_Release(gstate);
+	}
+	srd_session_destroy(sess);
+
+	return count;
+}
+
+/*
+ * Check whether a stacked decoder with a decode_batch() method gets all
+ * of its input, no matter how the samples are split into chunks.
+ */
+START_TEST(test_session_decode_batch)
+{
+	int count;
+	long num_batches;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_decoder_load("midi");
+
+	count = decode_midi(UINT64_MAX, NULL);
+	fail_unless(count == 2, "Expected 2 MIDI annotations, got %d.", count);
+	count = decode_midi(UINT64_MAX, &num_batches);
+	fail_unless(count == 2, "Expected 2 MIDI annotations, got %d.", count);
+	fail_unless(num_batches == 1, "Expected 1 batch, got %ld.",
+			num_batches);
+	count = decode_midi(7, &num_batches);
+	fail_unless(count == 2, "Expected 2 MIDI annotations, got %d.", count);
+	fail_unless(num_batches > 1, "Expected several batches, got %ld.",
+			num_batches);
+
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether the performance counters of the instances in a stack,
+ * and of the session, add up and can be reset.
+ */
+START_TEST(test_session_stats)
+{
+	int ret, count;
+	struct srd_session *sess;
+	struct srd_decoder_inst *uart, *midi;
+	struct srd_inst_stats uart_stats, midi_stats, sess_stats;
+	struct batch_stats batch;
+	uint8_t *samples;
+	uint64_t num_samples;
+	GString *rx;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_decoder_load("midi");
+	srd_session_new(&sess);
+	uart = srd_inst_new(sess, "uart", NULL);
+	midi = srd_inst_new(sess, "midi", NULL);
+	fail_unless(uart != NULL && midi != NULL);
+	srd_inst_stack(sess, uart, midi);
+
+	count = 0;
+	rx = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_cb, &count);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_BINARY, binary_cb, rx);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+	samples = uart_samples_new("\x90\x3c\x40\x80\x3c\x01", &num_samples);
+	ret = srd_session_send(sess, 0, num_samples, samples, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	ret = srd_session_send(sess, num_samples, 2 * num_samples, samples,
+			num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	g_free(samples);
+
+	ret = srd_inst_stats_get(uart, &uart_stats);
+	fail_unless(ret == SRD_OK, "srd_inst_stats_get() failed: %d.", ret);
+	fail_unless(uart_stats.chunks == 2);
+	fail_unless(uart_stats.samples == 2 * num_samples);
+	fail_unless(uart_stats.decode_calls == 2);
+	fail_unless(uart_stats.decode_time > 0);
+	fail_unless(uart_stats.put_calls[SRD_OUTPUT_ANN] > 0);
+	fail_unless(uart_stats.put_calls[SRD_OUTPUT_PYTHON] > 0);
+	/* binary_cb() only keeps class 0, the RX data. */
+	fail_unless(rx->len > 0 && uart_stats.binary_bytes >= rx->len,
+			"Counted %" PRIu64 " binary bytes, received %zu.",
+			uart_stats.binary_bytes, rx->len);
+	g_string_free(rx, TRUE);
+
+	/* The stacked instance is called per packet, and gets no samples. */
+	srd_inst_stats_get(midi, &midi_stats);
+	fail_unless(midi_stats.samples == 0 && midi_stats.chunks == 0);
+	fail_unless(midi_stats.decode_calls > 0);
+	fail_unless(midi_stats.annotations == 4);
+
+	ret = srd_session_stats_get(sess, &sess_stats);
+	fail_unless(ret == SRD_OK, "srd_session_stats_get() failed: %d.", ret);
+	fail_unless(sess_stats.annotations == (uint64_t)count,
+			"Counted %" PRIu64 " annotations, received %d.",
+			sess_stats.annotations, count);
+	fail_unless(sess_stats.decode_calls == uart_stats.decode_calls
+			+ midi_stats.decode_calls);
+	fail_unless(sess_stats.decode_time == uart_stats.decode_time
+			+ midi_stats.decode_time);
+
+	ret = srd_session_stats_reset(sess);
+	fail_unless(ret == SRD_OK, "srd_session_stats_reset() failed: %d.",
+			ret);
+	srd_inst_stats_get(midi, &midi_stats);
+	fail_unless(midi_stats.decode_calls == 0 && midi_stats.annotations == 0);
+
+	fail_unless(srd_inst_stats_get(NULL, &uart_stats) != SRD_OK);
+	fail_unless(srd_session_stats_get(sess, NULL) != SRD_OK);
+	srd_session_destroy(sess);
+
+	/* Annotations only passed to a batch callback are counted too. */
+	srd_session_new(&sess);
+	uart = srd_inst_new(sess, "uart", NULL);
+	midi = srd_inst_new(sess, "midi", NULL);
+	fail_unless(uart != NULL && midi != NULL);
+	srd_inst_stack(sess, uart, midi);
+	memset(&batch, 0, sizeof(batch));
+	batch.texts_ok = TRUE;
+	srd_pd_output_batch_callback_set(sess, 4, batch_cb, &batch);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+	samples = uart_samples_new("\x90\x3c\x40\x80\x3c\x01", &num_samples);
+	ret = srd_session_send(sess, 0, num_samples, samples, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	g_free(samples);
+
+	srd_inst_stats_get(midi, &midi_stats);
+	fail_unless(midi_stats.annotations == 2);
+	srd_session_stats_get(sess, &sess_stats);
+	fail_unless(batch.num_items > 0, "No annotations batched.");
+	fail_unless(sess_stats.annotations == (uint64_t)batch.num_items,
+			"Counted %" PRIu64 " annotations, batched %d.",
+			sess_stats.annotations, batch.num_items);
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether an instance can be profiled while decoding, and whether
+ * the profile is written in pstats format.
+ */
+START_TEST(test_session_profile)
+{
+	int ret, fd;
+	struct srd_session *sess;
+	struct srd_decoder_inst *inst;
+	uint8_t *samples;
+	uint64_t num_samples;
+	char *path, *contents;
+	gsize len;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	inst = srd_inst_new(sess, "uart", NULL);
+	fail_unless(inst != NULL);
+
+	fail_unless(srd_inst_profile_stop(inst, NULL) != SRD_OK,
+			"Stopping an instance which wasn't profiled succeeded.");
+	ret = srd_inst_profile_start(inst);
+	fail_unless(ret == SRD_OK, "srd_inst_profile_start() failed: %d.", ret);
+	fail_unless(srd_inst_profile_start(inst) != SRD_OK,
+			"Profiling an instance twice succeeded.");
+
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+	samples = uart_samples_new("Hello", &num_samples);
+	ret = srd_session_send(sess, 0, num_samples, samples, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	g_free(samples);
+
+	fd = g_file_open_tmp("srd-profile-XXXXXX", &path, NULL);
+	fail_unless(fd >= 0);
+	close(fd);
+	ret = srd_inst_profile_stop(inst, path);
+	fail_unless(ret == SRD_OK, "srd_inst_profile_stop() failed: %d.", ret);
+	fail_unless(g_file_get_contents(path, &contents, &len, NULL));
+	/* pstats files are a marshalled dict, possibly flagged as a ref. */
+	fail_unless(len > 0 && (contents[0] & 0x7f) == '{',
+			"Bad profile written.");
+	g_free(contents);
+	unlink(path);
+	g_free(path);
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/* Resident set size of this process in bytes, 0 if unknown. */
+static uint64_t rss_get(void)
+{
+	FILE *f;
+	unsigned long size, resident;
+	uint64_t rss;
+
+	if (!(f = fopen("/proc/self/statm", "r")))
+		return 0;
+	rss = 0;
+	if (fscanf(f, "%lu %lu", &size, &resident) == 2)
+		rss = (uint64_t)resident * sysconf(_SC_PAGESIZE);
+	fclose(f);
+
+	return rss;
+}
+
+/* The number of chunks the soak test decodes, 0 to skip it. */
+static uint64_t soak_chunks_get(void)
+{
+	const char *env;
+
+	if (!(env = g_getenv("SRD_TEST_SOAK_CHUNKS")))
+		return 0;
+
+	return g_ascii_strtoull(env, NULL, 10);
+}
+
+/* How much RSS may grow after warming up, allocator noise included. */
+#define SOAK_MAX_GROWTH		(2 * 1024 * 1024)
+
+/*
+ * Check whether memory use stays flat while a stack is fed lots of
+ * chunks with traffic, like in a long-running acquisition. This takes a
+ * while, so it only runs if SRD_TEST_SOAK_CHUNKS gives the number of
+ * chunks.
+ * If RSS grows by more than allocator noise this test will fail.
+ */
+START_TEST(test_session_soak)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *uart, *midi;
+	uint8_t *samples;
+	uint64_t num_chunks, num_samples, i, ss, rss_start, rss_end;
+	int ret, count;
+
+	num_chunks = soak_chunks_get();
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_decoder_load("midi");
+	srd_session_new(&sess);
+	uart = srd_inst_new(sess, "uart", NULL);
+	midi = srd_inst_new(sess, "midi", NULL);
+	fail_unless(uart != NULL && midi != NULL);
+	srd_inst_stack(sess, uart, midi);
+	count = 0;
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_cb, &count);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_BINARY, count_cb, &count);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(UART_SAMPLERATE));
+	srd_session_start(sess);
+
+	/* Each chunk carries bytes for uart, and OUTPUT_PYTHON for midi. */
+	samples = uart_samples_new("\x90\x3c\x40Hello\x80\x3c\x01",
+			&num_samples);
+	rss_start = 0;
+	ret = SRD_OK;
+	for (i = 0; i < num_chunks && ret == SRD_OK; i++) {
+		/* Let caches and pools settle before taking the baseline. */
+		if (i == num_chunks / 10)
+			rss_start = rss_get();
+		ss = i * num_samples;
+		ret = srd_session_send(sess, ss, ss + num_samples, samples,
+				num_samples, 1);
+	}
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	fail_unless(count > 0, "No output received.");
+	rss_end = rss_get();
+	g_free(samples);
+
+	srd_session_destroy(sess);
+	srd_exit();
+
+	fail_unless(rss_end < rss_start + SOAK_MAX_GROWTH,
+		"RSS grew from %" PRIu64 " to %" PRIu64 " bytes.",
+		rss_start, rss_end);
+}
+END_TEST
+
 Suite *suite_session(void)
 {
 	Suite *s;
@@ -247,5 +1320,48 @@ Suite *suite_session(void)
 	tcase_add_test(tc, test_session_metadata_set_bogus);
 	suite_add_tcase(s, tc);
 
+	tc = tcase_create("callback");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_callback_multiple);
+	tcase_add_test(tc, test_session_batch_callback);
+	tcase_add_test(tc, test_session_binary_output);
+	tcase_add_test(tc, test_session_ann_class_filter);
+	tcase_add_test(tc, test_session_decode_batch);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("stats");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_stats);
+	tcase_add_test(tc, test_session_profile);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("threads");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_threads);
+	tcase_add_test(tc, test_session_send_async);
+	tcase_add_test(tc, test_session_exit_async);
+	tcase_add_test(tc, test_session_send_file);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("workers");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_workers);
+	tcase_add_test(tc, test_session_segmented);
+	suite_add_tcase(s, tc);
+
+	/* Check can't skip tests, so the soak test isn't added then. */
+	if (!soak_chunks_get()) {
+		fprintf(stderr, "Skipping soak test, set SRD_TEST_SOAK_CHUNKS "
+			"to run it.\n");
+	} else if (!rss_get()) {
+		fprintf(stderr, "Skipping soak test, RSS can't be read.\n");
+	} else {
+		tc = tcase_create("soak");
+		tcase_set_timeout(tc, 0);
+		tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+		tcase_add_test(tc, test_session_soak);
+		suite_add_tcase(s, tc);
+	}
+
 	return s;
 }
@@ -0,0 +1,985 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+ */
+
+/*
+ * Synthetic signals for the benchmarks. Every generator drives the
+ * channels in the order the decoder declares them, so the decoder's
+ * default channel map applies. The payload comes from a fixed-seed
+ * pseudo-random sequence, so every run decodes exactly the same data.
+ */
+
+#include <config.h>
+#include <string.h>
+#include "signals.h"
+
+static void signal_init(struct signal *s, unsigned int unitsize,
+		unsigned int oversampling, uint64_t tick_rate, uint32_t levels)
+{
+	s->samples = g_byte_array_new();
+	s->unitsize = unitsize;
+	s->oversampling = oversampling;
+	s->samplerate = tick_rate * oversampling;
+	s->levels = levels;
+	s->seed = 1;
+}
+
+static void set(struct signal *s, int channel, int level)
+{
+	if (level)
+		s->levels |= 1U << channel;
+	else
+		s->levels &= ~(1U << channel);
+}
+
+/* Keep the current levels for the given number of ticks. */
+static void hold(struct signal *s, unsigned int ticks)
+{
+	uint8_t unit[4];
+	unsigned int i, n;
+
+	for (i = 0; i < s->unitsize; i++)
+		unit[i] = s->levels >> (8 * i);
+	n = ticks * s->oversampling;
+	for (i = 0; i < n; i++)
+		g_byte_array_append(s->samples, unit, s->unitsize);
+}
+
+static uint8_t random_byte(struct signal *s)
+{
+	s->seed = s->seed * 1103515245 + 12345;
+
+	return s->seed >> 16;
+}
+
+static uint32_t random_word(struct signal *s)
+{
+	uint32_t word;
+	int i;
+
+	for (word = 0, i = 0; i < 4; i++)
+		word = word << 8 | random_byte(s);
+
+	return word;
+}
+
+uint64_t signal_num_samples(const struct signal *s)
+{
+	return s->samples->len / s->unitsize;
+}
+
+void signal_free(struct signal *s)
+{
+	g_byte_array_free(s->samples, TRUE);
+	s->samples = NULL;
+}
+
+/*
+ * UART: 8N1 at the decoder's default baudrate on RX, TX idles high.
+ * The bytes are MIDI note on/off and control change messages.
+ */
+
+enum { UART_RX, UART_TX };
+
+#define UART_BAUDRATE	115200
+
+static void uart_byte(struct signal *s, uint8_t b)
+{
+	int i;
+
+	set(s, UART_RX, 0);
+	hold(s, 1);
+	for (i = 0; i < 8; i++) {
+		set(s, UART_RX, (b >> i) & 1);
+		hold(s, 1);
+	}
+	/* Stop bit, and one bit of idle time. */
+	set(s, UART_RX, 1);
+	hold(s, 2);
+}
+
+void signal_uart(struct signal *s, unsigned int oversampling, size_t len)
+{
+	static const uint8_t midi_status[] = { 0x80, 0x90, 0xb0 };
+	uint8_t status;
+	size_t n;
+
+	signal_init(s, 1, oversampling, UART_BAUDRATE, 0x03);
+	hold(s, 12);
+	for (n = 0; n < len; n += 3) {
+		status = midi_status[random_byte(s) % 3];
+		uart_byte(s, status | (random_byte(s) & 0x0f));
+		uart_byte(s, random_byte(s) & 0x7f);
+		uart_byte(s, random_byte(s) & 0x7f);
+	}
+}
+
+/*
+ * SPI: mode 0, MSB first, with an active-low CS#. Every transaction is
+ * a SPI flash command: write enable, page program, read status register,
+ * and reading back the page.
+ */
+
+enum { SPI_CLK, SPI_MISO, SPI_MOSI, SPI_CS };
+
+#define SPI_CLOCK_RATE	1000000
+#define SPI_PAGE_SIZE	16
+
+static void spi_transfer(struct signal *s, const uint8_t *mosi,
+		const uint8_t *miso, size_t len)
+{
+	size_t n;
+	int i;
+
+	set(s, SPI_CS, 0);
+	hold(s, 1);
+	for (n = 0; n < len; n++) {
+		for (i = 7; i >= 0; i--) {
+			set(s, SPI_CLK, 0);
+			set(s, SPI_MOSI, (mosi[n] >> i) & 1);
+			set(s, SPI_MISO, (miso[n] >> i) & 1);
+			hold(s, 1);
+			set(s, SPI_CLK, 1);
+			hold(s, 1);
+		}
+	}
+	set(s, SPI_CLK, 0);
+	hold(s, 1);
+	set(s, SPI_CS, 1);
+	hold(s, 2);
+}
+
+void signal_spi(struct signal *s, unsigned int oversampling, size_t len)
+{
+	uint8_t mosi[4 + SPI_PAGE_SIZE], miso[4 + SPI_PAGE_SIZE];
+	size_t n;
+	int i;
+
+	/* Each tick is half a clock period. */
+	signal_init(s, 1, oversampling, 2 * SPI_CLOCK_RATE, 1 << SPI_CS);
+	hold(s, 2);
+	memset(miso, 0xff, sizeof(miso));
+	for (n = 0; n < len; n += 2 * SPI_PAGE_SIZE) {
+		/* WREN */
+		mosi[0] = 0x06;
+		spi_transfer(s, mosi, miso, 1);
+
+		/* PP, with a page aligned 24-bit address. */
+		mosi[0] = 0x02;
+		mosi[1] = random_byte(s);
+		mosi[2] = random_byte(s) & ~(SPI_PAGE_SIZE - 1);
+		mosi[3] = 0x00;
+		for (i = 0; i < SPI_PAGE_SIZE; i++)
+			mosi[4 + i] = random_byte(s);
+		spi_transfer(s, mosi, miso, sizeof(mosi));
+
+		/* RDSR */
+		mosi[0] = 0x05;
+		mosi[1] = 0xff;
+		miso[1] = 0x02;
+		spi_transfer(s, mosi, miso, 2);
+
+		/* READ, the flash returns what was just programmed. */
+		mosi[0] = 0x03;
+		for (i = 0; i < SPI_PAGE_SIZE; i++) {
+			miso[4 + i] = mosi[4 + i];
+			mosi[4 + i] = 0xff;
+		}
+		spi_transfer(s, mosi, miso, sizeof(mosi));
+		memset(miso, 0xff, sizeof(miso));
+	}
+}
+
+/*
+ * I²C: page writes to a 24xx EEPROM, each followed by a random read
+ * of the same page.
+ */
+
+enum { I2C_SCL, I2C_SDA };
+
+#define I2C_CLOCK_RATE		100000
+#define I2C_EEPROM_ADDR		0x50
+#define I2C_EEPROM_SIZE		128
+#define I2C_EEPROM_PAGE_SIZE	8
+
+/* START condition, with SCL and SDA high before. */
+static void i2c_start(struct signal *s)
+{
+	set(s, I2C_SDA, 0);
+	hold(s, 1);
+	set(s, I2C_SCL, 0);
+	hold(s, 1);
+}
+
+static void i2c_restart(struct signal *s)
+{
+	set(s, I2C_SDA, 1);
+	hold(s, 1);
+	set(s, I2C_SCL, 1);
+	hold(s, 1);
+	i2c_start(s);
+}
+
+static void i2c_stop(struct signal *s)
+{
+	set(s, I2C_SDA, 0);
+	hold(s, 1);
+	set(s, I2C_SCL, 1);
+	hold(s, 1);
+	set(s, I2C_SDA, 1);
+	hold(s, 4);
+}
+
+static void i2c_bit(struct signal *s, int bit)
+{
+	set(s, I2C_SDA, bit);
+	hold(s, 1);
+	set(s, I2C_SCL, 1);
+	hold(s, 2);
+	set(s, I2C_SCL, 0);
+	hold(s, 1);
+}
+
+static void i2c_byte(struct signal *s, uint8_t b, int nack)
+{
+	int i;
+
+	for (i = 7; i >= 0; i--)
+		i2c_bit(s, (b >> i) & 1);
+	i2c_bit(s, nack);
+}
+
+void signal_i2c(struct signal *s, unsigned int oversampling, size_t len)
+{
+	size_t n;
+	uint8_t addr;
+	int i;
+
+	/* Each tick is a quarter of a clock period. */
+	signal_init(s, 1, oversampling, 4 * I2C_CLOCK_RATE,
+			1 << I2C_SCL | 1 << I2C_SDA);
+	hold(s, 4);
+	for (n = 0; n < len; n += 2 * I2C_EEPROM_PAGE_SIZE) {
+		addr = random_byte(s) % I2C_EEPROM_SIZE
+				& ~(I2C_EEPROM_PAGE_SIZE - 1);
+
+		i2c_start(s);
+		i2c_byte(s, I2C_EEPROM_ADDR << 1, 0);
+		i2c_byte(s, addr, 0);
+		for (i = 0; i < I2C_EEPROM_PAGE_SIZE; i++)
+			i2c_byte(s, random_byte(s), 0);
+		i2c_stop(s);
+
+		i2c_start(s);
+		i2c_byte(s, I2C_EEPROM_ADDR << 1, 0);
+		i2c_byte(s, addr, 0);
+		i2c_restart(s);
+		i2c_byte(s, I2C_EEPROM_ADDR << 1 | 1, 0);
+		for (i = 0; i < I2C_EEPROM_PAGE_SIZE; i++)
+			i2c_byte(s, random_byte(s),
+					i == I2C_EEPROM_PAGE_SIZE - 1);
+		i2c_stop(s);
+	}
+}
+
+/* CAN: standard data frames with 8 bytes each, at the default bitrate. */
+
+enum { CAN_RX };
+
+#define CAN_BITRATE	1000000
+
+static uint16_t can_crc(const uint8_t *bits, int n)
+{
+	uint16_t crc;
+	int i;
+
+	for (crc = 0, i = 0; i < n; i++) {
+		if (bits[i] ^ ((crc >> 14) & 1))
+			crc = ((crc << 1) ^ 0x4599) & 0x7fff;
+		else
+			crc = (crc << 1) & 0x7fff;
+	}
+
+	return crc;
+}
+
+static void can_bit(struct signal *s, int bit)
+{
+	set(s, CAN_RX, bit);
+	hold(s, 1);
+}
+
+static void can_frame(struct signal *s, uint16_t id, const uint8_t *data,
+		int dlc)
+{
+	uint8_t bits[19 + 8 * 8 + 15];
+	uint16_t crc;
+	int i, d, n, run, last;
+
+	n = 0;
+	bits[n++] = 0; /* SOF */
+	for (i = 10; i >= 0; i--)
+		bits[n++] = (id >> i) & 1;
+	bits[n++] = 0; /* RTR */
+	bits[n++] = 0; /* IDE */
+	bits[n++] = 0; /* RB0 */
+	for (i = 3; i >= 0; i--)
+		bits[n++] = (dlc >> i) & 1;
+	for (d = 0; d < dlc; d++) {
+		for (i = 7; i >= 0; i--)
+			bits[n++] = (data[d] >> i) & 1;
+	}
+	crc = can_crc(bits, n);
+	for (i = 14; i >= 0; i--)
+		bits[n++] = (crc >> i) & 1;
+
+	/* Everything up to the CRC is bit stuffed. */
+	for (run = 0, last = -1, i = 0; i < n; i++) {
+		can_bit(s, bits[i]);
+		run = bits[i] == last ? run + 1 : 1;
+		last = bits[i];
+		if (run == 5) {
+			last = !last;
+			can_bit(s, last);
+			run = 1;
+		}
+	}
+
+	/* CRC delimiter, ACK slot, ACK delimiter, EOF and intermission. */
+	can_bit(s, 1);
+	can_bit(s, 0);
+	set(s, CAN_RX, 1);
+	hold(s, 1 + 7 + 3);
+}
+
+void signal_can(struct signal *s, unsigned int oversampling, size_t len)
+{
+	uint8_t data[8];
+	uint16_t id;
+	size_t n;
+	int i;
+
+	signal_init(s, 1, oversampling, CAN_BITRATE, 1 << CAN_RX);
+	hold(s, 11);
+	for (n = 0; n < len; n += sizeof(data)) {
+		/* ID[10..4] must not be all recessive. */
+		id = random_byte(s) << 8;
+		id = (id | random_byte(s)) & 0x3ff;
+		for (i = 0; i < (int)sizeof(data); i++)
+			data[i] = random_byte(s);
+		can_frame(s, id, data, sizeof(data));
+	}
+}
+
+/*
+ * USB: full-speed GET_DESCRIPTOR control transfers, each with a setup,
+ * data and status stage.
+ */
+
+enum { USB_DP, USB_DM };
+
+#define USB_BITRATE	12000000
+#define USB_ADDR	3
+#define USB_DESC_LEN	18
+
+enum {
+	USB_PID_OUT = 0x1,
+	USB_PID_ACK = 0x2,
+	USB_PID_DATA0 = 0x3,
+	USB_PID_IN = 0x9,
+	USB_PID_DATA1 = 0xb,
+	USB_PID_SETUP = 0xd,
+};
+
+static void usb_symbol(struct signal *s, int dp, int dm, unsigned int bits)
+{
+	set(s, USB_DP, dp);
+	set(s, USB_DM, dm);
+	hold(s, bits);
+}
+
+/* NRZI: a 0 toggles between J and K, a 1 keeps the line state. */
+static void usb_bit(struct signal *s, int bit, int *ones)
+{
+	int dp;
+
+	dp = (s->levels >> USB_DP) & 1;
+	if (!bit)
+		dp = !dp;
+	usb_symbol(s, dp, !dp, 1);
+
+	if (!bit)
+		*ones = 0;
+	else if (++*ones == 6)
+		usb_bit(s, 0, ones); /* Stuff bit. */
+}
+
+/* Fields go out LSB first, CRCs MSB first. */
+static void usb_bits(struct signal *s, uint32_t value, int n, int *ones)
+{
+	int i;
+
+	for (i = 0; i < n; i++)
+		usb_bit(s, (value >> i) & 1, ones);
+}
+
+static void usb_crc_bits(struct signal *s, uint32_t crc, int n, int *ones)
+{
+	int i;
+
+	for (i = n - 1; i >= 0; i--)
+		usb_bit(s, (crc >> i) & 1, ones);
+}
+
+static void usb_sop(struct signal *s, int pid, int *ones)
+{
+	*ones = 0;
+	usb_bits(s, 0x80, 8, ones); /* SYNC */
+	usb_bits(s, pid | (~pid & 0x0f) << 4, 8, ones);
+}
+
+static void usb_eop(struct signal *s)
+{
+	usb_symbol(s, 0, 0, 2);
+	/* J, and a few bits of idle time. */
+	usb_symbol(s, 1, 0, 4);
+}
+
+static void usb_token(struct signal *s, int pid, int addr, int ep)
+{
+	uint32_t crc, fields;
+	int i, ones;
+
+	fields = addr | ep << 7;
+	for (crc = 0x1f, i = 0; i < 11; i++) {
+		crc <<= 1;
+		if (((fields >> i) & 1) != (crc >> 5))
+			crc ^= 0x25;
+		crc &= 0x1f;
+	}
+
+	usb_sop(s, pid, &ones);
+	usb_bits(s, fields, 11, &ones);
+	usb_crc_bits(s, crc ^ 0x1f, 5, &ones);
+	usb_eop(s);
+}
+
+static void usb_data(struct signal *s, int pid, const uint8_t *data,
+		size_t len)
+{
+	uint32_t crc;
+	size_t n;
+	int i, ones;
+
+	for (crc = 0xffff, n = 0; n < len; n++) {
+		for (i = 0; i < 8; i++) {
+			crc <<= 1;
+			if (((data[n] >> i) & 1) != (crc >> 16))
+				crc ^= 0x18005;
+			crc &= 0xffff;
+		}
+	}
+
+	usb_sop(s, pid, &ones);
+	for (n = 0; n < len; n++)
+		usb_bits(s, data[n], 8, &ones);
+	usb_crc_bits(s, crc ^ 0xffff, 16, &ones);
+	usb_eop(s);
+}
+
+static void usb_handshake(struct signal *s, int pid)
+{
+	int ones;
+
+	usb_sop(s, pid, &ones);
+	usb_eop(s);
+}
+
+void signal_usb(struct signal *s, unsigned int oversampling, size_t len)
+{
+	static const uint8_t get_descriptor[] = {
+		0x80, 0x06, 0x00, 0x01, 0x00, 0x00, USB_DESC_LEN, 0x00,
+	};
+	uint8_t desc[USB_DESC_LEN];
+	size_t n;
+	int i;
+
+	/* The bus idles in the J state. */
+	signal_init(s, 1, oversampling, USB_BITRATE, 1 << USB_DP);
+	hold(s, 8);
+	for (n = 0; n < len; n += sizeof(desc)) {
+		usb_token(s, USB_PID_SETUP, USB_ADDR, 0);
+		usb_data(s, USB_PID_DATA0, get_descriptor,
+				sizeof(get_descriptor));
+		usb_handshake(s, USB_PID_ACK);
+
+		for (i = 0; i < (int)sizeof(desc); i++)
+			desc[i] = random_byte(s);
+		usb_token(s, USB_PID_IN, USB_ADDR, 0);
+		usb_data(s, USB_PID_DATA1, desc, sizeof(desc));
+		usb_handshake(s, USB_PID_ACK);
+
+		usb_token(s, USB_PID_OUT, USB_ADDR, 0);
+		usb_data(s, USB_PID_DATA1, NULL, 0);
+		usb_handshake(s, USB_PID_ACK);
+	}
+}
+
+/*
+ * 1-Wire: normal speed, one tick per microsecond. A DS18B20 is addressed
+ * by its ROM code, told to convert, and then has its scratchpad read.
+ */
+
+enum { ONEWIRE_OWR, ONEWIRE_PWR };
+
+#define ONEWIRE_TICK_RATE	1000000
+#define ONEWIRE_SCRATCHPAD_LEN	9
+
+static void onewire_reset(struct signal *s)
+{
+	set(s, ONEWIRE_OWR, 0);
+	hold(s, 500);
+	set(s, ONEWIRE_OWR, 1);
+	hold(s, 20);
+	/* Presence pulse. */
+	set(s, ONEWIRE_OWR, 0);
+	hold(s, 120);
+	set(s, ONEWIRE_OWR, 1);
+	hold(s, 360);
+}
+
+static void onewire_byte(struct signal *s, uint8_t b)
+{
+	int i, bit;
+
+	for (i = 0; i < 8; i++) {
+		bit = (b >> i) & 1;
+		set(s, ONEWIRE_OWR, 0);
+		hold(s, bit ? 3 : 50);
+		set(s, ONEWIRE_OWR, 1);
+		hold(s, bit ? 67 : 20);
+	}
+}
+
+static uint8_t onewire_crc(const uint8_t *data, int len)
+{
+	uint8_t crc;
+	int n, i;
+
+	for (crc = 0, n = 0; n < len; n++) {
+		crc ^= data[n];
+		for (i = 0; i < 8; i++)
+			crc = crc & 1 ? (crc >> 1) ^ 0x8c : crc >> 1;
+	}
+
+	return crc;
+}
+
+static void onewire_match_rom(struct signal *s, const uint8_t *rom)
+{
+	int i;
+
+	onewire_reset(s);
+	onewire_byte(s, 0x55);
+	for (i = 0; i < 8; i++)
+		onewire_byte(s, rom[i]);
+}
+
+void signal_onewire(struct signal *s, unsigned int oversampling, size_t len)
+{
+	uint8_t rom[8], scratchpad[ONEWIRE_SCRATCHPAD_LEN];
+	size_t n;
+	int i;
+
+	signal_init(s, 1, oversampling, ONEWIRE_TICK_RATE,
+			1 << ONEWIRE_OWR | 1 << ONEWIRE_PWR);
+	hold(s, 100);
+	rom[0] = 0x28;
+	for (i = 1; i < 7; i++)
+		rom[i] = random_byte(s);
+	rom[7] = onewire_crc(rom, 7);
+
+	for (n = 0; n < len; n += 2 * sizeof(rom) + ONEWIRE_SCRATCHPAD_LEN) {
+		/* Convert T */
+		onewire_match_rom(s, rom);
+		onewire_byte(s, 0x44);
+
+		/* Read scratchpad */
+		onewire_match_rom(s, rom);
+		onewire_byte(s, 0xbe);
+		for (i = 0; i < ONEWIRE_SCRATCHPAD_LEN - 1; i++)
+			scratchpad[i] = random_byte(s);
+		scratchpad[i] = onewire_crc(scratchpad, i);
+		for (i = 0; i < ONEWIRE_SCRATCHPAD_LEN; i++)
+			onewire_byte(s, scratchpad[i]);
+	}
+	hold(s, 100);
+}
+
+/* I²S: 32-bit stereo samples at 48kHz. */
+
+enum { I2S_SCK, I2S_WS, I2S_SD };
+
+#define I2S_WORD_BITS	32
+#define I2S_CLOCK_RATE	(48000 * 2 * I2S_WORD_BITS)
+
+static void i2s_clock(struct signal *s, int ws, int sd)
+{
+	set(s, I2S_SCK, 0);
+	set(s, I2S_WS, ws);
+	set(s, I2S_SD, sd);
+	hold(s, 1);
+	set(s, I2S_SCK, 1);
+	hold(s, 1);
+}
+
+void signal_i2s(struct signal *s, unsigned int oversampling, size_t len)
+{
+	uint32_t word;
+	size_t n;
+	int i, ws;
+
+	signal_init(s, 1, oversampling, 2 * I2S_CLOCK_RATE, 1 << I2S_WS);
+	hold(s, 2);
+	/*
+	 * A word of silence, which the decoder skips since it didn't see it
+	 * start. WS changes a clock before the next word's MSB.
+	 */
+	for (i = I2S_WORD_BITS - 1; i >= 0; i--)
+		i2s_clock(s, i != 0, 0);
+	for (n = 0; n < len; n += sizeof(word)) {
+		ws = (n / sizeof(word)) & 1;
+		word = random_word(s);
+		for (i = I2S_WORD_BITS - 1; i >= 0; i--)
+			i2s_clock(s, i == 0 ? !ws : ws, (word >> i) & 1);
+	}
+	i2s_clock(s, 0, 0);
+}
+
+/*
+ * JTAG: debug port accesses to an STM32F10x, which has a boundary scan
+ * TAP in BYPASS in front of its Cortex-M3 TAP.
+ */
+
+enum { JTAG_TDI, JTAG_TDO, JTAG_TCK, JTAG_TMS };
+
+#define JTAG_CLOCK_RATE		1000000
+#define JTAG_IDCODE		0x3ba00477
+
+/* The Cortex-M3 TAP's instructions, the boundary scan TAP's is BYPASS. */
+#define JTAG_IR(insn)		((insn) | 0x1f << 4)
+#define JTAG_IR_LEN		(4 + 5)
+#define JTAG_IR_IDCODE		0xe
+#define JTAG_IR_DPACC		0xa
+#define JTAG_IR_APACC		0xb
+
+/* TDO of a DPACC/APACC scan starts with the previous access' ACK. */
+#define JTAG_ACK_OK		0x2
+
+static void jtag_clock(struct signal *s, int tms, int tdi, int tdo)
+{
+	set(s, JTAG_TCK, 0);
+	set(s, JTAG_TMS, tms);
+	set(s, JTAG_TDI, tdi);
+	set(s, JTAG_TDO, tdo);
+	hold(s, 1);
+	set(s, JTAG_TCK, 1);
+	hold(s, 1);
+}
+
+/* Shift n bits through IR or DR, starting and ending in Run-Test/Idle. */
+static void jtag_shift(struct signal *s, int ir, uint64_t tdi, uint64_t tdo,
+		int n)
+{
+	int i;
+
+	jtag_clock(s, 1, 0, 0); /* Select-DR-Scan */
+	if (ir)
+		jtag_clock(s, 1, 0, 0); /* Select-IR-Scan */
+	jtag_clock(s, 0, 0, 0); /* Capture */
+	jtag_clock(s, 0, 0, 0); /* Shift */
+	for (i = 0; i < n; i++)
+		jtag_clock(s, i == n - 1, (tdi >> i) & 1, (tdo >> i) & 1);
+	jtag_clock(s, 1, 0, 0); /* Update */
+	jtag_clock(s, 0, 0, 0); /* Run-Test/Idle */
+}
+
+/* A 35-bit DPACC/APACC scan, plus the boundary scan TAP's bypass bit. */
+static void jtag_access(struct signal *s, int insn, int read, int addr,
+		uint32_t data)
+{
+	uint64_t tdi, tdo;
+
+	tdi = read | ((addr >> 2) & 3) << 1 | (uint64_t)data << 3;
+	tdo = JTAG_ACK_OK | (uint64_t)data << 3;
+	jtag_shift(s, 1, JTAG_IR(insn), 0, JTAG_IR_LEN);
+	jtag_shift(s, 0, tdi, tdo, 35 + 1);
+}
+
+void signal_jtag(struct signal *s, unsigned int oversampling, size_t len)
+{
+	size_t n;
+	int i;
+
+	signal_init(s, 1, oversampling, 2 * JTAG_CLOCK_RATE, 0);
+	hold(s, 2);
+	/* Test-Logic-Reset, then Run-Test/Idle. */
+	for (i = 0; i < 5; i++)
+		jtag_clock(s, 1, 0, 0);
+	jtag_clock(s, 0, 0, 0);
+
+	for (n = 0; n < len; n += 4 * 5) {
+		jtag_shift(s, 1, JTAG_IR(JTAG_IR_IDCODE), 0, JTAG_IR_LEN);
+		jtag_shift(s, 0, 0, JTAG_IDCODE, 32 + 1);
+		/* Select an AP register bank, read and write its registers. */
+		jtag_access(s, JTAG_IR_DPACC, 0, 0x8, random_byte(s) << 4);
+		jtag_access(s, JTAG_IR_APACC, 0, 0x4, random_word(s));
+		jtag_access(s, JTAG_IR_APACC, 1, 0xc, random_word(s));
+		jtag_access(s, JTAG_IR_DPACC, 1, 0xc, random_word(s));
+	}
+}
+
+/*
+ * SWD: a line reset and JTAG-to-SWD switch, followed by debug port and
+ * access port reads and writes, all acknowledged with OK.
+ */
+
+enum { SWD_CLK, SWD_DIO };
+
+#define SWD_CLOCK_RATE		1000000
+#define SWD_ACK_OK		0x1
+
+static void swd_clock(struct signal *s, int dio)
+{
+	set(s, SWD_CLK, 0);
+	set(s, SWD_DIO, dio);
+	hold(s, 1);
+	set(s, SWD_CLK, 1);
+	hold(s, 1);
+}
+
+static int parity(uint32_t value)
+{
+	int p;
+
+	for (p = 0; value; value >>= 1)
+		p ^= value & 1;
+
+	return p;
+}
+
+/* LSB first. */
+static void swd_bits(struct signal *s, uint32_t value, int n)
+{
+	int i;
+
+	for (i = 0; i < n; i++)
+		swd_clock(s, (value >> i) & 1);
+}
+
+static void swd_line_reset(struct signal *s)
+{
+	swd_bits(s, 0xffffffff, 32);
+	swd_bits(s, 0xffffffff, 24);
+}
+
+static void swd_transfer(struct signal *s, int ap, int read, int addr,
+		uint32_t data)
+{
+	int a2, a3;
+
+	a2 = (addr >> 2) & 1;
+	a3 = (addr >> 3) & 1;
+	/* Start, APnDP, RnW, A[2:3], parity, stop, park. */
+	swd_clock(s, 1);
+	swd_clock(s, ap);
+	swd_clock(s, read);
+	swd_clock(s, a2);
+	swd_clock(s, a3);
+	swd_clock(s, ap ^ read ^ a2 ^ a3);
+	swd_clock(s, 0);
+	swd_clock(s, 1);
+
+	swd_clock(s, 0); /* Turnaround */
+	swd_bits(s, SWD_ACK_OK, 3);
+	if (!read)
+		swd_clock(s, 0); /* Turnaround */
+	swd_bits(s, data, 32);
+	swd_clock(s, parity(data));
+	if (read)
+		swd_clock(s, 0); /* Turnaround */
+	swd_bits(s, 0, 2); /* Idle */
+}
+
+void signal_swd(struct signal *s, unsigned int oversampling, size_t len)
+{
+	size_t n;
+
+	signal_init(s, 1, oversampling, 2 * SWD_CLOCK_RATE, 0);
+	hold(s, 2);
+	swd_line_reset(s);
+	swd_bits(s, 0xe79e, 16);
+	swd_line_reset(s);
+	swd_bits(s, 0, 2);
+
+	for (n = 0; n < len; n += 4 * 5) {
+		swd_transfer(s, 0, 1, 0x0, JTAG_IDCODE);
+		/* Select an AP register bank, read and write its registers. */
+		swd_transfer(s, 0, 0, 0x8, random_byte(s) << 4);
+		swd_transfer(s, 1, 0, 0x4, random_word(s));
+		swd_transfer(s, 1, 1, 0xc, random_word(s));
+		swd_transfer(s, 0, 1, 0xc, random_word(s));
+	}
+}
+
+/* Parallel: bytes on D0-D7, latched on the rising clock edge. */
+
+enum { PARALLEL_CLK, PARALLEL_D0 };
+
+#define PARALLEL_CLOCK_RATE	1000000
+
+void signal_parallel(struct signal *s, unsigned int oversampling, size_t len)
+{
+	size_t n;
+
+	/* CLK and D0-D7 need two bytes per sample. */
+	signal_init(s, 2, oversampling, 2 * PARALLEL_CLOCK_RATE, 0);
+	hold(s, 2);
+	for (n = 0; n < len; n++) {
+		/* New data, with CLK low. */
+		s->levels = random_byte(s) << PARALLEL_D0;
+		hold(s, 1);
+		set(s, PARALLEL_CLK, 1);
+		hold(s, 1);
+	}
+	set(s, PARALLEL_CLK, 0);
+	hold(s, 2);
+}
+
+/* PWM: a 10kHz signal, with a different duty cycle for every period. */
+
+enum { PWM_DATA };
+
+#define PWM_TICK_RATE	1000000
+#define PWM_PERIOD	100
+
+void signal_pwm(struct signal *s, unsigned int oversampling, size_t len)
+{
+	unsigned int duty;
+	size_t n;
+
+	signal_init(s, 1, oversampling, PWM_TICK_RATE, 0);
+	hold(s, PWM_PERIOD / 2);
+	for (n = 0; n < len; n++) {
+		duty = 5 + random_byte(s) % (PWM_PERIOD - 10);
+		set(s, PWM_DATA, 1);
+		hold(s, duty);
+		set(s, PWM_DATA, 0);
+		hold(s, PWM_PERIOD - duty);
+	}
+	set(s, PWM_DATA, 1);
+	hold(s, 1);
+}
+
+/*
+ * Z80: a straight line program of loads, stores and I/O. Every machine
+ * cycle sets up the buses, asserts its control lines for two ticks and
+ * releases them for one.
+ */
+
+enum {
+	Z80_D0 = 0,
+	Z80_M1 = 8,
+	Z80_RD,
+	Z80_WR,
+	Z80_MREQ,
+	Z80_IORQ,
+	Z80_A0,
+};
+
+#define Z80_TICK_RATE	4000000
+
+#define Z80_CONTROL	(1U << Z80_M1 | 1U << Z80_RD | 1U << Z80_WR \
+			| 1U << Z80_MREQ | 1U << Z80_IORQ)
+#define Z80_FETCH	(1U << Z80_M1 | 1U << Z80_MREQ | 1U << Z80_RD)
+#define Z80_MEMRD	(1U << Z80_MREQ | 1U << Z80_RD)
+#define Z80_MEMWR	(1U << Z80_MREQ | 1U << Z80_WR)
+#define Z80_IORD	(1U << Z80_IORQ | 1U << Z80_RD)
+#define Z80_IOWR	(1U << Z80_IORQ | 1U << Z80_WR)
+
+static void z80_cycle(struct signal *s, uint32_t control, uint16_t addr,
+		uint8_t data)
+{
+	s->levels = Z80_CONTROL | (uint32_t)addr << Z80_A0 | data << Z80_D0;
+	hold(s, 1);
+	s->levels &= ~control;
+	hold(s, 2);
+	s->levels |= Z80_CONTROL;
+}
+
+void signal_z80(struct signal *s, unsigned int oversampling, size_t len)
+{
+	uint16_t pc, nn;
+	uint8_t a, n;
+	size_t num_bytes;
+
+	/* 29 channels need four bytes per sample. */
+	signal_init(s, 4, oversampling, Z80_TICK_RATE, Z80_CONTROL);
+	hold(s, 2);
+	pc = 0;
+	a = 0;
+	for (num_bytes = 0; num_bytes < len; num_bytes += 3) {
+		n = random_byte(s);
+		nn = random_byte(s) << 8 | n;
+		switch (random_byte(s) % 6) {
+		case 0: /* LD A,n */
+			z80_cycle(s, Z80_FETCH, pc++, 0x3e);
+			a = n;
+			z80_cycle(s, Z80_MEMRD, pc++, a);
+			break;
+		case 1: /* LD (nn),A */
+			z80_cycle(s, Z80_FETCH, pc++, 0x32);
+			z80_cycle(s, Z80_MEMRD, pc++, nn & 0xff);
+			z80_cycle(s, Z80_MEMRD, pc++, nn >> 8);
+			z80_cycle(s, Z80_MEMWR, nn, a);
+			break;
+		case 2: /* LD A,(nn) */
+			z80_cycle(s, Z80_FETCH, pc++, 0x3a);
+			z80_cycle(s, Z80_MEMRD, pc++, nn & 0xff);
+			z80_cycle(s, Z80_MEMRD, pc++, nn >> 8);
+			a = random_byte(s);
+			z80_cycle(s, Z80_MEMRD, nn, a);
+			break;
+		case 3: /* OUT (n),A */
+			z80_cycle(s, Z80_FETCH, pc++, 0xd3);
+			z80_cycle(s, Z80_MEMRD, pc++, n);
+			z80_cycle(s, Z80_IOWR, a << 8 | n, a);
+			break;
+		case 4: /* IN A,(n) */
+			z80_cycle(s, Z80_FETCH, pc++, 0xdb);
+			z80_cycle(s, Z80_MEMRD, pc++, n);
+			nn = a << 8 | n;
+			a = random_byte(s);
+			z80_cycle(s, Z80_IORD, nn, a);
+			break;
+		case 5: /* NOP */
+			z80_cycle(s, Z80_FETCH, pc++, 0x00);
+			break;
+		}
+	}
+	hold(s, 1);
+}
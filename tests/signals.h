@@ -0,0 +1,64 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+ */
+
+#ifndef LIBSIGROKDECODE_TESTS_SIGNALS_H
+#define LIBSIGROKDECODE_TESTS_SIGNALS_H
+
+#include <stdint.h>
+#include <glib.h>
+
+/*
+ * A logic signal under construction. Generators work in ticks of the
+ * protocol's natural time base (one bit time, one microsecond, ...), every
+ * tick becomes 'oversampling' samples of 'unitsize' bytes each.
+ */
+struct signal {
+	GByteArray *samples;
+	unsigned int unitsize;
+	unsigned int oversampling;
+	uint64_t samplerate;
+	uint32_t levels;
+	uint32_t seed;
+};
+
+/*
+ * Generate a deterministic capture for the given decoder, carrying about
+ * 'len' bytes of payload, at 'oversampling' samples per tick. The payload
+ * is chosen so that the decoders commonly stacked on top of the named one
+ * have something to decode as well.
+ */
+typedef void (*signal_gen)(struct signal *s, unsigned int oversampling,
+		size_t len);
+
+void signal_uart(struct signal *s, unsigned int oversampling, size_t len);
+void signal_spi(struct signal *s, unsigned int oversampling, size_t len);
+void signal_i2c(struct signal *s, unsigned int oversampling, size_t len);
+void signal_can(struct signal *s, unsigned int oversampling, size_t len);
+void signal_usb(struct signal *s, unsigned int oversampling, size_t len);
+void signal_onewire(struct signal *s, unsigned int oversampling, size_t len);
+void signal_i2s(struct signal *s, unsigned int oversampling, size_t len);
+void signal_jtag(struct signal *s, unsigned int oversampling, size_t len);
+void signal_swd(struct signal *s, unsigned int oversampling, size_t len);
+void signal_parallel(struct signal *s, unsigned int oversampling, size_t len);
+void signal_pwm(struct signal *s, unsigned int oversampling, size_t len);
+void signal_z80(struct signal *s, unsigned int oversampling, size_t len);
+
+uint64_t signal_num_samples(const struct signal *s);
+void signal_free(struct signal *s);
+
+#endif
@@ -22,10 +22,6 @@
 #include "libsigrokdecode.h"
 #include <inttypes.h>
 
-typedef struct {
-        PyObject_HEAD
-} srd_Decoder;
-
 /* This is only used for nicer srd_dbg() output.
  */
 static const char *output_type_name(unsigned int idx)
@@ -40,14 +36,11 @@ static const char *output_type_name(unsigned int idx)
 	return names[MIN(idx, G_N_ELEMENTS(names) - 1)];
 }
 
-static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
-		struct srd_proto_data *pdata)
+/* Check an annotation submitted by a PD, and extract its parts. */
+static int check_annotation(struct srd_decoder_inst *di, PyObject *obj,
+		int *ann_class, PyObject **py_texts)
 {
 	PyObject *py_tmp;
-	struct srd_pd_output *pdo;
-	struct srd_proto_data_annotation *pda;
-	int ann_class;
-	char **ann_text;
 
 	/* Should be a list of [annotation class, [string, ...]]. */
 	if (!PyList_Check(obj)) {
@@ -74,10 +67,11 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 			"first element was not an integer.", di->decoder->name);
 		return SRD_ERR_PYTHON;
 	}
-	ann_class = PyLong_AsLong(py_tmp);
-	if (!(pdo = g_slist_nth_data(di->decoder->annotations, ann_class))) {
+	*ann_class = PyLong_AsLong(py_tmp);
+	if (*ann_class < 0
+			|| (guint)*ann_class >= di->decoder->annotation_table->len) {
 		srd_err("Protocol decoder %s submitted data to unregistered "
-			"annotation class %d.", di->decoder->name, ann_class);
+			"annotation class %d.", di->decoder->name, *ann_class);
 		return SRD_ERR_PYTHON;
 	}
 
@@ -88,7 +82,18 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 			"second element was not a list.", di->decoder->name);
 		return SRD_ERR_PYTHON;
 	}
-	if (py_strseq_to_char(py_tmp, &ann_text) != SRD_OK) {
+	*py_texts = py_tmp;
+
+	return SRD_OK;
+}
+
+static int convert_annotation(struct srd_decoder_inst *di, int ann_class,
+		PyObject *py_texts, struct srd_proto_data *pdata)
+{
+	struct srd_proto_data_annotation *pda;
+	char **ann_text;
+
+	if (py_strseq_to_char(py_texts, &ann_text) != SRD_OK) {
 		srd_err("Protocol decoder %s submitted annotation list, but "
 			"second element was malformed.", di->decoder->name);
 		return SRD_ERR_PYTHON;
@@ -102,14 +107,65 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 	return SRD_OK;
 }
 
+static void annotation_free(struct srd_proto_data_annotation *pda)
+{
+	g_strfreev(pda->ann_text);
+	g_free(pda);
+}
+
+/*
+ * Append an annotation to the session's batch, copying its texts into
+ * the batch's string storage. The batch is passed to the frontend when
+ * it is full, or at the end of srd_session_send().
+ */
+static int batch_annotation(struct srd_decoder_inst *di, int ann_class,
+		PyObject *py_texts, const struct srd_proto_data *pdata)
+{
+	struct srd_session *sess;
+	PyObject *py_item, *py_bytes;
+	Py_ssize_t num_texts, i;
+	guint text_idx;
+
+	sess = di->sess;
+	text_idx = sess->batch_texts->len;
+	num_texts = PyList_Size(py_texts);
+	for (i = 0; i < num_texts; i++) {
+		py_item = PyList_GetItem(py_texts, i);
+		if (!PyUnicode_Check(py_item)) {
+			srd_err("Protocol decoder %s submitted annotation "
+				"list, but second element was malformed.",
+				di->decoder->name);
+			g_ptr_array_set_size(sess->batch_texts, text_idx);
+			return SRD_ERR_PYTHON;
+		}
+		if (!(py_bytes = PyUnicode_AsUTF8String(py_item))) {
+			srd_exception_catch("Failed to obtain string item");
+			g_ptr_array_set_size(sess->batch_texts, text_idx);
+			return SRD_ERR_PYTHON;
+		}
+		g_ptr_array_add(sess->batch_texts, g_string_chunk_insert(
+				sess->batch_strings, PyBytes_AsString(py_bytes)));
+		Py_DECREF(py_bytes);
+	}
+	/* Each annotation's texts are a NULL-terminated vector. */
+	g_ptr_array_add(sess->batch_texts, NULL);
+
+	srd_pd_output_batch_add(sess, pdata, ann_class, text_idx);
+
+	return SRD_OK;
+}
+
+/*
+ * The binary data isn't copied, pdb points into the bytes object, which
+ * the PD's put() call keeps alive while the callbacks run.
+ */
 static int convert_binary(struct srd_decoder_inst *di, PyObject *obj,
-		struct srd_proto_data *pdata)
+		struct srd_proto_data *pdata, struct srd_proto_data_binary *pdb)
 {
-	struct srd_proto_data_binary *pdb;
 	PyObject *py_tmp;
 	Py_ssize_t size;
 	int bin_class;
-	char *class_name, *buf;
+	char *buf;
 
 	/* Should be a list of [binary class, bytes]. */
 	if (!PyList_Check(obj)) {
@@ -134,7 +190,8 @@ static int convert_binary(struct srd_decoder_inst *di, PyObject *obj,
 		return SRD_ERR_PYTHON;
 	}
 	bin_class = PyLong_AsLong(py_tmp);
-	if (!(class_name = g_slist_nth_data(di->decoder->binary, bin_class))) {
+	if (bin_class < 0
+			|| (guint)bin_class >= di->decoder->binary_table->len) {
 		srd_err("Protocol decoder %s submitted SRD_OUTPUT_BINARY with "
 			"unregistered binary class %d.", di->decoder->name, bin_class);
 		return SRD_ERR_PYTHON;
@@ -155,14 +212,11 @@ static int convert_binary(struct srd_decoder_inst *di, PyObject *obj,
 		return SRD_ERR_PYTHON;
 	}
 
-	pdb = g_malloc(sizeof(struct srd_proto_data_binary));
 	if (PyBytes_AsStringAndSize(py_tmp, &buf, &size) == -1)
 		return SRD_ERR_PYTHON;
 	pdb->bin_class = bin_class;
 	pdb->size = size;
-	if (!(pdb->data = g_try_malloc(pdb->size)))
-		return SRD_ERR_MALLOC;
-	memcpy((void *)pdb->data, (const void *)buf, pdb->size);
+	pdb->data = (const unsigned char *)buf;
 	pdata->data = pdb;
 
 	return SRD_OK;
@@ -198,20 +252,72 @@ static int convert_meta(struct srd_proto_data *pdata, PyObject *obj)
 	return SRD_OK;
 }
 
-static PyObject *Decoder_put(PyObject *self, PyObject *args)
+/**
+ * Pass OUTPUT_PYTHON data to the instances stacked on top of the one that
+ * produced it, and to the frontend callbacks.
+ *
+ * Must be called with the GIL held.
+ *
+ * @param pdata The output, its data is the Python object.
+ *
+ * @private
+ */
+SRD_PRIV void srd_pd_output_python_send(struct srd_proto_data *pdata)
 {
-	GSList *l;
-	PyObject *py_data, *py_res;
+	GSList *l, *cbs;
+	PyObject *py_res, *py_ss, *py_es;
 	struct srd_decoder_inst *di, *next_di;
+
+	di = pdata->pdo->di;
+	if (di->next_di) {
+		/* The same sample numbers go to every stacked instance. */
+		py_ss = PyLong_FromUnsignedLongLong(pdata->start_sample);
+		py_es = PyLong_FromUnsignedLongLong(pdata->end_sample);
+		for (l = di->next_di; py_ss && py_es && l; l = l->next) {
+			next_di = l->data;
+			srd_spew("Sending %" PRIu64 "-%" PRIu64 " to instance %s",
+				 pdata->start_sample, pdata->end_sample,
+				 next_di->inst_id);
+			if (next_di->py_decode_batch) {
+				srd_inst_decode_batch_add(next_di, py_ss, py_es,
+						pdata->data);
+				continue;
+			}
+			if (!(py_res = srd_inst_decode_call(next_di, py_ss,
+					py_es, pdata->data))) {
+				srd_exception_catch("Calling %s decode() failed",
+							next_di->inst_id);
+			}
+			Py_XDECREF(py_res);
+		}
+		if (!py_ss || !py_es)
+			srd_exception_catch("Failed to pass output of %s",
+					di->inst_id);
+		Py_XDECREF(py_ss);
+		Py_XDECREF(py_es);
+	}
+
+	if ((cbs = srd_pd_output_callbacks_get(di->sess, SRD_OUTPUT_PYTHON))) {
+		/* Frontends aren't really supposed to get Python
+		 * callbacks, but it's useful for testing. */
+		srd_pd_output_callbacks_send(cbs, pdata);
+	}
+}
+
+static PyObject *Decoder_put(PyObject *self, PyObject *args)
+{
+	PyObject *py_data, *py_texts;
+	struct srd_decoder_inst *di;
 	struct srd_pd_output *pdo;
-	struct srd_proto_data *pdata;
+	struct srd_proto_data pdata;
+	struct srd_proto_data_binary pdb;
 	uint64_t start_sample, end_sample;
-	int output_id;
-	struct srd_pd_callback *cb;
+	int output_id, ann_class;
+	gboolean delivered;
+	GSList *cbs;
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
-		/* Shouldn't happen. */
-		srd_dbg("put(): self instance not found.");
+	if (!(di = ((srd_Decoder *)self)->di)) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		return NULL;
 	}
 
@@ -225,72 +331,79 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 		return NULL;
 	}
 
-	if (!(l = g_slist_nth(di->pd_output, output_id))) {
+	if (!di->pd_output_table || output_id < 0
+			|| (guint)output_id >= di->pd_output_table->len) {
 		srd_err("Protocol decoder %s submitted invalid output ID %d.",
 			di->decoder->name, output_id);
 		return NULL;
 	}
-	pdo = l->data;
+	pdo = g_ptr_array_index(di->pd_output_table, output_id);
 
 	srd_spew("Instance %s put %" PRIu64 "-%" PRIu64 " %s on oid %d.",
 		 di->inst_id, start_sample, end_sample,
 		 output_type_name(pdo->output_type), output_id);
 
-	pdata = g_malloc0(sizeof(struct srd_proto_data));
-	pdata->start_sample = start_sample;
-	pdata->end_sample = end_sample;
-	pdata->pdo = pdo;
+	/* Callbacks must not keep a reference to this. */
+	pdata.start_sample = start_sample;
+	pdata.end_sample = end_sample;
+	pdata.pdo = pdo;
+	pdata.data = NULL;
+
+	if (pdo->output_type >= 0 && pdo->output_type < SRD_OUTPUT_TYPE_COUNT)
+		di->stats.put_calls[pdo->output_type]++;
+
+	/* Resolve the frontend callbacks for this output type once. */
+	cbs = srd_pd_output_callbacks_get(di->sess, pdo->output_type);
 
 	switch (pdo->output_type) {
 	case SRD_OUTPUT_ANN:
 		/* Annotations are only fed to callbacks. */
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
-			/* Convert from PyDict to srd_proto_data_annotation. */
-			if (convert_annotation(di, py_data, pdata) != SRD_OK) {
-				/* An error was already logged. */
-				break;
-			}
-			cb->cb(pdata, cb->cb_data);
+		if (!cbs && !di->sess->batch_cb)
+			break;
+		if (check_annotation(di, py_data, &ann_class, &py_texts) != SRD_OK) {
+			/* An error was already logged. */
+			break;
+		}
+		/* Don't convert what the frontend doesn't want to see. */
+		if (di->ann_class_enabled && !di->ann_class_enabled[ann_class])
+			break;
+		/* Convert from PyDict to srd_proto_data_annotation. */
+		delivered = FALSE;
+		if (cbs && convert_annotation(di, ann_class, py_texts,
+				&pdata) == SRD_OK) {
+			srd_pd_output_callbacks_send(cbs, &pdata);
+			annotation_free(pdata.data);
+			delivered = TRUE;
 		}
+		if (di->sess->batch_cb && batch_annotation(di, ann_class,
+				py_texts, &pdata) == SRD_OK)
+			delivered = TRUE;
+		if (delivered)
+			di->stats.annotations++;
 		break;
 	case SRD_OUTPUT_PYTHON:
-		for (l = di->next_di; l; l = l->next) {
-			next_di = l->data;
-			srd_spew("Sending %" PRIu64 "-%" PRIu64 " to instance %s",
-				 start_sample, end_sample, next_di->inst_id);
-			if (!(py_res = PyObject_CallMethod(
-				next_di->py_inst, "decode", "KKO", start_sample,
-				end_sample, py_data))) {
-				srd_exception_catch("Calling %s decode() failed",
-							next_di->inst_id);
-			}
-			Py_XDECREF(py_res);
-		}
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
-			/* Frontends aren't really supposed to get Python
-			 * callbacks, but it's useful for testing. */
-			pdata->data = py_data;
-			cb->cb(pdata, cb->cb_data);
-		}
+		pdata.data = py_data;
+		srd_pd_output_python_send(&pdata);
 		break;
 	case SRD_OUTPUT_BINARY:
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
+		if (cbs) {
 			/* Convert from PyDict to srd_proto_data_binary. */
-			if (convert_binary(di, py_data, pdata) != SRD_OK) {
+			if (convert_binary(di, py_data, &pdata, &pdb) != SRD_OK) {
 				/* An error was already logged. */
 				break;
 			}
-			cb->cb(pdata, cb->cb_data);
+			di->stats.binary_bytes += pdb.size;
+			srd_pd_output_callbacks_send(cbs, &pdata);
 		}
 		break;
 	case SRD_OUTPUT_META:
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
+		if (cbs) {
 			/* Annotations need converting from PyObject. */
-			if (convert_meta(pdata, py_data) != SRD_OK) {
+			if (convert_meta(&pdata, py_data) != SRD_OK) {
 				/* An exception was already set up. */
 				break;
 			}
-			cb->cb(pdata, cb->cb_data);
+			srd_pd_output_callbacks_send(cbs, &pdata);
 		}
 		break;
 	default:
@@ -299,8 +412,6 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 		break;
 	}
 
-	g_free(pdata);
-
 	Py_RETURN_NONE;
 }
 
@@ -320,7 +431,7 @@ static PyObject *Decoder_register(PyObject *self, PyObject *args,
 	meta_type_gv = NULL;
 	meta_name = meta_descr = NULL;
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = ((srd_Decoder *)self)->di)) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		return NULL;
 	}
@@ -352,7 +463,9 @@ static PyObject *Decoder_register(PyObject *self, PyObject *args,
 	pdo = g_malloc(sizeof(struct srd_pd_output));
 
 	/* pdo_id is just a simple index, nothing is deleted from this list anyway. */
-	pdo->pdo_id = g_slist_length(di->pd_output);
+	if (!di->pd_output_table)
+		di->pd_output_table = g_ptr_array_new();
+	pdo->pdo_id = di->pd_output_table->len;
 	pdo->output_type = output_type;
 	pdo->di = di;
 	pdo->proto_id = g_strdup(proto_id);
@@ -364,16 +477,50 @@ static PyObject *Decoder_register(PyObject *self, PyObject *args,
 	}
 
 	di->pd_output = g_slist_append(di->pd_output, pdo);
+	g_ptr_array_add(di->pd_output_table, pdo);
 	py_new_output_id = Py_BuildValue("i", pdo->pdo_id);
 
 	return py_new_output_id;
 }
 
+static PyObject *Decoder_ann_class_enabled(PyObject *self, PyObject *args)
+{
+	struct srd_decoder_inst *di;
+	int ann_class;
+
+	if (!(di = ((srd_Decoder *)self)->di)) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		return NULL;
+	}
+
+	if (!PyArg_ParseTuple(args, "i", &ann_class))
+		return NULL;
+
+	if (ann_class < 0
+			|| (guint)ann_class >= di->decoder->annotation_table->len) {
+		PyErr_Format(PyExc_ValueError, "Invalid annotation class %d.",
+				ann_class);
+		return NULL;
+	}
+
+	/* Without anyone receiving annotations, no class is wanted. */
+	if (!srd_pd_output_callbacks_get(di->sess, SRD_OUTPUT_ANN)
+			&& !di->sess->batch_cb)
+		Py_RETURN_FALSE;
+
+	if (di->ann_class_enabled && !di->ann_class_enabled[ann_class])
+		Py_RETURN_FALSE;
+
+	Py_RETURN_TRUE;
+}
+
 static PyMethodDef Decoder_methods[] = {
 	{"put", Decoder_put, METH_VARARGS,
 	 "Accepts a dictionary with the following keys: startsample, endsample, data"},
 	{"register", (PyCFunction)Decoder_register, METH_VARARGS|METH_KEYWORDS,
 			"Register a new output stream"},
+	{"ann_class_enabled", Decoder_ann_class_enabled, METH_VARARGS,
+	 "Returns whether the frontend wants annotations of the given class"},
 	{NULL, NULL, 0, NULL}
 };
 
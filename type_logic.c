@@ -28,15 +28,59 @@ static PyObject *srd_logic_iter(PyObject *self)
 	return self;
 }
 
+/* Check whether any of the masked channels differ between two samples. */
+static gboolean sample_changed(const uint8_t *sample, const uint8_t *prev,
+		const uint8_t *mask, int unitsize)
+{
+	int i;
+
+	for (i = 0; i < unitsize; i++) {
+		if ((sample[i] ^ prev[i]) & mask[i])
+			return TRUE;
+	}
+
+	return FALSE;
+}
+
+/* Skip ahead to the next sample where one of the mapped channels changed. */
+static void skip_unchanged(srd_logic *logic, uint64_t num_samples)
+{
+	struct srd_decoder_inst *di;
+	const uint8_t *sample_pos, *prev;
+
+	di = logic->di;
+	while (logic->itercnt < num_samples) {
+		sample_pos = logic->inbuf + logic->itercnt * di->data_unitsize;
+		if (logic->itercnt > 0)
+			prev = sample_pos - di->data_unitsize;
+		else if (di->last_sample_valid)
+			prev = di->last_sample;
+		else
+			/* Always hand out the very first sample. */
+			return;
+		if (sample_changed(sample_pos, prev, di->channel_mask,
+				di->data_unitsize))
+			return;
+		logic->itercnt++;
+	}
+}
+
 static PyObject *srd_logic_iternext(PyObject *self)
 {
 	srd_logic *logic;
+	struct srd_decoder_inst *di;
 	PyObject *py_samplenum, *py_samples;
 	uint8_t *sample_pos, sample;
-	int byte_offset, bit_offset, i;
+	uint64_t num_samples;
+	unsigned int pattern;
+	int i;
 
 	logic = (srd_logic *)self;
-	if (logic->itercnt >= logic->inbuflen / logic->di->data_unitsize) {
+	num_samples = logic->inbuflen / logic->di->data_unitsize;
+	if (logic->transitions_only && !logic->seek_done)
+		skip_unchanged(logic, num_samples);
+	logic->seek_done = FALSE;
+	if (logic->itercnt >= num_samples) {
 		/* End iteration loop. */
 		return NULL;
 	}
@@ -44,19 +88,20 @@ static PyObject *srd_logic_iternext(PyObject *self)
 	/*
 	 * Convert the bit-packed sample to an array of bytes, with only 0x01
 	 * and 0x00 values, so the PD doesn't need to do any bitshifting.
+	 * Unused optional channels always read 0xff, see
+	 * channel_lookup_update().
 	 */
-	sample_pos = logic->inbuf + logic->itercnt * logic->di->data_unitsize;
-	for (i = 0; i < logic->di->dec_num_channels; i++) {
-		/* A channelmap value of -1 means "unused optional channel". */
-		if (logic->di->dec_channelmap[i] == -1) {
-			/* Value of unused channel is 0xff, instead of 0 or 1. */
-			logic->di->channel_samples[i] = 0xff;
-		} else {
-			byte_offset = logic->di->dec_channelmap[i] / 8;
-			bit_offset = logic->di->dec_channelmap[i] % 8;
-			sample = *(sample_pos + byte_offset) & (1 << bit_offset) ? 1 : 0;
-			logic->di->channel_samples[i] = sample;
-		}
+	di = logic->di;
+	sample_pos = logic->inbuf + logic->itercnt * di->data_unitsize;
+	pattern = 0;
+	for (i = 0; i < di->dec_num_channels; i++) {
+		if (di->channel_byte_offsets[i] == -1)
+			continue;
+		sample = sample_pos[di->channel_byte_offsets[i]]
+				& di->channel_bit_masks[i] ? 1 : 0;
+		di->channel_samples[i] = sample;
+		if (di->pins_cache)
+			pattern |= sample << i;
 	}
 
 	/* Prepare the next samplenum/sample list in this iteration. */
@@ -64,8 +109,20 @@ static PyObject *srd_logic_iternext(PyObject *self)
 	    PyLong_FromUnsignedLongLong(logic->start_samplenum +
 					logic->itercnt);
 	PyList_SetItem(logic->sample, 0, py_samplenum);
-	py_samples = PyBytes_FromStringAndSize((const char *)logic->di->channel_samples,
-					       logic->di->dec_num_channels);
+	if (di->pins_cache) {
+		/* The same channel values always map to the same object. */
+		if (!(py_samples = di->pins_cache[pattern])) {
+			py_samples = PyBytes_FromStringAndSize(
+					(const char *)di->channel_samples,
+					di->dec_num_channels);
+			di->pins_cache[pattern] = py_samples;
+		}
+		Py_XINCREF(py_samples);
+	} else {
+		py_samples = PyBytes_FromStringAndSize(
+				(const char *)di->channel_samples,
+				di->dec_num_channels);
+	}
 	PyList_SetItem(logic->sample, 1, py_samples);
 	Py_INCREF(logic->sample);
 	logic->itercnt++;
@@ -73,6 +130,278 @@ static PyObject *srd_logic_iternext(PyObject *self)
 	return logic->sample;
 }
 
+/*
+ * Advance the iterator to the next edge of the given type on the given
+ * decoder channel. The sample at the current iterator position is
+ * compared against the one before it, which may be the last sample of
+ * the previous chunk. Returns FALSE and exhausts the iterator if the
+ * chunk has no such edge.
+ */
+static gboolean find_edge(srd_logic *logic, int channel, char edge)
+{
+	struct srd_decoder_inst *di;
+	const uint8_t *sample_pos;
+	uint64_t num_samples, pos;
+	uint8_t bit_mask, cur, prev;
+	int byte_offset;
+
+	di = logic->di;
+	num_samples = logic->inbuflen / di->data_unitsize;
+	byte_offset = di->channel_byte_offsets[channel];
+	bit_mask = di->channel_bit_masks[channel];
+
+	pos = logic->itercnt;
+	if (pos >= num_samples)
+		return FALSE;
+	sample_pos = logic->inbuf + pos * di->data_unitsize + byte_offset;
+	if (pos > 0) {
+		prev = *(sample_pos - di->data_unitsize) & bit_mask;
+	} else if (di->last_sample_valid) {
+		prev = di->last_sample[byte_offset] & bit_mask;
+	} else {
+		/* Nothing to compare the very first sample against. */
+		prev = *sample_pos & bit_mask;
+		sample_pos += di->data_unitsize;
+		pos++;
+	}
+
+	for (; pos < num_samples; pos++, sample_pos += di->data_unitsize) {
+		cur = *sample_pos & bit_mask;
+		if (cur != prev && (edge == 'e' || (edge == 'r') == (cur != 0))) {
+			logic->itercnt = pos;
+			return TRUE;
+		}
+		prev = cur;
+	}
+	logic->itercnt = num_samples;
+
+	return FALSE;
+}
+
+/**
+ * Continue a skip_to() or next_edge() request which couldn't be satisfied
+ * within the previous chunk. Must be called on a freshly set up chunk,
+ * before the PD gets to iterate over it.
+ *
+ * @param logic The logic object holding the new chunk.
+ *
+ * @private
+ */
+SRD_PRIV void srd_logic_seek_resume(srd_logic *logic)
+{
+	struct srd_decoder_inst *di;
+	uint64_t num_samples, target;
+
+	di = logic->di;
+	num_samples = logic->inbuflen / di->data_unitsize;
+
+	if (di->seek_samplenum) {
+		target = di->seek_samplenum;
+		if (target < logic->start_samplenum + num_samples) {
+			if (target > logic->start_samplenum)
+				logic->itercnt = target - logic->start_samplenum;
+			di->seek_samplenum = 0;
+			logic->seek_done = TRUE;
+		} else {
+			logic->itercnt = num_samples;
+		}
+	} else if (di->seek_edge) {
+		if (find_edge(logic, di->seek_channel, di->seek_edge)) {
+			di->seek_edge = 0;
+			logic->seek_done = TRUE;
+		}
+	}
+}
+
+static PyObject *srd_logic_skip_to(PyObject *self, PyObject *args)
+{
+	srd_logic *logic;
+	uint64_t num_samples, samplenum;
+
+	logic = (srd_logic *)self;
+	if (!PyArg_ParseTuple(args, "K", &samplenum))
+		return NULL;
+
+	/* Seeking backwards is not possible, just continue from here. */
+	if (samplenum <= logic->start_samplenum + logic->itercnt)
+		Py_RETURN_TRUE;
+
+	num_samples = logic->inbuflen / logic->di->data_unitsize;
+	if (samplenum < logic->start_samplenum + num_samples) {
+		logic->itercnt = samplenum - logic->start_samplenum;
+		logic->seek_done = TRUE;
+		Py_RETURN_TRUE;
+	}
+
+	/* Beyond this chunk: end the iteration, resume in the next one. */
+	logic->itercnt = num_samples;
+	logic->di->seek_samplenum = samplenum;
+
+	Py_RETURN_FALSE;
+}
+
+static PyObject *srd_logic_next_edge(PyObject *self, PyObject *args)
+{
+	srd_logic *logic;
+	struct srd_decoder_inst *di;
+	const char *edge;
+	gboolean found;
+	int channel;
+
+	logic = (srd_logic *)self;
+	di = logic->di;
+
+	edge = "e";
+	if (!PyArg_ParseTuple(args, "i|s", &channel, &edge))
+		return NULL;
+
+	if (channel < 0 || channel >= di->dec_num_channels) {
+		PyErr_Format(PyExc_ValueError, "Invalid channel index %d.",
+				channel);
+		return NULL;
+	}
+	if (di->channel_byte_offsets[channel] == -1
+			|| di->channel_byte_offsets[channel] >= di->data_unitsize) {
+		PyErr_Format(PyExc_ValueError, "Channel %d is not available.",
+				channel);
+		return NULL;
+	}
+	if (strlen(edge) != 1 || !strchr("rfe", edge[0])) {
+		PyErr_Format(PyExc_ValueError, "Invalid edge type '%s', "
+				"expected 'r', 'f' or 'e'.", edge);
+		return NULL;
+	}
+
+	/* The scan only looks at the sample buffer, not at Python objects. */
+	Py_BEGIN_ALLOW_THREADS
+	found = find_edge(logic, channel, edge[0]);
+	Py_END_ALLOW_THREADS
+
+	if (found) {
+		logic->seek_done = TRUE;
+		Py_RETURN_TRUE;
+	}
+
+	/* No such edge in this chunk, keep searching in the next one. */
+	di->seek_channel = channel;
+	di->seek_edge = edge[0];
+
+	Py_RETURN_FALSE;
+}
+
+static PyObject *srd_logic_raw(PyObject *self, PyObject *args)
+{
+	srd_logic *logic;
+
+	(void)args;
+
+	logic = (srd_logic *)self;
+
+	/*
+	 * The input buffer is only valid while the chunk is being decoded,
+	 * so hand out a view of a copy, which the PD may keep around.
+	 */
+	if (!logic->py_raw) {
+		logic->py_raw = PyBytes_FromStringAndSize(
+				(const char *)logic->inbuf, logic->inbuflen);
+		if (!logic->py_raw)
+			return NULL;
+	}
+
+	return PyMemoryView_FromObject(logic->py_raw);
+}
+
+static PyObject *srd_logic_channels(PyObject *self, PyObject *args)
+{
+	srd_logic *logic;
+	struct srd_decoder_inst *di;
+	PyObject *py_channels, *py_samples;
+	uint8_t *samples, *sample_pos, bit_mask;
+	uint64_t num_samples, s;
+	int i;
+
+	(void)args;
+
+	logic = (srd_logic *)self;
+	if (logic->py_channels) {
+		Py_INCREF(logic->py_channels);
+		return logic->py_channels;
+	}
+
+	di = logic->di;
+	num_samples = logic->inbuflen / di->data_unitsize;
+	if (!(py_channels = PyTuple_New(di->dec_num_channels)))
+		return NULL;
+
+	/*
+	 * Unpack the whole chunk into one bytes object per channel, with
+	 * the same 0x00/0x01/0xff values the iterator hands out per sample.
+	 * Nothing else can see the new object yet, so other threads may run
+	 * Python code while it's being filled in.
+	 */
+	for (i = 0; i < di->dec_num_channels; i++) {
+		py_samples = PyBytes_FromStringAndSize(NULL, num_samples);
+		if (!py_samples) {
+			Py_DECREF(py_channels);
+			return NULL;
+		}
+		samples = (uint8_t *)PyBytes_AsString(py_samples);
+		Py_BEGIN_ALLOW_THREADS
+		if (di->channel_byte_offsets[i] == -1) {
+			/* Value of unused channel is 0xff, instead of 0 or 1. */
+			memset(samples, 0xff, num_samples);
+		} else {
+			bit_mask = di->channel_bit_masks[i];
+			sample_pos = logic->inbuf + di->channel_byte_offsets[i];
+			for (s = 0; s < num_samples; s++) {
+				samples[s] = (*sample_pos & bit_mask) ? 1 : 0;
+				sample_pos += di->data_unitsize;
+			}
+		}
+		Py_END_ALLOW_THREADS
+		PyTuple_SetItem(py_channels, i, py_samples);
+	}
+
+	logic->py_channels = py_channels;
+	Py_INCREF(py_channels);
+
+	return py_channels;
+}
+
+static void srd_logic_dealloc(PyObject *self)
+{
+	srd_logic *logic;
+	PyTypeObject *type;
+
+	logic = (srd_logic *)self;
+	type = Py_TYPE(self);
+
+	Py_XDECREF(logic->sample);
+	Py_XDECREF(logic->py_raw);
+	Py_XDECREF(logic->py_channels);
+	PyObject_Del(self);
+
+#if PY_VERSION_HEX >= 0x03080000
+	/* Instances of heap types hold a reference to their type. */
+	Py_DECREF(type);
+#else
+	(void)type;
+#endif
+}
+
+static PyMethodDef srd_logic_methods[] = {
+	{"skip_to", srd_logic_skip_to, METH_VARARGS,
+	 "Make the sample with the given number the next one to be iterated"},
+	{"next_edge", srd_logic_next_edge, METH_VARARGS,
+	 "Make the next 'r'ising, 'f'alling or 'e'ither edge on the given "
+	 "channel the next sample to be iterated"},
+	{"raw", srd_logic_raw, METH_NOARGS,
+	 "Return a memoryview of the bit-packed samples of the whole chunk"},
+	{"channels", srd_logic_channels, METH_NOARGS,
+	 "Return a tuple with one bytes object of unpacked samples per channel"},
+	{NULL, NULL, 0, NULL}
+};
+
 /** Create the srd_logic type.
  * @return The new type object.
  * @private
@@ -84,6 +413,8 @@ SRD_PRIV PyObject *srd_logic_type_new(void)
 		{ Py_tp_doc, "sigrokdecode logic sample object" },
 		{ Py_tp_iter, (void *)&srd_logic_iter },
 		{ Py_tp_iternext, (void *)&srd_logic_iternext },
+		{ Py_tp_methods, srd_logic_methods },
+		{ Py_tp_dealloc, (void *)&srd_logic_dealloc },
 		{ Py_tp_new, (void *)&PyType_GenericNew },
 		{ 0, NULL }
 	};
@@ -0,0 +1,1315 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <config.h>
+#include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
+#include "libsigrokdecode.h"
+#include <inttypes.h>
+#include <string.h>
+#ifdef G_OS_UNIX
+#include <errno.h>
+#include <poll.h>
+#include <signal.h>
+#include <sys/socket.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <unistd.h>
+#endif
+
+#if defined(G_OS_UNIX) && PY_VERSION_HEX >= 0x03070000 \
+		&& Py_LIMITED_API + 0 < 0x03070000
+/* Part of the stable ABI since Python 3.7, newer than what we build for. */
+PyAPI_FUNC(void) PyOS_BeforeFork(void);
+PyAPI_FUNC(void) PyOS_AfterFork_Parent(void);
+PyAPI_FUNC(void) PyOS_AfterFork_Child(void);
+#endif
+
+/**
+ * @file
+ *
+ * Decoding in worker processes.
+ *
+ * When enabled with srd_session_workers_set(), srd_session_start() forks
+ * one worker process per bottom-level decoder instance in the session.
+ * Each worker is a copy of the frontend process at that point, and only
+ * decodes its own stack. Sample data and metadata are passed to all
+ * workers, which decode at the same time and send their output back over
+ * a socket. The output is passed to the frontend callbacks stack by
+ * stack, in the order the stacks were added to the session. This is the
+ * same order in which they would be decoded in-process.
+ *
+ * srd_session_send_segmented() forks one worker process per segment of a
+ * capture instead. These only decode the bottom-level instances. Their
+ * OUTPUT_PYTHON data is passed back pickled, and fed to the stacked
+ * instances in the frontend process.
+ *
+ * Workers are forked from the calling thread, and locks other threads
+ * hold at that time are never released in the workers. Forking is thus
+ * ruled out while a session decodes asynchronously.
+ */
+
+/** @cond PRIVATE */
+
+extern SRD_PRIV GSList *sessions;
+
+/* Commands sent to a worker. Each one is answered by WORKER_REPLY_DONE. */
+enum {
+	WORKER_CMD_DECODE,
+	WORKER_CMD_META,
+};
+
+struct worker_cmd {
+	uint32_t type;
+	/* WORKER_CMD_META */
+	int32_t key;
+	uint64_t value;
+	/* WORKER_CMD_DECODE, the sample data follows. */
+	uint64_t start_samplenum;
+	uint64_t end_samplenum;
+	uint64_t inbuflen;
+	uint64_t unitsize;
+};
+
+/* Replies from a worker. */
+enum {
+	WORKER_REPLY_OUTPUT,
+	WORKER_REPLY_DONE,
+};
+
+struct worker_reply {
+	uint32_t type;
+	/* Size of the data following the reply. */
+	uint32_t size;
+	/* WORKER_REPLY_DONE: the command's return value. */
+	int32_t ret;
+	/* WORKER_REPLY_OUTPUT: the output, and where it came from. */
+	uint32_t inst_idx;
+	int32_t pdo_id;
+	/* Annotation or binary class. */
+	int32_t out_class;
+	/* Number of NUL-terminated annotation texts in the data. */
+	uint32_t num_texts;
+	uint64_t start_sample;
+	uint64_t end_sample;
+};
+
+struct srd_worker {
+	/* The bottom-level instance of the stack this worker decodes. */
+	struct srd_decoder_inst *di;
+	/* All instances in the stack, outputs refer to them by index. */
+	GPtrArray *insts;
+	pid_t pid;
+	int fd;
+	/* Replies to the current command which weren't dispatched yet. */
+	GByteArray *replies;
+	/* How much of the replies is complete. */
+	guint parsed;
+	gboolean done;
+	/* Not read from for now, see srd_segments_send(). */
+	gboolean paused;
+	int ret;
+	/* Annotation texts of the output being dispatched. */
+	GPtrArray *texts;
+	/* The callback which sends output to the frontend process. */
+	struct srd_pd_callback cb;
+	/* Segment workers: the samples to decode, as indices into inbuf. */
+	uint64_t warmup_start;
+	uint64_t seg_start;
+	uint64_t seg_end;
+	/* Output starting before this sample number isn't passed on. */
+	uint64_t drop_before;
+	/* pickle.dumps() and pickle.loads(), for OUTPUT_PYTHON data. */
+	PyObject *py_dumps;
+	PyObject *py_loads;
+};
+
+/* What a PD's resync() method returned, see srd_session_send_segmented(). */
+struct resync_cond {
+	uint64_t num_samples;
+	int num_channels;
+	/* Byte offset, bit mask and level (0, 1 or -1) of each used channel. */
+	int *byte_offsets;
+	uint8_t *bit_masks;
+	int *levels;
+};
+
+/** @endcond */
+
+#ifdef G_OS_UNIX
+
+/* Replies are sent on once this much has been collected. */
+#define WORKER_SEND_SIZE	(64 * 1024)
+
+/* Output a segment buffers while it waits for the segments before it. */
+#define SEGMENT_BUFFER_SIZE	(4 * 1024 * 1024)
+
+/*
+ * A worker that went away must not kill us with SIGPIPE. Where send()
+ * can't be told so, the sockets are set up with SO_NOSIGPIPE instead.
+ */
+#ifdef MSG_NOSIGNAL
+#define WORKER_SEND_FLAGS	MSG_NOSIGNAL
+#else
+#define WORKER_SEND_FLAGS	0
+#endif
+
+static void stack_insts_add(GPtrArray *insts, struct srd_decoder_inst *di)
+{
+	GSList *l;
+
+	g_ptr_array_add(insts, di);
+	for (l = di->next_di; l; l = l->next)
+		stack_insts_add(insts, l->data);
+}
+
+static int write_all(int fd, const void *buf, size_t len)
+{
+	const uint8_t *p;
+	ssize_t n;
+
+	p = buf;
+	while (len) {
+		n = send(fd, p, len, WORKER_SEND_FLAGS);
+		if (n < 0) {
+			if (errno == EINTR)
+				continue;
+			return SRD_ERR;
+		}
+		p += n;
+		len -= n;
+	}
+
+	return SRD_OK;
+}
+
+static int read_all(int fd, void *buf, size_t len)
+{
+	uint8_t *p;
+	ssize_t n;
+
+	p = buf;
+	while (len) {
+		n = read(fd, p, len);
+		if (n < 0 && errno == EINTR)
+			continue;
+		if (n <= 0)
+			return SRD_ERR;
+		p += n;
+		len -= n;
+	}
+
+	return SRD_OK;
+}
+
+static struct srd_worker *worker_new(void)
+{
+	struct srd_worker *w;
+
+	w = g_malloc0(sizeof(struct srd_worker));
+	w->insts = g_ptr_array_new();
+	w->replies = g_byte_array_new();
+	w->texts = g_ptr_array_new();
+
+	return w;
+}
+
+/*
+ * Check whether any session is decoding asynchronously. Its thread may
+ * hold locks which a forked worker would wait for forever.
+ */
+static gboolean async_decoding(void)
+{
+	struct srd_session *s;
+	GSList *l;
+	gboolean busy;
+
+	busy = FALSE;
+	for (l = sessions; l && !busy; l = l->next) {
+		s = l->data;
+		g_mutex_lock(&s->async_mutex);
+		busy = s->async_busy || !g_queue_is_empty(s->async_queue);
+		g_mutex_unlock(&s->async_mutex);
+	}
+
+	return busy;
+}
+
+static void worker_free(struct srd_worker *w)
+{
+	Py_XDECREF(w->py_dumps);
+	Py_XDECREF(w->py_loads);
+	g_ptr_array_free(w->insts, TRUE);
+	g_ptr_array_free(w->texts, TRUE);
+	g_byte_array_free(w->replies, TRUE);
+	g_free(w);
+}
+
+/* Close the connections to some workers, and wait for them to exit. */
+static void workers_free(GSList *workers)
+{
+	struct srd_worker *w;
+	GSList *l;
+
+	/* Workers exit once their socket is closed. */
+	for (l = workers; l; l = l->next) {
+		w = l->data;
+		close(w->fd);
+	}
+	for (l = workers; l; l = l->next) {
+		w = l->data;
+		while (waitpid(w->pid, NULL, 0) < 0 && errno == EINTR)
+			;
+		worker_free(w);
+	}
+	g_slist_free(workers);
+}
+
+/* Worker side: send whatever was collected to the frontend process. */
+static void worker_replies_send(struct srd_worker *w)
+{
+	if (write_all(w->fd, w->replies->data, w->replies->len) != SRD_OK)
+		_exit(1);
+	g_byte_array_set_size(w->replies, 0);
+}
+
+static void worker_reply_add(struct srd_worker *w,
+		const struct worker_reply *reply, const void *data)
+{
+	g_byte_array_append(w->replies, (const guint8 *)reply, sizeof(*reply));
+	if (reply->size)
+		g_byte_array_append(w->replies, data, reply->size);
+	if (w->replies->len >= WORKER_SEND_SIZE)
+		worker_replies_send(w);
+}
+
+static void worker_reply_done(struct srd_worker *w, int ret)
+{
+	struct worker_reply reply;
+
+	memset(&reply, 0, sizeof(reply));
+	reply.type = WORKER_REPLY_DONE;
+	reply.ret = ret;
+	worker_reply_add(w, &reply, NULL);
+	worker_replies_send(w);
+}
+
+/* Worker side: the only output callback, for all output types. */
+static void worker_output_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_worker *w;
+	struct worker_reply reply;
+	struct srd_proto_data_annotation *pda;
+	struct srd_proto_data_binary *pdb;
+	PyObject *py_bytes;
+	GVariant *gvar;
+	GString *texts;
+	gpointer data;
+	char *buf;
+	Py_ssize_t size;
+	guint i;
+
+	w = cb_data;
+	if (pdata->start_sample < w->drop_before)
+		return;
+
+	memset(&reply, 0, sizeof(reply));
+	reply.type = WORKER_REPLY_OUTPUT;
+	for (i = 0; i < w->insts->len; i++) {
+		if (g_ptr_array_index(w->insts, i) == pdata->pdo->di)
+			break;
+	}
+	reply.inst_idx = i;
+	reply.pdo_id = pdata->pdo->pdo_id;
+	reply.start_sample = pdata->start_sample;
+	reply.end_sample = pdata->end_sample;
+
+	switch (pdata->pdo->output_type) {
+	case SRD_OUTPUT_ANN:
+		pda = pdata->data;
+		reply.out_class = pda->ann_class;
+		texts = g_string_sized_new(64);
+		for (i = 0; pda->ann_text[i]; i++)
+			g_string_append_len(texts, pda->ann_text[i],
+					strlen(pda->ann_text[i]) + 1);
+		reply.num_texts = i;
+		reply.size = texts->len;
+		worker_reply_add(w, &reply, texts->str);
+		g_string_free(texts, TRUE);
+		break;
+	case SRD_OUTPUT_PYTHON:
+		py_bytes = PyObject_CallFunctionObjArgs(w->py_dumps,
+				pdata->data, NULL);
+		if (!py_bytes) {
+			srd_exception_catch("Failed to pickle output of %s",
+					pdata->pdo->di->inst_id);
+			break;
+		}
+		if (PyBytes_AsStringAndSize(py_bytes, &buf, &size) == 0) {
+			reply.size = size;
+			worker_reply_add(w, &reply, buf);
+		}
+		Py_DECREF(py_bytes);
+		break;
+	case SRD_OUTPUT_BINARY:
+		pdb = pdata->data;
+		reply.out_class = pdb->bin_class;
+		reply.size = pdb->size;
+		worker_reply_add(w, &reply, pdb->data);
+		break;
+	case SRD_OUTPUT_META:
+		gvar = pdata->data;
+		reply.size = g_variant_get_size(gvar);
+		data = g_malloc(reply.size);
+		g_variant_store(gvar, data);
+		worker_reply_add(w, &reply, data);
+		g_free(data);
+		break;
+	}
+}
+
+/* Worker side: the frontend process never sees our profiles, drop them. */
+static void profiles_drop(GSList *stack)
+{
+	struct srd_decoder_inst *di;
+	GSList *l;
+
+	for (l = stack; l; l = l->next) {
+		di = l->data;
+		Py_CLEAR(di->py_profile);
+		profiles_drop(di->next_di);
+	}
+}
+
+/*
+ * Worker side: send all output the frontend wants to the frontend
+ * process. We hold the GIL, which this process' only thread keeps.
+ */
+static void worker_init(struct srd_session *sess, struct srd_worker *w,
+		GSList *siblings)
+{
+	static const int output_types[] = {
+		SRD_OUTPUT_ANN, SRD_OUTPUT_BINARY, SRD_OUTPUT_META,
+	};
+	struct srd_session *s;
+	GSList *l, *m, *cbs;
+	unsigned int i;
+
+	/*
+	 * Only keep our own connection, so other workers notice when the
+	 * frontend process closes theirs.
+	 */
+	for (l = sessions; l; l = l->next) {
+		s = l->data;
+		for (m = s->workers; m; m = m->next)
+			close(((struct srd_worker *)m->data)->fd);
+	}
+	for (l = siblings; l; l = l->next)
+		close(((struct srd_worker *)l->data)->fd);
+
+	sess->workers = NULL;
+	sess->use_workers = FALSE;
+	profiles_drop(sess->di_list);
+
+	w->cb.cb = worker_output_cb;
+	w->cb.cb_data = w;
+	cbs = g_slist_append(NULL, &w->cb);
+	for (i = 0; i < G_N_ELEMENTS(output_types); i++) {
+		if (sess->output_callbacks[output_types[i]]
+				|| (output_types[i] == SRD_OUTPUT_ANN
+				&& sess->batch_cb))
+			sess->output_callbacks[output_types[i]] = cbs;
+	}
+	sess->batch_cb = NULL;
+}
+
+/* Worker side: serve commands until the frontend closes the socket. */
+static G_GNUC_NORETURN void worker_main(struct srd_session *sess,
+		struct srd_worker *w)
+{
+	struct worker_cmd cmd;
+	uint8_t *inbuf;
+	uint64_t inbuf_size;
+	int ret;
+
+	worker_init(sess, w, NULL);
+
+	/* From now on, this session only decodes our stack, in-process. */
+	sess->di_list = g_slist_append(NULL, w->di);
+
+	inbuf = NULL;
+	inbuf_size = 0;
+	while (read_all(w->fd, &cmd, sizeof(cmd)) == SRD_OK) {
+		switch (cmd.type) {
+		case WORKER_CMD_DECODE:
+			if (cmd.inbuflen > inbuf_size) {
+				inbuf = g_realloc(inbuf, cmd.inbuflen);
+				inbuf_size = cmd.inbuflen;
+			}
+			if (read_all(w->fd, inbuf, cmd.inbuflen) != SRD_OK)
+				_exit(1);
+			ret = srd_session_send(sess, cmd.start_samplenum,
+					cmd.end_samplenum, inbuf, cmd.inbuflen,
+					cmd.unitsize);
+			break;
+		case WORKER_CMD_META:
+			ret = srd_session_metadata_set(sess, cmd.key,
+					g_variant_new_uint64(cmd.value));
+			break;
+		default:
+			ret = SRD_ERR_BUG;
+			break;
+		}
+		worker_reply_done(w, ret);
+	}
+
+	/* Don't run the frontend's exit handlers or Python's finalization. */
+	_exit(0);
+}
+
+/*
+ * Fork a worker process, connected to this one by a socket. Sets
+ * 'child' in the worker process, which gets the other end of the socket.
+ */
+static int worker_fork(struct srd_worker *w, gboolean *child)
+{
+	pid_t pid;
+	int fds[2];
+#if !defined(MSG_NOSIGNAL) && defined(SO_NOSIGPIPE)
+	int one;
+#endif
+
+	*child = FALSE;
+	if (socketpair(AF_UNIX, SOCK_STREAM, 0, fds) < 0) {
+		srd_err("Failed to create worker socket: %s.",
+			g_strerror(errno));
+		return SRD_ERR;
+	}
+#if !defined(MSG_NOSIGNAL) && defined(SO_NOSIGPIPE)
+	one = 1;
+	setsockopt(fds[0], SOL_SOCKET, SO_NOSIGPIPE, &one, sizeof(one));
+	setsockopt(fds[1], SOL_SOCKET, SO_NOSIGPIPE, &one, sizeof(one));
+#endif
+
+	/* Python's own locks must be in a sane state in the worker. */
+#if PY_VERSION_HEX >= 0x03070000
+	PyOS_BeforeFork();
+#endif
+	pid = fork();
+#if PY_VERSION_HEX >= 0x03070000
+	if (pid == 0)
+		PyOS_AfterFork_Child();
+	else
+		PyOS_AfterFork_Parent();
+#else
+	if (pid == 0)
+		PyOS_AfterFork();
+#endif
+	if (pid < 0) {
+		srd_err("Failed to fork worker process: %s.",
+			g_strerror(errno));
+		close(fds[0]);
+		close(fds[1]);
+		return SRD_ERR;
+	}
+	if (pid == 0) {
+		close(fds[0]);
+		w->fd = fds[1];
+		*child = TRUE;
+		return SRD_OK;
+	}
+	close(fds[1]);
+	w->fd = fds[0];
+	w->pid = pid;
+
+	return SRD_OK;
+}
+
+/**
+ * Fork a worker process for each stack in a session, if the session is
+ * set up to use them.
+ *
+ * Must be called with the GIL held, after the instances were started.
+ * Falls back to decoding in-process where workers wouldn't help, or can't
+ * be used.
+ *
+ * @param sess The session.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_workers_start(struct srd_session *sess)
+{
+	struct srd_worker *w;
+	GSList *l;
+	gboolean child;
+
+	if (!sess->use_workers)
+		return SRD_OK;
+
+	if (g_slist_length(sess->di_list) < 2) {
+		srd_dbg("Session %d has only one stack, decoding in-process.",
+			sess->session_id);
+		return SRD_OK;
+	}
+	if (sess->output_callbacks[SRD_OUTPUT_PYTHON]) {
+		srd_warn("Python output can't be passed from worker "
+			"processes, session %d decodes in-process.",
+			sess->session_id);
+		return SRD_OK;
+	}
+	if (async_decoding()) {
+		srd_warn("Worker processes can't be forked while sessions "
+			"decode asynchronously, session %d decodes "
+			"in-process.", sess->session_id);
+		return SRD_OK;
+	}
+
+	srd_dbg("Starting %d worker processes for session %d.",
+		g_slist_length(sess->di_list), sess->session_id);
+
+	for (l = sess->di_list; l; l = l->next) {
+		w = worker_new();
+		w->di = l->data;
+		stack_insts_add(w->insts, w->di);
+		if (worker_fork(w, &child) != SRD_OK) {
+			worker_free(w);
+			srd_workers_stop(sess);
+			return SRD_ERR;
+		}
+		if (child)
+			worker_main(sess, w);
+		sess->workers = g_slist_append(sess->workers, w);
+	}
+
+	return SRD_OK;
+}
+
+/**
+ * Stop a session's worker processes, if any.
+ *
+ * @param sess The session.
+ *
+ * @private
+ */
+SRD_PRIV void srd_workers_stop(struct srd_session *sess)
+{
+	workers_free(sess->workers);
+	sess->workers = NULL;
+}
+
+/* Read what a worker replied so far, and check whether it is done. */
+static void worker_replies_read(struct srd_worker *w)
+{
+	struct worker_reply reply;
+	guint len;
+	ssize_t n;
+
+	len = w->replies->len;
+	g_byte_array_set_size(w->replies, len + WORKER_SEND_SIZE);
+	n = read(w->fd, w->replies->data + len, WORKER_SEND_SIZE);
+	g_byte_array_set_size(w->replies, len + MAX(n, 0));
+	if (n < 0 && errno == EINTR)
+		return;
+	if (n <= 0) {
+		srd_err("Worker process for %s exited unexpectedly.",
+			w->di->inst_id);
+		w->done = TRUE;
+		w->ret = SRD_ERR;
+		return;
+	}
+
+	while (w->replies->len - w->parsed >= sizeof(reply)) {
+		memcpy(&reply, w->replies->data + w->parsed, sizeof(reply));
+		if (w->replies->len - w->parsed < sizeof(reply) + reply.size)
+			break;
+		w->parsed += sizeof(reply) + reply.size;
+		if (reply.type == WORKER_REPLY_DONE) {
+			w->done = TRUE;
+			w->ret = reply.ret;
+		}
+	}
+}
+
+/*
+ * Wait until the workers which aren't done or paused yet replied
+ * something, and read it. Returns FALSE if none of them is left.
+ */
+static gboolean workers_poll(GSList *workers)
+{
+	struct srd_worker *w, **pending;
+	struct pollfd *fds;
+	GSList *l;
+	int num_pending, i;
+
+	num_pending = 0;
+	for (l = workers; l; l = l->next) {
+		w = l->data;
+		if (!w->done && !w->paused)
+			num_pending++;
+	}
+	if (!num_pending)
+		return FALSE;
+
+	fds = g_malloc(num_pending * sizeof(struct pollfd));
+	pending = g_malloc(num_pending * sizeof(struct srd_worker *));
+	i = 0;
+	for (l = workers; l; l = l->next) {
+		w = l->data;
+		if (w->done || w->paused)
+			continue;
+		fds[i].fd = w->fd;
+		fds[i].events = POLLIN;
+		pending[i++] = w;
+	}
+
+	if (poll(fds, num_pending, -1) < 0) {
+		if (errno != EINTR) {
+			srd_err("Failed to wait for worker processes: %s.",
+				g_strerror(errno));
+			for (i = 0; i < num_pending; i++) {
+				pending[i]->done = TRUE;
+				pending[i]->ret = SRD_ERR;
+			}
+		}
+	} else {
+		for (i = 0; i < num_pending; i++) {
+			if (fds[i].revents)
+				worker_replies_read(pending[i]);
+		}
+	}
+	g_free(pending);
+	g_free(fds);
+
+	return TRUE;
+}
+
+/* Pass a command to all workers, and wait until all of them are done. */
+static void workers_command(struct srd_session *sess,
+		const struct worker_cmd *cmd, const uint8_t *data)
+{
+	struct srd_worker *w;
+	GSList *l;
+
+	for (l = sess->workers; l; l = l->next) {
+		w = l->data;
+		g_byte_array_set_size(w->replies, 0);
+		w->parsed = 0;
+		w->done = FALSE;
+		w->ret = SRD_OK;
+		if (write_all(w->fd, cmd, sizeof(*cmd)) != SRD_OK
+				|| (cmd->type == WORKER_CMD_DECODE
+				&& write_all(w->fd, data, cmd->inbuflen) != SRD_OK)) {
+			srd_err("Failed to pass data to worker process for "
+				"%s.", w->di->inst_id);
+			w->done = TRUE;
+			w->ret = SRD_ERR;
+		}
+	}
+
+	/* Workers decode at the same time, collect their replies as they come. */
+	while (workers_poll(sess->workers))
+		;
+}
+
+/* Pass one output received from a worker to the frontend. */
+static void worker_output_dispatch(struct srd_session *sess,
+		struct srd_worker *w, const struct worker_reply *reply,
+		const uint8_t *data)
+{
+	struct srd_decoder_inst *di;
+	struct srd_proto_data pdata;
+	struct srd_proto_data_annotation pda;
+	struct srd_proto_data_binary pdb;
+	PyObject *py_bytes;
+	const char *text;
+	GSList *cbs;
+	gpointer buf;
+	guint text_idx, i;
+
+	di = NULL;
+	if (reply->inst_idx < w->insts->len)
+		di = g_ptr_array_index(w->insts, reply->inst_idx);
+	if (!di || !di->pd_output_table || reply->pdo_id < 0
+			|| (guint)reply->pdo_id >= di->pd_output_table->len) {
+		srd_err("Worker process for %s submitted unknown output %d.",
+			w->di->inst_id, reply->pdo_id);
+		return;
+	}
+
+	pdata.start_sample = reply->start_sample;
+	pdata.end_sample = reply->end_sample;
+	pdata.pdo = g_ptr_array_index(di->pd_output_table, reply->pdo_id);
+	pdata.data = NULL;
+	cbs = srd_pd_output_callbacks_get(sess, pdata.pdo->output_type);
+
+	switch (pdata.pdo->output_type) {
+	case SRD_OUTPUT_ANN:
+		g_ptr_array_set_size(w->texts, 0);
+		text = (const char *)data;
+		for (i = 0; i < reply->num_texts; i++) {
+			g_ptr_array_add(w->texts, (gpointer)text);
+			text += strlen(text) + 1;
+		}
+		g_ptr_array_add(w->texts, NULL);
+		pda.ann_class = reply->out_class;
+		pda.ann_text = (char **)w->texts->pdata;
+		pdata.data = &pda;
+		if (cbs)
+			srd_pd_output_callbacks_send(cbs, &pdata);
+		if (sess->batch_cb) {
+			text_idx = sess->batch_texts->len;
+			for (i = 0; i < reply->num_texts; i++)
+				g_ptr_array_add(sess->batch_texts,
+					g_string_chunk_insert(sess->batch_strings,
+					g_ptr_array_index(w->texts, i)));
+			g_ptr_array_add(sess->batch_texts, NULL);
+			srd_pd_output_batch_add(sess, &pdata, pda.ann_class,
+					text_idx);
+		}
+		break;
+	case SRD_OUTPUT_PYTHON:
+		py_bytes = PyBytes_FromStringAndSize((const char *)data,
+				reply->size);
+		if (py_bytes) {
+			pdata.data = PyObject_CallFunctionObjArgs(w->py_loads,
+					py_bytes, NULL);
+			Py_DECREF(py_bytes);
+		}
+		if (!pdata.data) {
+			srd_exception_catch("Failed to unpickle output of %s",
+					di->inst_id);
+			break;
+		}
+		srd_pd_output_python_send(&pdata);
+		Py_DECREF((PyObject *)pdata.data);
+		break;
+	case SRD_OUTPUT_BINARY:
+		if (!cbs)
+			break;
+		pdb.bin_class = reply->out_class;
+		pdb.size = reply->size;
+		pdb.data = data;
+		pdata.data = &pdb;
+		srd_pd_output_callbacks_send(cbs, &pdata);
+		break;
+	case SRD_OUTPUT_META:
+		if (!cbs)
+			break;
+		/* GVariant wants its data aligned, so it gets its own copy. */
+		buf = g_malloc(reply->size);
+		memcpy(buf, data, reply->size);
+		pdata.data = g_variant_ref_sink(g_variant_new_from_data(
+				pdata.pdo->meta_type, buf, reply->size, TRUE,
+				g_free, buf));
+		srd_pd_output_callbacks_send(cbs, &pdata);
+		g_variant_unref(pdata.data);
+		break;
+	}
+}
+
+/* Pass a worker's output to the frontend, and return its result. */
+static int worker_dispatch(struct srd_session *sess, struct srd_worker *w)
+{
+	struct worker_reply reply;
+	guint pos;
+
+	for (pos = 0; pos < w->parsed; pos += sizeof(reply) + reply.size) {
+		memcpy(&reply, w->replies->data + pos, sizeof(reply));
+		if (reply.type == WORKER_REPLY_OUTPUT)
+			worker_output_dispatch(sess, w, &reply,
+				w->replies->data + pos + sizeof(reply));
+	}
+
+	return w->ret;
+}
+
+/*
+ * Pass the workers' output to the frontend, stack by stack. Returns the
+ * first error the workers reported, if any.
+ */
+static int workers_dispatch(struct srd_session *sess)
+{
+	GSList *l;
+	int ret, r;
+
+	ret = SRD_OK;
+	for (l = sess->workers; l; l = l->next) {
+		r = worker_dispatch(sess, l->data);
+		if (ret == SRD_OK)
+			ret = r;
+	}
+
+	return ret;
+}
+
+/**
+ * Decode a chunk of samples in all of a session's worker processes.
+ *
+ * Must be called with the GIL held. It is released while the workers
+ * decode.
+ *
+ * @private
+ */
+SRD_PRIV int srd_workers_send(struct srd_session *sess,
+		uint64_t start_samplenum, uint64_t end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	struct worker_cmd cmd;
+
+	memset(&cmd, 0, sizeof(cmd));
+	cmd.type = WORKER_CMD_DECODE;
+	cmd.start_samplenum = start_samplenum;
+	cmd.end_samplenum = end_samplenum;
+	cmd.inbuflen = inbuflen;
+	cmd.unitsize = unitsize;
+
+	Py_BEGIN_ALLOW_THREADS
+	workers_command(sess, &cmd, inbuf);
+	Py_END_ALLOW_THREADS
+
+	return workers_dispatch(sess);
+}
+
+/**
+ * Pass a metadata value to all of a session's worker processes.
+ *
+ * Must be called with the GIL held.
+ *
+ * @private
+ */
+SRD_PRIV int srd_workers_metadata_set(struct srd_session *sess, int key,
+		uint64_t value)
+{
+	struct worker_cmd cmd;
+
+	memset(&cmd, 0, sizeof(cmd));
+	cmd.type = WORKER_CMD_META;
+	cmd.key = key;
+	cmd.value = value;
+
+	Py_BEGIN_ALLOW_THREADS
+	workers_command(sess, &cmd, NULL);
+	Py_END_ALLOW_THREADS
+
+	return workers_dispatch(sess);
+}
+
+static void resync_cond_free(struct resync_cond *cond)
+{
+	g_free(cond->byte_offsets);
+	g_free(cond->bit_masks);
+	g_free(cond->levels);
+	g_free(cond);
+}
+
+/*
+ * Ask a PD when it is back in its initial state. Returns NULL if it
+ * can't tell.
+ */
+static struct resync_cond *resync_cond_get(struct srd_decoder_inst *di,
+		uint64_t unitsize)
+{
+	struct resync_cond *cond;
+	PyObject *py_res, *py_levels, *py_level;
+	long level;
+	int i;
+
+	if (!PyObject_HasAttrString(di->py_inst, "resync"))
+		return NULL;
+	if (!(py_res = PyObject_CallMethod(di->py_inst, "resync", NULL))) {
+		srd_exception_catch("Calling %s resync() failed", di->inst_id);
+		return NULL;
+	}
+	if (py_res == Py_None) {
+		Py_DECREF(py_res);
+		return NULL;
+	}
+
+	cond = NULL;
+	if (!PyTuple_Check(py_res) || PyTuple_Size(py_res) != 2
+			|| !PyLong_Check(PyTuple_GetItem(py_res, 0))) {
+		srd_err("Protocol decoder %s resync() didn't return a "
+			"(num_samples, levels) tuple.", di->decoder->name);
+		goto err_out;
+	}
+	py_levels = PyTuple_GetItem(py_res, 1);
+	if (!PySequence_Check(py_levels)
+			|| PySequence_Size(py_levels) != di->dec_num_channels) {
+		srd_err("Protocol decoder %s resync() didn't return a level "
+			"for each channel.", di->decoder->name);
+		goto err_out;
+	}
+
+	cond = g_malloc0(sizeof(struct resync_cond));
+	cond->num_samples = PyLong_AsUnsignedLongLong(PyTuple_GetItem(py_res, 0));
+	if (PyErr_Occurred()) {
+		srd_exception_catch("Protocol decoder %s resync() returned "
+				"an invalid number of samples",
+				di->decoder->name);
+		goto err_out;
+	}
+	cond->byte_offsets = g_malloc(di->dec_num_channels * sizeof(int));
+	cond->bit_masks = g_malloc(di->dec_num_channels);
+	cond->levels = g_malloc(di->dec_num_channels * sizeof(int));
+	for (i = 0; i < di->dec_num_channels; i++) {
+		py_level = PySequence_GetItem(py_levels, i);
+		level = py_level == Py_None ? -1 : PyLong_AsLong(py_level);
+		Py_XDECREF(py_level);
+		if (PyErr_Occurred() || level < -1 || level > 1) {
+			PyErr_Clear();
+			srd_err("Protocol decoder %s resync() returned an "
+				"invalid level for channel %d.",
+				di->decoder->name, i);
+			goto err_out;
+		}
+		/* Channels the frontend doesn't provide don't matter. */
+		if (di->channel_byte_offsets[i] == -1
+				|| (uint64_t)di->channel_byte_offsets[i] >= unitsize)
+			continue;
+		cond->byte_offsets[cond->num_channels] = di->channel_byte_offsets[i];
+		cond->bit_masks[cond->num_channels] = di->channel_bit_masks[i];
+		cond->levels[cond->num_channels] = level;
+		cond->num_channels++;
+	}
+	Py_DECREF(py_res);
+
+	return cond;
+
+err_out:
+	if (cond)
+		resync_cond_free(cond);
+	Py_DECREF(py_res);
+
+	return NULL;
+}
+
+/*
+ * Find the first sample at or after 'from' where the capture can be
+ * split, i.e. where the resync conditions of all PDs were met by the
+ * samples right before it. Returns num_samples if there is none.
+ */
+static uint64_t resync_find(GPtrArray *conds, const uint8_t *inbuf,
+		uint64_t num_samples, uint64_t unitsize, uint64_t from,
+		uint64_t warmup)
+{
+	struct resync_cond *cond;
+	const uint8_t *sample;
+	uint64_t *last_bad, s;
+	uint8_t cur, prev;
+	gboolean in_sync;
+	guint i;
+	int c;
+
+	/* The last sample where each PD's channels changed, or were wrong. */
+	s = from > warmup ? from - warmup : 1;
+	last_bad = g_malloc(conds->len * sizeof(uint64_t));
+	for (i = 0; i < conds->len; i++)
+		last_bad[i] = s - 1;
+
+	for (; s < num_samples; s++) {
+		sample = inbuf + s * unitsize;
+		in_sync = s + 1 >= from;
+		for (i = 0; i < conds->len; i++) {
+			cond = g_ptr_array_index(conds, i);
+			for (c = 0; c < cond->num_channels; c++) {
+				cur = sample[cond->byte_offsets[c]]
+						& cond->bit_masks[c];
+				prev = (sample - unitsize)[cond->byte_offsets[c]]
+						& cond->bit_masks[c];
+				if (cur != prev || (cond->levels[c] != -1
+						&& (cur != 0) != cond->levels[c]))
+					last_bad[i] = s;
+			}
+			if (s - last_bad[i] < cond->num_samples)
+				in_sync = FALSE;
+		}
+		if (in_sync)
+			break;
+	}
+	g_free(last_bad);
+
+	/* Split right after the sample which completed the conditions. */
+	return s < num_samples ? s + 1 : num_samples;
+}
+
+/* Segment worker side: decode our segment, then exit. */
+static G_GNUC_NORETURN void segment_main(struct srd_session *sess,
+		struct srd_worker *w, GSList *siblings,
+		uint64_t start_samplenum, const uint8_t *inbuf,
+		uint64_t unitsize)
+{
+	struct srd_decoder_inst *di;
+	GSList *l;
+	int ret;
+
+	worker_init(sess, w, siblings);
+
+	/* The stacked instances run in the frontend process. */
+	if (w->py_dumps)
+		sess->output_callbacks[SRD_OUTPUT_PYTHON] =
+				g_slist_append(NULL, &w->cb);
+	for (l = sess->di_list; l; l = l->next) {
+		di = l->data;
+		di->next_di = NULL;
+		/* The segment doesn't continue where the last chunk ended. */
+		di->last_sample_valid = FALSE;
+		di->seek_samplenum = 0;
+		di->seek_edge = 0;
+	}
+
+	ret = srd_session_send(sess, start_samplenum + w->warmup_start,
+			start_samplenum + w->seg_end,
+			inbuf + w->warmup_start * unitsize,
+			(w->seg_end - w->warmup_start) * unitsize, unitsize);
+	worker_reply_done(w, ret);
+
+	_exit(0);
+}
+
+/**
+ * Decode a capture in segments, each one in a worker process of its own.
+ * See srd_session_send_segmented().
+ *
+ * Must be called with the GIL held. It is released while the workers
+ * decode.
+ *
+ * @param segmented Set to TRUE if the capture was decoded in segments.
+ *                  Otherwise, it must be decoded in-process.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_segments_send(struct srd_session *sess,
+		uint64_t start_samplenum, const uint8_t *inbuf,
+		uint64_t inbuflen, uint64_t unitsize,
+		unsigned int max_segments, gboolean *segmented)
+{
+	struct srd_worker *w;
+	struct srd_decoder_inst *di;
+	struct resync_cond *cond;
+	GPtrArray *conds;
+	GArray *splits;
+	GSList *l, *segs, *next;
+	PyObject *py_pickle;
+	uint64_t num_samples, warmup, split, prev;
+	gboolean want_python, child;
+	unsigned int i;
+	long num_cpus;
+	int ret, r;
+
+	*segmented = FALSE;
+	if (sess->workers || !sess->di_list)
+		return SRD_OK;
+	if (async_decoding()) {
+		srd_dbg("Sessions decode asynchronously, decoding "
+			"in-process.");
+		return SRD_OK;
+	}
+
+	if (!max_segments) {
+		num_cpus = sysconf(_SC_NPROCESSORS_ONLN);
+		max_segments = num_cpus > 0 ? num_cpus : 1;
+	}
+	num_samples = inbuflen / unitsize;
+	if (max_segments < 2 || num_samples < max_segments)
+		return SRD_OK;
+
+	/* Every bottom-level PD must be able to tell where it resyncs. */
+	conds = g_ptr_array_new_with_free_func((GDestroyNotify)resync_cond_free);
+	warmup = 0;
+	want_python = sess->output_callbacks[SRD_OUTPUT_PYTHON] != NULL;
+	for (l = sess->di_list; l; l = l->next) {
+		di = l->data;
+		if (!di->channel_byte_offsets
+				|| !(cond = resync_cond_get(di, unitsize))) {
+			srd_dbg("Instance %s can't resync, decoding "
+				"in-process.", di->inst_id);
+			g_ptr_array_free(conds, TRUE);
+			return SRD_OK;
+		}
+		g_ptr_array_add(conds, cond);
+		warmup = MAX(warmup, cond->num_samples);
+		if (di->next_di)
+			want_python = TRUE;
+	}
+
+	/* Split as evenly as the resync points allow. */
+	splits = g_array_new(FALSE, FALSE, sizeof(uint64_t));
+	prev = 0;
+	for (i = 1; i < max_segments; i++) {
+		split = resync_find(conds, inbuf, num_samples, unitsize,
+				MAX(num_samples / max_segments * i, prev + 1),
+				warmup);
+		if (split >= num_samples)
+			break;
+		g_array_append_val(splits, split);
+		prev = split;
+	}
+	g_ptr_array_free(conds, TRUE);
+	if (!splits->len) {
+		srd_dbg("No resync points found, decoding in-process.");
+		g_array_free(splits, TRUE);
+		return SRD_OK;
+	}
+
+	py_pickle = NULL;
+	if (want_python && !(py_pickle = PyImport_ImportModule("pickle"))) {
+		srd_exception_catch("Failed to import pickle");
+		g_array_free(splits, TRUE);
+		return SRD_ERR_PYTHON;
+	}
+
+	srd_dbg("Decoding %" PRIu64 " samples in %u segments.", num_samples,
+		splits->len + 1);
+
+	/* Workers inherit the sample data, it doesn't need to be sent. */
+	ret = SRD_OK;
+	segs = NULL;
+	for (i = 0; i <= splits->len; i++) {
+		w = worker_new();
+		w->di = sess->di_list->data;
+		for (l = sess->di_list; l; l = l->next)
+			g_ptr_array_add(w->insts, l->data);
+		w->seg_start = i ? g_array_index(splits, uint64_t, i - 1) : 0;
+		w->seg_end = i < splits->len ?
+				g_array_index(splits, uint64_t, i) : num_samples;
+		w->warmup_start = w->seg_start > warmup ?
+				w->seg_start - warmup : 0;
+		w->drop_before = i ? start_samplenum + w->seg_start : 0;
+		if (py_pickle) {
+			w->py_dumps = PyObject_GetAttrString(py_pickle, "dumps");
+			w->py_loads = PyObject_GetAttrString(py_pickle, "loads");
+		}
+		if ((ret = worker_fork(w, &child)) != SRD_OK) {
+			worker_free(w);
+			break;
+		}
+		if (child)
+			segment_main(sess, w, segs, start_samplenum, inbuf,
+					unitsize);
+		segs = g_slist_append(segs, w);
+	}
+	g_array_free(splits, TRUE);
+	Py_XDECREF(py_pickle);
+
+	if (ret != SRD_OK) {
+		/* None of the output was passed on yet, so start over. */
+		for (l = segs; l; l = l->next)
+			kill(((struct srd_worker *)l->data)->pid, SIGKILL);
+		workers_free(segs);
+		srd_warn("Not all segments could be started, decoding "
+			"in-process.");
+		return SRD_OK;
+	}
+	*segmented = TRUE;
+
+	/*
+	 * Pass on each segment's output in order. The first segment which
+	 * isn't done yet passes its output on as it comes. The ones after it
+	 * buffer only so much of theirs, then they wait for their turn.
+	 */
+	next = segs;
+	while (next) {
+		for (l = next; l; l = l->next) {
+			w = l->data;
+			w->paused = l != next
+					&& w->replies->len >= SEGMENT_BUFFER_SIZE;
+		}
+		Py_BEGIN_ALLOW_THREADS
+		workers_poll(next);
+		Py_END_ALLOW_THREADS
+		while (next) {
+			w = next->data;
+			r = worker_dispatch(sess, w);
+			/* The output which was passed on isn't needed anymore. */
+			if (w->parsed)
+				g_byte_array_remove_range(w->replies, 0,
+						w->parsed);
+			w->parsed = 0;
+			if (!w->done)
+				break;
+			if (ret == SRD_OK)
+				ret = r;
+			next = next->next;
+		}
+	}
+	workers_free(segs);
+
+	return ret;
+}
+
+#else
+
+SRD_PRIV int srd_workers_start(struct srd_session *sess)
+{
+	if (sess->use_workers)
+		srd_warn("Worker processes are not supported on this "
+			"platform, session %d decodes in-process.",
+			sess->session_id);
+
+	return SRD_OK;
+}
+
+SRD_PRIV void srd_workers_stop(struct srd_session *sess)
+{
+	(void)sess;
+}
+
+SRD_PRIV int srd_workers_send(struct srd_session *sess,
+		uint64_t start_samplenum, uint64_t end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	(void)sess;
+	(void)start_samplenum;
+	(void)end_samplenum;
+	(void)inbuf;
+	(void)inbuflen;
+	(void)unitsize;
+
+	return SRD_ERR_BUG;
+}
+
+SRD_PRIV int srd_workers_metadata_set(struct srd_session *sess, int key,
+		uint64_t value)
+{
+	(void)sess;
+	(void)key;
+	(void)value;
+
+	return SRD_ERR_BUG;
+}
+
+SRD_PRIV int srd_segments_send(struct srd_session *sess,
+		uint64_t start_samplenum, const uint8_t *inbuf,
+		uint64_t inbuflen, uint64_t unitsize,
+		unsigned int max_segments, gboolean *segmented)
+{
+	(void)sess;
+	(void)start_samplenum;
+	(void)inbuf;
+	(void)inbuflen;
+	(void)unitsize;
+	(void)max_segments;
+
+	*segmented = FALSE;
+
+	return SRD_OK;
+}
+
+#endif